@@ -0,0 +1,113 @@
+import os
+import re
+import sys
+import subprocess
+
+"""
+Compiler launcher for split config headers (see "Config Headers" in the settings)
+Runs the compiler, then rewrites the dependency file it generated (-MF) so the
+ object depends on the config/<SYMBOL>.h stamp of each CONFIG_ symbol its
+ sources use, instead of on the whole autogen.h. Those stamps are only
+ rewritten when their symbol changes, so changing one option only rebuilds
+ the code that uses it (same as Linux's fixdep)
+
+Usage: config_fixdep.py <autogen.h> <stamps folder> <compiler> [compiler arguments...]
+Kept to the standard library: it runs once per compiled file
+"""
+
+CONFIG_SYMBOL_RE = re.compile(rb"CONFIG_([A-Za-z0-9_]+)")
+DEPENDENCY_RE    = re.compile(r"(?:\\.|[^\s\\])+")
+
+def GetDependencyFile(arguments):
+    for index, argument in enumerate(arguments):
+        if argument == "-MF" and index + 1 < len(arguments):
+            return arguments[index + 1]
+        if argument.startswith("-MF") and len(argument) > 3:
+            return argument[3:]
+    return None
+
+def ParseRules(contents):
+    rules = []
+    for line in contents.replace("\\\n", " ").splitlines():
+        target, separator, dependencies = line.partition(": ")
+        if separator == "":
+            if line.rstrip().endswith(":"):
+                rules.append((line.rstrip()[:-1], []))
+            continue
+        dependencies = [re.sub(r"\\(.)", r"\1", dependency) for dependency in DEPENDENCY_RE.findall(dependencies)]
+        rules.append((target, dependencies))
+    return rules
+
+def Escape(path):
+    return path.replace(" ", "\\ ")
+
+def GetUsedSymbols(paths):
+    symbols = set()
+    for path in paths:
+        try:
+            with open(path, "rb") as file:
+                symbols.update(CONFIG_SYMBOL_RE.findall(file.read()))
+        except OSError:
+            continue
+    return symbols
+
+"""
+Stamp of symbol, created as "not configured" if the configuration has no such
+ symbol (yet), so that the object is rebuilt once the symbol is added
+"""
+def GetStamp(stamps_folder, symbol):
+    stamp = os.path.join(stamps_folder, symbol + ".h")
+    if os.path.isfile(stamp):
+        return stamp
+
+    os.makedirs(stamps_folder, exist_ok=True)
+    try:
+        # Other compilations may be creating it too
+        with open(stamp, "x") as file:
+            # Same contents GenerateConfigStamps writes for symbols that are not configured
+            file.write(f"/* CONFIG_{symbol} is not configured */\n")
+    except FileExistsError:
+        return stamp
+    # Older than the object being built, it only has to be newer once the symbol is configured
+    os.utime(stamp, (0, 0))
+    return stamp
+
+def FixDependencies(dependency_file, autogen_header, stamps_folder):
+    try:
+        with open(dependency_file, "r") as file:
+            rules = ParseRules(file.read())
+    except (OSError, UnicodeDecodeError):
+        return
+    if len(rules) == 0:
+        return
+
+    target, dependencies = rules[0]
+    autogen_header = os.path.realpath(autogen_header)
+    kept = [dependency for dependency in dependencies if os.path.realpath(dependency) != autogen_header]
+    if len(kept) == len(dependencies):
+        # Does not include the config header
+        return
+
+    stamps = [GetStamp(stamps_folder, symbol.decode()) for symbol in sorted(GetUsedSymbols(kept))]
+
+    lines = [f"{target}: " + " \\\n  ".join(Escape(dependency) for dependency in kept + stamps)]
+    for other_target, other_dependencies in rules[1:]:
+        lines.append(f"{other_target}: " + " ".join(Escape(dependency) for dependency in other_dependencies))
+
+    temporary_file = f"{dependency_file}.{os.getpid()}.tmp"
+    with open(temporary_file, "w") as file:
+        file.write("\n".join(lines) + "\n")
+    os.replace(temporary_file, dependency_file)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(f"Usage: {sys.argv[0]} <autogen.h> <stamps folder> <compiler> [compiler arguments...]", file=sys.stderr)
+        sys.exit(2)
+
+    _, autogen_header, stamps_folder, *compiler_command = sys.argv
+    returned = subprocess.run(compiler_command)
+    if returned.returncode == 0:
+        dependency_file = GetDependencyFile(compiler_command)
+        if dependency_file is not None:
+            FixDependencies(dependency_file, autogen_header, stamps_folder)
+    sys.exit(returned.returncode)
@@ -317,6 +317,24 @@ def UserYesNoChoice(choice, default_no = False):
 """
 Copy some script over and replace variables
 """
+"""
+Write contents to path, unless the file already has those exact contents
+Keeps the modification time of generated files that did not change, so build
+ systems don't consider them (or whatever depends on them) out of date
+Returns whether the file was written
+"""
+def WriteIfChanged(path, contents):
+    try:
+        with open(path, 'r') as f:
+            if f.read() == contents:
+                return False
+    except (OSError, UnicodeDecodeError):
+        pass
+
+    with open(path, 'w') as f:
+        f.write(contents)
+    return True
+
 def SetupScript(script_file, target_file, variable_substitutions={}):
     logging.debug(f"Setting up script {script_file}")
 
@@ -337,8 +355,7 @@ def SetupScript(script_file, target_file, variable_substitutions={}):
         whole_script = whole_script.replace("$$"+variable_name+"$$", variable_substitutions[variable_name])
 
     # Write script back
-    with open(target_file, 'w') as f:
-        f.write(whole_script)
+    return WriteIfChanged(target_file, whole_script)
 
 
 # Sets up a script according to its template and the target variable substitutions
@@ -346,7 +363,7 @@ def SetupTemplate(template_name, target_file, variable_substitutions={}):
     project_base_paths = GetBasePaths()
 
     # Var replace and copy it over to the correct place
-    SetupScript(f"{project_base_paths["templates"]}/{template_name}", target_file, variable_substitutions)
+    return SetupScript(f"{project_base_paths["templates"]}/{template_name}", target_file, variable_substitutions)
 
 """
 If obj is string, returns it
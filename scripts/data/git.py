@@ -1,8 +1,10 @@
 import os
 import re
+from dataclasses import dataclass, field
 
 from data.common import GetNow
 from processes.filesystem import GetCurrentFolderName, JoinPaths
+from processes.git_reader import IsBareGitDir
 
 def GenerateLocalBranchName(branch):
     now = GetNow().replace(" ", "_").replace(":","_").replace(".","_").replace("-","_")
@@ -128,10 +130,10 @@ def SameBranch(branch1, branch2):
     return real_branch1 == real_branch2
 
 """
-Current folder ends in .git (weak way to check)
+Current folder ends in .git (weak way to check), or is laid out as a bare git
 """
 def FolderIsBareGit(path):
-    return GetCurrentFolderName(path).endswith(".git")
+    return GetCurrentFolderName(path).endswith(".git") or IsBareGitDir(path)
 
 """
 Current folder has a .git file
@@ -168,22 +170,86 @@ def CheckStatusConflict(status):
     return "both added" in ret
 
 
-def CheckIfStatusIsClean(status):
-    return "nothing to commit, working tree clean" in status
-
-def CheckIfStatusIsDiverged(status):
-    return "have diverged" in status
-
-def CheckIfStatusIsAhead(status):
-    return "branch is ahead" in status
-
-def CheckIfStatusIsBehind(status):
-    return "branch is behind" in status
-
-def CheckIfStatusIsUpToDate(status):
-    return "up to date" in status
+"""
+State of a repository, from `git status --porcelain=v2 --branch -z` (see ParsePorcelainStatus)
+Paths are relative to the repository. untracked is only filled when it was
+ asked for (untracked_checked)
+"""
+@dataclass
+class RepoStatus:
+    branch: str = None          # None when detached
+    commit: str = None          # None before the first commit
+    upstream: str = None        # None when there is no upstream
+    ahead: int = 0
+    behind: int = 0
+    staged: list = field(default_factory=list)
+    unstaged: list = field(default_factory=list)
+    untracked: list = field(default_factory=list)
+    conflicted: list = field(default_factory=list)
+    untracked_checked: bool = True
+
+    def IsClean(self):
+        return len(self.staged) == 0 and len(self.unstaged) == 0 and len(self.untracked) == 0 and len(self.conflicted) == 0
+
+    def IsDiverged(self):
+        return self.ahead != 0 and self.behind != 0
+
+    def IsAhead(self):
+        return self.ahead != 0 and self.behind == 0
+
+    def IsBehind(self):
+        return self.behind != 0 and self.ahead == 0
+
+    # Same as its upstream (there is nothing to be up to date with without one)
+    def IsUpToDate(self):
+        return self.upstream is not None and self.ahead == 0 and self.behind == 0
+
+    def Describe(self):
+        lines = []
+        for title, paths in [("Conflicted", self.conflicted), ("Staged", self.staged), ("Not staged", self.unstaged), ("Untracked", self.untracked)]:
+            if len(paths) != 0:
+                lines.append(f"{title}:")
+                lines += [f"\t{path}" for path in paths]
+        return "\n".join(lines)
 
-def RepoIsClean(path):
-    return CheckIfStatusIsClean(GetRepoStatus(path))
+"""
+Parse the output of `git status --porcelain=v2 --branch -z`: NUL terminated
+ "# branch.<key> <value>" headers, then one record per changed path
+ (renames and copies are followed by an extra record with the original path)
+"""
+def ParsePorcelainStatus(output, untracked_checked=True):
+    status = RepoStatus(untracked_checked=untracked_checked)
+    records = output.split("\0")
+    index = 0
+    while index < len(records):
+        record = records[index]
+        index += 1
+        if record.startswith("# branch.oid "):
+            commit = record[len("# branch.oid "):]
+            status.commit = None if commit == "(initial)" else commit
+        elif record.startswith("# branch.head "):
+            branch = record[len("# branch.head "):]
+            status.branch = None if branch == "(detached)" else branch
+        elif record.startswith("# branch.upstream "):
+            status.upstream = record[len("# branch.upstream "):]
+        elif record.startswith("# branch.ab "):
+            ahead, behind = record[len("# branch.ab "):].split(" ")
+            status.ahead  = int(ahead)
+            status.behind = -int(behind)
+        elif record.startswith("1 ") or record.startswith("2 "):
+            fields = record.split(" ", 9 if record[0] == "2" else 8)
+            changes, path = fields[1], fields[-1]
+            if record[0] == "2":
+                # Original path of the rename/copy
+                index += 1
+            if changes[0] != ".":
+                status.staged.append(path)
+            if changes[1] != ".":
+                status.unstaged.append(path)
+        elif record.startswith("u "):
+            status.conflicted.append(record.split(" ", 10)[-1])
+        elif record.startswith("? "):
+            status.untracked.append(record[2:])
+    return status
 
 
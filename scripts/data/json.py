@@ -40,3 +40,12 @@ def load_json_file(path, error_value=None, variable_substitutions={}):
 def dump_json_file(json_data, path):
     with open(path, 'w') as file:
         json.dump(json_data, file, indent=4)
+
+"""
+Write the json to a temporary file and move it into place, so readers never
+ see a partially written file
+"""
+def dump_json_file_atomic(json_data, path):
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    dump_json_file(json_data, temporary_path)
+    os.replace(temporary_path, path)
@@ -19,7 +19,12 @@ DEFAULT_SETTINGS = {
     "Mode":       "Debug",
     "Clone Type": CLONE_TYPE.SSH.value,
     "Log Level":  "Error",
-    "Threading":  "Multi"
+    "Threading":  "Multi",
+    # 0 follows the amount of CPUs
+    "Max Threads": 0,
+    # "Split" also generates a stamp header per CONFIG_ symbol, so changing an
+    #  option only rebuilds the code that uses it
+    "Config Headers": "Single"
 }
 
 LOG_LEVEL_OPTIONS = ["Error", "Warning", "Notice", "Info"]
@@ -79,6 +84,36 @@ def ToggleThreading():
         Settings["single thread"] = (Settings["active"]["Threading"] == "Single")
         Settings.save_persisted_settings()
 
+def IsSplitConfigHeaders():
+    return Settings.get("active", {}).get("Config Headers", "Single") == "Split"
+
+def ToggleConfigHeaders():
+    if IsSplitConfigHeaders():
+        Settings["active"]["Config Headers"] = "Single"
+    else:
+        Settings["active"]["Config Headers"] = "Split"
+    Settings.save_persisted_settings()
+
+"""
+Maximum amount of threads PB runs work in at the same time
+The -j/--jobs command line argument overrides the persisted setting, and 0
+ (the default) follows the amount of CPUs
+"""
+def GetMaxThreads():
+    max_threads = Settings.get("max threads")
+    if max_threads is None:
+        max_threads = Settings.get("active", {}).get("Max Threads", 0)
+    if max_threads <= 0:
+        # Most of the work waits on git/IO, so allow a few more threads than CPUs
+        max_threads = min(32, (os.cpu_count() or 1) + 4)
+    return max_threads
+
+def SetMaxThreads(max_threads):
+    Settings["active"]["Max Threads"] = max(0, max_threads)
+    # Explicitly changed, so it takes precedence over the command line
+    Settings["max threads"] = None
+    Settings.save_persisted_settings()
+
 """
 Return True if the clone type changed
 """
@@ -135,6 +170,10 @@ class SETTINGS(dict):
                             help = "Do not run PB in multiple threads",
                             default=False, required=False, action=argparse.BooleanOptionalAction)
 
+        parser.add_argument("-j", "--jobs",
+                            help = "Maximum amount of threads to run in (0 follows the amount of CPUs). Overrides the persisted setting",
+                            default=None, required=False, type=int)
+
         parser.add_argument("--self", action='store_true', dest='use_self', help="Use the current working directory as the project URL (shorthand for --url=<cwd>)", default=False, required=False)
 
         parser.add_argument("--selftest", action='store_true', help="Run a full self-test: setup, build, and run all tests using cwd as the project URL, then exit with an appropriate error code", default=False, required=False)
@@ -143,7 +182,13 @@ class SETTINGS(dict):
 
         parser.add_argument("-d", "--debug", action='store_true', help = "Increase log verbosity to debug ProjectBase", default=False, required=False)
 
-        parser.add_argument("-f", "--fast", action='store_true', help = "Cache Repositories in pickle and do not consider config changes, deactivate to consider if needed", default=False, required=False)
+        parser.add_argument("-f", "--fast", action='store_true', help = "Start from the last load (project snapshot) and only check configs.json and checked out commits for changes", default=False, required=False)
+
+        parser.add_argument("--locked", action='store_true', help = "Check new repositories out at the commits recorded in the lockfile, without resolving branches or fetching when the bare gits have them", default=False, required=False)
+
+        parser.add_argument("--lockfile", help = "Lockfile to use (defaults to project.lock in the project's configs)", default=None, required=False)
+
+        parser.add_argument("--force-setup", action='store_true', dest='force_setup', help = "Run every setup command block, even the ones whose commands, commit and inputs did not change since they last ran", default=False, required=False)
 
         parser.add_argument("--force-menus", action='store_true', dest='force_menus', help = "Always display full menus, even during automated runs", default=False, required=False)
 
@@ -181,8 +226,12 @@ class SETTINGS(dict):
             self["branch"]        = None
             self["exit"]          = True
             self["single thread"] = False
+            self["max threads"]   = None
             self["debug"]         = False
             self["fast"]          = False
+            self["locked"]        = False
+            self["lockfile"]      = None
+            self["force setup"]   = True
             self["force menus"]   = True
             self["action"]        = ["1", "2", "3", "4"]
         else:
@@ -194,8 +243,12 @@ class SETTINGS(dict):
             self["branch"]        = project_args.branch
             self["exit"]          = project_args.exit
             self["single thread"] = project_args.single_thread
+            self["max threads"]   = project_args.jobs
             self["debug"]         = project_args.debug
             self["fast"]          = project_args.fast
+            self["locked"]        = project_args.locked
+            self["lockfile"]      = project_args.lockfile
+            self["force setup"]   = project_args.force_setup
             self["force menus"]   = project_args.force_menus
             # Trailing unknown arguments
             self["action"]        = action_args
@@ -240,6 +293,12 @@ class SETTINGS(dict):
         if "Threading" not in self["active"]:
             self["active"]["Threading"] = DEFAULT_SETTINGS["Threading"]
 
+        if "Max Threads" not in self["active"]:
+            self["active"]["Max Threads"] = DEFAULT_SETTINGS["Max Threads"]
+
+        if "Config Headers" not in self["active"]:
+            self["active"]["Config Headers"] = DEFAULT_SETTINGS["Config Headers"]
+
         # CLI --single_thread overrides persisted setting;
         # otherwise, sync from the persisted Threading value.
         if not self["single thread"]:
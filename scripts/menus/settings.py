@@ -1,18 +1,20 @@
-from menus.menu import Menu
+from menus.menu import Menu, GetNextInput
 from data.settings import Settings, CLONE_TYPE
 from data.colors import ColorFormat, Colors
 from processes.project import Project
 from dependency_graph import BuildGraph, VisualizeGraph
 from processes.project import CleanPBCache, PurgePB
 from data.settings import ToggleCloneType, ToggleSpeed, ToggleMode, CycleLogLevel, GetLogLevel, ToggleThreading
+from data.settings import GetMaxThreads, SetMaxThreads, IsSplitConfigHeaders, ToggleConfigHeaders
 from processes.PB_debug_terminal import PBTerminal
-from data.print import SetLogLevel, LogLevels
+from data.print import SetLogLevel, LogLevels, PrintNotice
 
 # Single source of truth for setting color mappings (used here and in main menu)
 SPEED_COLORS = {"Fast": Colors.Yellow, "Safe": Colors.Green}
 MODE_COLORS = {"Release": Colors.Blue, "Debug": Colors.Yellow}
 THREADING_COLORS = {"Multi Thread": Colors.Blue, "Single Thread": Colors.Yellow}
 CLONE_COLORS = {CLONE_TYPE.SSH.value: Colors.Magenta, CLONE_TYPE.HTTPS.value: Colors.Cyan}
+CONFIG_HEADERS_COLORS = {"Single": Colors.Blue, "Split": Colors.Yellow}
 LOG_LEVEL_COLORS = {"Error": Colors.Red, "Warning": Colors.Magenta, "Notice": Colors.Blue, "Info": Colors.Green}
 
 def _colored_toggle(current, other, color_map):
@@ -46,6 +48,30 @@ def CurrentCloneTypeEntry():
     else:
         return _colored_toggle(CLONE_TYPE.SSH.value, CLONE_TYPE.HTTPS.value, CLONE_COLORS)
 
+def CurrentMaxThreadsEntry():
+    if Settings["active"].get("Max Threads", 0) <= 0 and Settings.get("max threads") is None:
+        source = "follows CPUs"
+    else:
+        source = "fixed"
+    return f"Max threads: {ColorFormat(Colors.Blue, str(GetMaxThreads()))} ({source}) (click to change)"
+
+def CurrentConfigHeadersEntry():
+    if IsSplitConfigHeaders():
+        return "Config headers: " + _colored_toggle("Split", "Single", CONFIG_HEADERS_COLORS)
+    else:
+        return "Config headers: " + _colored_toggle("Single", "Split", CONFIG_HEADERS_COLORS)
+
+def _ToggleConfigHeaders():
+    ToggleConfigHeaders()
+    PrintNotice("Setup the project again for this to take effect")
+
+def _SetMaxThreads():
+    answer = GetNextInput("Max threads (0 follows the amount of CPUs): ").strip()
+    if not answer.isdigit():
+        print(ColorFormat(Colors.Red, f"{answer} is not a valid amount of threads"))
+        return
+    SetMaxThreads(int(answer))
+
 _log_level_to_enum = {
     "Error":   LogLevels.ERR,
     "Warning": LogLevels.WARN,
@@ -118,3 +144,6 @@ SettingsMenu.AddCallbackEntry("Show repositories", ShowRepositories, "Print PB v
 SettingsMenu.AddCallbackEntry("Clean project cache", CleanPBCache, "Clean cache (will have to reload from disk)")
 SettingsMenu.AddCallbackEntry("Purge ALL projects (DANGEROUS)", PurgePB, "Fully remove all PB data. Equivalent to clean clone")
 SettingsMenu.AddCallbackEntry("Launch PB Debug console", PBTerminal, "Console for performing introspection into PB")
+SettingsMenu.AddCallbackEntry(CurrentMaxThreadsEntry, _SetMaxThreads, "Set how many threads PB runs work in at the same time")
+SettingsMenu.AddCallbackEntry("Full project reload", Project.full_reload, "Reload and setup every repository, instead of only the ones whose configs changed")
+SettingsMenu.AddCallbackEntry(CurrentConfigHeadersEntry, _ToggleConfigHeaders, "Toggle between a single config header and one stamp header per CONFIG_ symbol (changing an option only rebuilds the code that uses it)")
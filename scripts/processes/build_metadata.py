@@ -0,0 +1,37 @@
+import os
+
+from data.paths import JoinPaths
+
+"""
+What the build files of the project need to know about each repository,
+ computed once per setup instead of once per repository and dependency:
+ - has code: whether the repository has a CMakeLists.txt anywhere
+ - public header folders: public header folders that exist
+ - flags: the repository's flags
+Finding out if a repository has code walks its tree (until the first
+ CMakeLists.txt), so it is not kept across setups: untracked files can add code
+ without changing anything git knows about
+"""
+
+# Stop at the first CMakeLists.txt instead of listing all of them
+def __HasCMakeLists(repo_source):
+    for root, dirs, files in os.walk(repo_source):
+        if "CMakeLists.txt" in files:
+            return True
+        if ".git" in dirs:
+            dirs.remove(".git")
+    return False
+
+"""
+Build metadata of every repository, indexed by repo ID
+"""
+def GetBuildMetadata(repositories):
+    metadata = {}
+    for repo_id, repository in repositories.items():
+        header_folders = [JoinPaths(repository["repo source"], x) for x in repository["public headers"]]
+        metadata[repo_id] = {
+            "has code": __HasCMakeLists(repository["repo source"]),
+            "public header folders": list(set(x for x in header_folders if os.path.isdir(x))),
+            "flags": repository["flags"],
+        }
+    return metadata
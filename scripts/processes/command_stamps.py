@@ -0,0 +1,102 @@
+import os
+import json
+import logging
+from hashlib import sha1
+from threading import Lock
+
+from data.settings import Settings
+from data.json import load_json_file, dump_json_file_atomic
+from data.paths import JoinPaths
+from processes.git_operations import GitGetHeadCommit
+
+"""
+Setup command blocks are skipped when nothing they depend on changed since they
+ last ran. What they depend on is stamped as a hash of:
+ - the condition to proceed and the command list
+ - the commit the repository has checked out
+ - the contents of the block's optional "inputs" (paths relative to the repository)
+{
+    "command block name": {
+        "condition to proceed": "true",
+        "command list": [...],
+        "inputs": ["configs/toolchain.json", "scripts/generate.py"]
+    }
+}
+--force-setup runs every block regardless of its stamp
+"""
+
+# Indexed by repo ID, then command set name, then block name
+command_stamps = None
+command_stamps_lock = Lock()
+
+def __GetCommandStampsPath():
+    # Standalone processes (i.e. tests) have no project to persist the stamps in
+    if "cache file" not in Settings:
+        return None
+    return Settings["cache file"] + "_command_stamps"
+
+# Must be called with command_stamps_lock held
+def __GetCommandStamps():
+    global command_stamps
+    if command_stamps is None:
+        stamps_path = __GetCommandStampsPath()
+        command_stamps = {} if stamps_path is None else load_json_file(stamps_path, {})
+    return command_stamps
+
+def __HashInput(path):
+    try:
+        with open(path, "rb") as file:
+            return sha1(file.read()).hexdigest()
+    except OSError:
+        # Missing inputs are part of the stamp too
+        return None
+
+"""
+Stamp of what a command block of the repository depends on
+"""
+def GetCommandBlockStamp(repository, command_block):
+    inputs = command_block.get("inputs", [])
+    stamp = {
+        "condition to proceed": command_block["condition to proceed"],
+        "command list": command_block["command list"],
+        "commit": GitGetHeadCommit(repository["repo source"]),
+        "inputs": {path: __HashInput(JoinPaths(repository["repo source"], path)) for path in inputs},
+    }
+    return sha1(json.dumps(stamp, sort_keys=True).encode()).hexdigest()
+
+def IsForcedSetup():
+    return "force setup" in Settings and Settings["force setup"] is True
+
+"""
+If the block already ran with this stamp, whether its condition to proceed was
+ true then (a false one stops the blocks after it). None if it has to run again
+"""
+def GetCommandBlockProceeded(repo_id, command_set_name, block_name, stamp):
+    if IsForcedSetup():
+        return None
+    with command_stamps_lock:
+        record = __GetCommandStamps().get(repo_id, {}).get(command_set_name, {}).get(block_name)
+    if type(record) != type({}) or record.get("stamp") != stamp:
+        return None
+    return record.get("proceeded") is True
+
+def RecordCommandBlockStamp(repo_id, command_set_name, block_name, stamp, proceeded):
+    with command_stamps_lock:
+        repo_stamps = __GetCommandStamps().setdefault(repo_id, {})
+        repo_stamps.setdefault(command_set_name, {})[block_name] = {"stamp": stamp, "proceeded": proceeded}
+
+def SaveCommandStamps():
+    stamps_path = __GetCommandStampsPath()
+    if stamps_path is None:
+        return
+    with command_stamps_lock:
+        dump_json_file_atomic(__GetCommandStamps(), stamps_path)
+    logging.debug("Saved command block stamps")
+
+def ResetCommandStamps():
+    global command_stamps
+    with command_stamps_lock:
+        command_stamps = {}
+    stamps_path = __GetCommandStampsPath()
+    if stamps_path is not None and os.path.isfile(stamps_path):
+        os.remove(stamps_path)
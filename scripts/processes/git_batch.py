@@ -0,0 +1,159 @@
+import os
+import atexit
+import logging
+import subprocess
+from time import time, sleep
+from threading import Thread, Lock
+
+"""
+Persistent `git cat-file --batch-command` processes, so that resolving names
+ and reading objects costs a pipe round trip instead of a git process each
+Workers are started on first use for a repository, lent to one thread at a
+ time (so they can be shared by the threads of RunOnFolders) and stopped once
+ they have been idle for GIT_WORKER_IDLE_TIME
+Git re-reads refs and reloads packs on each question, so answers are never
+ older than the question, even when other processes changed the repository
+"""
+
+GIT_WORKER_IDLE_TIME = 30   # seconds a worker is kept without being used
+
+class GIT_BATCH_WORKER():
+    def __init__(self, path):
+        self.path = path
+        self.last_used = time()
+        self.process = subprocess.Popen(["git", "cat-file", "--batch-command"],
+                                        cwd=path,
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL,
+                                        start_new_session=True)
+
+    def IsAlive(self):
+        return self.process.poll() is None
+
+    def Stop(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.process.stdout.close()
+
+    def _Ask(self, command, name):
+        if "\n" in name:
+            raise Exception(f"Object names can't have new lines: {repr(name)}")
+        self.process.stdin.write(f"{command} {name}\n".encode())
+        self.process.stdin.flush()
+        header = self.process.stdout.readline()
+        if not header.endswith(b"\n"):
+            raise BrokenPipeError(f"git cat-file stopped answering at {self.path}")
+        # "<object name> <type> <size>", or "<name> missing" / "<name> ambiguous"
+        parts = header.decode().rstrip("\n").rsplit(" ", 2)
+        if len(parts) != 3 or not parts[2].isdigit():
+            return None
+        return parts[0], parts[1], int(parts[2])
+
+    """
+    (object name, type, size) of name, or None if it does not exist
+    """
+    def Info(self, name):
+        return self._Ask("info", name)
+
+    """
+    (object name, type, contents) of name, or None if it does not exist
+    """
+    def Contents(self, name):
+        answer = self._Ask("contents", name)
+        if answer is None:
+            return None
+        object_name, object_type, size = answer
+        # Contents are followed by a new line
+        contents = self.process.stdout.read(size + 1)
+        if len(contents) != size + 1:
+            raise BrokenPipeError(f"git cat-file stopped answering at {self.path}")
+        return object_name, object_type, contents[:-1]
+
+# Idle workers indexed by repository path (workers in use are not in here)
+idle_workers = {}
+idle_workers_lock = Lock()
+reaper_running = False
+
+def __StopIdleWorkers(max_idle_time):
+    global reaper_running
+    now = time()
+    stopped = []
+    with idle_workers_lock:
+        for path in list(idle_workers.keys()):
+            workers = idle_workers[path]
+            stopped += [worker for worker in workers if now - worker.last_used >= max_idle_time]
+            workers[:] = [worker for worker in workers if now - worker.last_used < max_idle_time]
+            if len(workers) == 0:
+                del idle_workers[path]
+        keep_running = len(idle_workers) != 0
+        if max_idle_time != 0 and not keep_running:
+            reaper_running = False
+    for worker in stopped:
+        worker.Stop()
+    if len(stopped) != 0:
+        logging.debug(f"Stopped {len(stopped)} idle git workers")
+    return keep_running
+
+def __Reaper():
+    while True:
+        sleep(GIT_WORKER_IDLE_TIME / 2)
+        if not __StopIdleWorkers(GIT_WORKER_IDLE_TIME):
+            return
+
+def __AcquireWorker(path):
+    with idle_workers_lock:
+        workers = idle_workers.get(path, [])
+        while len(workers) != 0:
+            worker = workers.pop()
+            if worker.IsAlive():
+                return worker
+            worker.Stop()
+    return GIT_BATCH_WORKER(path)
+
+def __ReleaseWorker(worker):
+    global reaper_running
+    worker.last_used = time()
+    with idle_workers_lock:
+        idle_workers.setdefault(worker.path, []).append(worker)
+        if reaper_running:
+            return
+        reaper_running = True
+    Thread(target=__Reaper, daemon=True).start()
+
+"""
+Call question(worker) with a worker of the repository at path and return its
+ answer. A worker that stopped answering is replaced and asked once more
+"""
+def AskGitWorker(path, question):
+    path = os.path.realpath(path)
+    for attempt in range(2):
+        worker = __AcquireWorker(path)
+        try:
+            answer = question(worker)
+        except (OSError, ValueError) as e:
+            worker.Stop()
+            if attempt == 1:
+                raise Exception(f"git cat-file failed at {path}: {e}")
+            continue
+        except Exception:
+            # It may be halfway through an answer
+            worker.Stop()
+            raise
+        __ReleaseWorker(worker)
+        return answer
+
+"""
+Stop every idle worker (workers in use are stopped once they are returned and idle out)
+"""
+def StopGitWorkers():
+    __StopIdleWorkers(0)
+
+atexit.register(StopGitWorkers)
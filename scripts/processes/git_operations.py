@@ -6,7 +6,10 @@ from data.common import IsEmpty, RemoveEmpty, RemoveSequentialDuplicates
 from data.print import *
 from data.git import *
 from data.paths import GetNewTemporaryPath
+from data.json import dump_json_file, load_json_file
 from processes.filesystem import *
+from processes.git_reader import ReadRepositoryConfig, ReadGitTopLevel, ReadHeadCommit, ReadHeadBranch, ReadRemotes
+from processes.git_batch import AskGitWorker
 from data.settings import Settings, CLONE_TYPE
 from processes.git_operations import *
 
@@ -29,7 +32,12 @@ class GIT_CMD():
         self.error_nessage = None
 
         try:
-            self.returned = LaunchProcess(command, path, False)
+            # Plain git commands (and argument lists) skip bash altogether
+            argv = command if type(command) == type([]) else SplitDirectCommand(command)
+            if argv is None:
+                self.returned = LaunchProcess(command, path, False)
+            else:
+                self.returned = LaunchDirectProcess(argv, path)
             self.legacy_return = self.returned
             self.success = True
         except ProcessError as ex:
@@ -46,6 +54,87 @@ class GIT_CMD():
 def ParseGitResult(git_command, path):
     return GIT_CMD(git_command, path).returned["out"]
 
+"""
+Answer with reader(path) (git metadata read from disk) when it can, and only
+ launch git_command otherwise
+"""
+def ReadOrParseGitResult(reader, git_command, path):
+    if path is None:
+        path = os.getcwd()
+
+    result = reader(path)
+    if result is None:
+        result = ParseGitResult(git_command, path)
+    return result
+
+# ================= Object queries =================
+# Answered by the persistent git cat-file workers of processes/git_batch.py
+
+"""
+Object name each of names (refs, commits, <revision>:<path>, ...) resolves to,
+ None for the ones that don't exist
+"""
+def GitResolveNames(names, path = None):
+    if path is None:
+        path = os.getcwd()
+    def __Resolve(worker):
+        answers = [worker.Info(name) for name in names]
+        return [None if answer is None else answer[0] for answer in answers]
+    return AskGitWorker(path, __Resolve)
+
+def GitResolveName(name, path = None):
+    return GitResolveNames([name], path)[0]
+
+"""
+Type ("commit", "tree", "blob", "tag") of each of names, None for the ones that don't exist
+"""
+def GitGetObjectTypes(names, path = None):
+    if path is None:
+        path = os.getcwd()
+    def __Types(worker):
+        answers = [worker.Info(name) for name in names]
+        return [None if answer is None else answer[1] for answer in answers]
+    return AskGitWorker(path, __Types)
+
+"""
+Contents of the file at file_path in revision, None if there is no such file
+"""
+def GitReadBlob(revision, file_path, path = None):
+    if path is None:
+        path = os.getcwd()
+    answer = AskGitWorker(path, lambda worker: worker.Contents(f"{revision}:{file_path}"))
+    if answer is None or answer[1] != "blob":
+        return None
+    return answer[2].decode('utf-8', errors='replace')
+
+"""
+Metadata of the commit revision points to, None if there is no such commit:
+{"commit": ..., "tree": ..., "parents": [...], "author": ..., "author time": ...,
+ "committer": ..., "commit time": ..., "subject": ..., "message": ...}
+"""
+def GitReadCommitInfo(revision, path = None):
+    if path is None:
+        path = os.getcwd()
+    answer = AskGitWorker(path, lambda worker: worker.Contents(f"{revision}^{{commit}}"))
+    if answer is None:
+        return None
+
+    headers, _, message = answer[2].decode('utf-8', errors='replace').partition("\n\n")
+    info = {"commit": answer[0], "tree": None, "parents": [], "message": message}
+    for line in headers.split("\n"):
+        key, _, value = line.partition(" ")
+        if key == "tree":
+            info["tree"] = value
+        elif key == "parent":
+            info["parents"].append(value)
+        elif key in ("author", "committer"):
+            # "<name> <<email>> <timestamp> <timezone>"
+            identity, _, date = value.rpartition("> ")
+            info[key] = identity + ">"
+            info["author time" if key == "author" else "commit time"] = int(date.split(" ")[0])
+    info["subject"] = message.split("\n")[0]
+    return info
+
 
 # ================= GET operations =================
 
@@ -56,6 +145,10 @@ def GetRepositoryUrl(path = None):
     if path is None:
         path = os.getcwd()
 
+    url = ReadRepositoryConfig(path, "remote.origin.url")
+    if url is not None:
+        return url
+
     url = ParseGitResult("git config --get remote.origin.url", path)
     # Validate that we are currently at the top level (otherwise git will search backwards)
     top_level = GetGitTopLevel(path)
@@ -71,7 +164,7 @@ def GetRepoNameFromPath(path):
     return GetRepoNameFromURL(url)
 
 def GetGitTopLevel(path = None):
-    top_level = ParseGitResult("git rev-parse --show-toplevel", path)
+    top_level = ReadOrParseGitResult(ReadGitTopLevel, "git rev-parse --show-toplevel", path)
     # Failure in bare gits
     if "fatal: this operation must be run in a work tree" in str(top_level):
         top_level = path
@@ -84,29 +177,78 @@ def GitCheckRemoteBranchExists(path, branch):
         return False
     return True
 
-def GetAllRepoBranches(path = None):
-    checked_out = None
+"""
+Heads of the remote, straight from it (one network round trip)
+"""
+def GetRemoteHeads(path = None):
+    heads = set()
+    for line in ParseGitResult(["git", "ls-remote", "--heads", GetRepoRemote(path)], path).split("\n"):
+        parts = line.split("\t")
+        if len(parts) == 2 and parts[1].startswith("refs/heads/"):
+            heads.add(parts[1][len("refs/heads/"):])
+    return heads
+
+"""
+Local and remote tracking branches, with what they track:
+[{"ref": "refs/heads/main", "commit": ..., "upstream": "refs/remotes/origin/main", "track": "[ahead 1]", "symref": ""}, ...]
+"""
+def GetBranchRefs(path = None):
+    fields = ["refname", "objectname", "upstream", "upstream:track", "symref"]
+    keys   = ["ref", "commit", "upstream", "track", "symref"]
+    # Fields are NUL separated, which "out" would strip
+    output = GIT_CMD(["git", "for-each-ref", "--format=" + "%00".join(f"%({field})" for field in fields), "refs/heads", "refs/remotes"], path).returned["stdout"]
+
+    refs = []
+    for line in output.split("\n"):
+        values = line.split("\0")
+        if len(values) == len(keys):
+            refs.append(dict(zip(keys, values)))
+    return refs
 
-    local = GetRepoLocalBranches(path)
-    for branch in local.split("\n"):
-        if branch.startswith("* "):
-            checked_out = ParseBranch(branch)
+"""
+check_remote: ask the remote which branches it has, instead of trusting the
+ remote tracking branches (which only know as much as the last fetch)
+"""
+def GetAllRepoBranches(path = None, check_remote = False):
+    status = GetRepoStatusInfo(path)
+    if status is None:
+        checked_out = None
+        remote_branch = None
+    elif status.branch is None:
+        checked_out = f"(HEAD detached at {(status.commit or "")[:7]})"
+        remote_branch = "HEAD"
+    else:
+        checked_out = PBBranchNameToNormalName(status.branch)
+        remote_branch = checked_out
+
+    local_branches  = []
+    remote_branches = []
+    tracked = set()
+    for ref in GetBranchRefs(path):
+        if ref["ref"].startswith("refs/heads/"):
+            local_branches.append(ref["ref"][len("refs/heads/"):])
+        elif ref["symref"] == "":
+            # Leave out symbolic refs like origin/HEAD
+            remote_branches.append(PBBranchNameToNormalName(ref["ref"][len("refs/remotes/"):]))
+            tracked.add(ref["ref"])
 
+    remote = GetRepoRemote(path)
+    remote_heads = GetRemoteHeads(path) if check_remote else None
     not_pushed = []
-    local_branches = ParseBranches(local)
-    for local_branch in local_branches:
-        if GitCheckRemoteBranchExists(path, local_branch) is False:
+    for local_branch in [PBBranchNameToNormalName(branch) for branch in local_branches]:
+        if remote_heads is not None:
+            pushed = local_branch in remote_heads
+        else:
+            pushed = f"refs/remotes/{remote}/{local_branch}" in tracked
+        if not pushed:
             not_pushed.append(local_branch)
 
-
-    remote_branches = GetParsedRepoRemoteBranches(path)
-
     return {
         "checkedout" : [checked_out],
-        "locals"     : local_branches,
+        "locals"     : [PBBranchNameToNormalName(branch) for branch in local_branches],
         "remotes"    : remote_branches,
-        "status"     : GetRepoStatus(path),
-        "remote"     : [PBBranchNameToNormalName(GetRepoRemoteBranch(path))],
+        "status"     : status,
+        "remote"     : [remote_branch],
         "not pushed" : not_pushed
     }
 
@@ -204,11 +346,10 @@ while read -r branch upstream; do
 done"""
     ret = GIT_CMD(code, path)
     if ret.proc_error is not None:
-        status = GetRepoStatus(path)
+        status = GetRepoStatusInfo(path, untracked=False)
         if "Diverging branches" in ret.returned["stderr"]:
             ret.error_nessage =f"Branches diverged, can't pull (merge) in {path}. Need manual intervention!"
-        elif "both modified" in status:
-            # TODO: Dont use status
+        elif status is not None and len(status.conflicted) != 0:
             ret.error_nessage = f"Code needs merge in {path}"
         else:
             # Not sure what the error was, just print it
@@ -246,8 +387,21 @@ def GitRebaseBranch(path, branch_to_rebase):
 def GitRebaseOrMergeAbort(path, operation):
     return ParseGitResult(f"git {operation} --abort", path)
 
+"""
+HEAD commit from disk, or from a git worker when the files alone can't tell
+"""
+def __ReadOrResolveHeadCommit(path):
+    commit = ReadHeadCommit(path)
+    if commit is not None:
+        return commit
+    try:
+        return GitResolveName("HEAD", path)
+    except Exception:
+        # Not a repository, let git itself report it
+        return None
+
 def GitGetHeadCommit(path):
-    return ParseGitResult(f"git rev-parse HEAD", path)
+    return ReadOrParseGitResult(__ReadOrResolveHeadCommit, "git rev-parse HEAD", path)
 
 """
 Get amount of commits desynced
@@ -298,13 +452,13 @@ def GetRepoGetDetailedRemoteBranches(path = None):
     return ParseGitResult("git branch -vv --remotes", path)
 
 def GetRepoLocalCommit(path = None):
-    return ParseGitResult("git rev-parse HEAD", path)
+    return ReadOrParseGitResult(__ReadOrResolveHeadCommit, "git rev-parse HEAD", path)
 
 def GetRepoLocalBranch(path = None):
-    return ParseGitResult("git rev-parse --abbrev-ref HEAD", path)
+    return ReadOrParseGitResult(ReadHeadBranch, "git rev-parse --abbrev-ref HEAD", path)
 
 def GetRepoRemoteBranch(path = None):
-    return ParseGitResult("git rev-parse --abbrev-ref HEAD", path)
+    return ReadOrParseGitResult(ReadHeadBranch, "git rev-parse --abbrev-ref HEAD", path)
 
 def GetRepoRemoteCommit(path = None):
     return ParseGitResult("git rev-parse `git branch -r --sort=committerdate | tail -1`", path)
@@ -353,12 +507,32 @@ def GetRepoUrl(path = None):
     result = result.split(' ')[1]
     return result
 
+"""
+The first commit (the repository ID). Check .success: without commits, the
+ output is git's error
+"""
+def GetFirstCommitResult(path = None):
+    return GIT_CMD("git rev-list --max-parents=0 HEAD", path)
+
 def GetFirstCommit(path = None):
-    return ParseGitResult("git rev-list --max-parents=0 HEAD", path)
+    return GetFirstCommitResult(path).returned["out"]
 
 def GetRepoStatus(path = None):
     return ParseGitResult("git status", path)
 
+"""
+Structured status (RepoStatus) of the repository, None if git can't tell
+untracked: also look for untracked files (slow on large trees)
+"""
+def GetRepoStatusInfo(path = None, untracked = True):
+    command = ["git", "status", "--porcelain=v2", "--branch", "-z"]
+    if not untracked:
+        command.append("--untracked-files=no")
+    ret = GIT_CMD(command, path)
+    if ret.proc_error is not None:
+        return None
+    return ParsePorcelainStatus(ret.returned["stdout"], untracked)
+
 def __GetUntrackedFilesDiff(path):
     return GIT_CMD("git ls-files --others --exclude-standard -z | xargs -0 -n 1 git --no-pager diff --stat /dev/null", path).returned["stdout"]
 
@@ -403,7 +577,7 @@ def GitApplyPatch(patch_content, path = None):
     return result
 
 def GetRepoRemote(path = None):
-    return ParseGitResult("git remote show", path)
+    return ReadOrParseGitResult(ReadRemotes, "git remote show", path)
 
 def GetCurrentBranchsUpstream(path = None):
     return ParseGitResult("git for-each-ref --format='%(upstream:short)' $(git symbolic-ref -q HEAD)", path)
@@ -528,7 +702,8 @@ def GetRepositoryName(path):
     return GetRepoNameFromURL(url)
 
 def RepositoryIsClean(path = None):
-    return "nothing to commit, working tree clean" in GetRepoStatus(path)
+    status = GetRepoStatusInfo(path)
+    return status is not None and status.IsClean()
 
 """
 Recursively scan a folder for a .git repository whose url matches the provided repo_url
@@ -655,18 +830,102 @@ def SetupBareData(repo_url):
 
     if False == os.path.isdir(bare_git):
         Abort("Bare git " + bare_git + " could not be pulled")
+
+    RegisterBareGit(repo_url, bare_git)
     return bare_git
 
-def GetBareGit(repo_url):
+# ================= Bare git index =================
+
+# Normalized URL -> bare git path. Persisted so lookups don't need to scan the bare gits
+bare_git_index = None
+bare_git_index_lock = Lock()
+# Amount of lookups, and of lookups that found a stale index and had to scan
+bare_git_index_stats = {"lookups": 0, "fallbacks": 0}
+
+def __GetBareGitIndexPath():
+    return JoinPaths(Settings["paths"]["configs"], "project_cache", "bare_gits_index")
+
+def __GetBareGitIndexKey(repo_url):
+    url = url_SSH_to_HTTPS(repo_url)
+    if url[-1] == '/':
+        url = url[:-1]
+    return url
+
+# Must be called with bare_git_index_lock held
+def __GetBareGitIndex():
+    global bare_git_index
+    if bare_git_index is None:
+        bare_git_index = load_json_file(__GetBareGitIndexPath(), {})
+    return bare_git_index
+
+"""
+Record where the bare git for repo_url lives
+"""
+def RegisterBareGit(repo_url, bare_git):
+    key = __GetBareGitIndexKey(repo_url)
+    with bare_git_index_lock:
+        index = __GetBareGitIndex()
+        if index.get(key) == bare_git:
+            return
+        index[key] = bare_git
+        index_path = __GetBareGitIndexPath()
+        CreateParentDirectory(index_path)
+        dump_json_file(index, index_path)
+
+"""
+Forget all known bare git locations (i.e. after the bare gits are removed)
+"""
+def ResetBareGitIndex():
+    global bare_git_index
+    with bare_git_index_lock:
+        bare_git_index = {}
+        Remove(__GetBareGitIndexPath())
+
+def GetBareGitIndexStats():
+    with bare_git_index_lock:
+        return bare_git_index_stats.copy()
+
+"""
+Find the bare git for repo_url, without cloning it
+Known bare gits cost one index read and one existence check. Unknown ones are
+ seeded from the path SetupBareData clones them into. The bare gits folder is
+ only scanned when the index points to a bare git that no longer exists
+Returns None if there is no bare git for repo_url
+"""
+def FindBareGit(repo_url):
     repo_url  = FixUrl(repo_url)
-    # TODO: Calculate the path and try to check for it directly first
-    # Here we might not even need to do Find for baregit at all
-    bare_git  = FindGitRepo(Settings["paths"]["bare gits"], repo_url)
+
+    with bare_git_index_lock:
+        bare_git_index_stats["lookups"] += 1
+        bare_git = __GetBareGitIndex().get(__GetBareGitIndexKey(repo_url))
+
+    if bare_git is not None and os.path.isdir(bare_git):
+        return bare_git
+
     if bare_git is None:
-        bare_git = SetupBareData(repo_url)
+        bare_git = GetRepoBareTreePath(Settings["paths"]["bare gits"], repo_url)
+        if not os.path.isdir(bare_git):
+            bare_git = None
+    else:
+        logging.warning(f"Bare git index is stale for {repo_url} ({bare_git} is gone), scanning bare gits")
+        with bare_git_index_lock:
+            bare_git_index_stats["fallbacks"] += 1
+        bare_git = FindGitRepo(Settings["paths"]["bare gits"], repo_url)
+
+    if bare_git is not None:
+        RegisterBareGit(repo_url, bare_git)
 
     return bare_git
 
+"""
+Obtain the bare git for repo_url, cloning it if it does not exist yet
+"""
+def GetBareGit(repo_url):
+    bare_git = FindBareGit(repo_url)
+    if bare_git is None:
+        bare_git = SetupBareData(FixUrl(repo_url))
+    return bare_git
+
 def LaunchGitCommandAt(command, path=None, message=None):
     if message is not None:
         logging.debug(message)
@@ -679,10 +938,68 @@ def LaunchGitCommandAt(command, path=None, message=None):
     if message is not None:
         logging.debug(result_code)
 """
+The revision AddWorkTree checks out for repo_commitish (branches start where
+ the bare git's HEAD is, and are only updated afterwards)
+"""
+def GetCommitishRevision(repo_commitish):
+    if repo_commitish is not None and repo_commitish["type"] == "commit":
+        return repo_commitish["commit"]
+    return "HEAD"
+
+"""
+Read file_path and check which of folders exist in the commit repo_commitish
+ refers to (or in revision, when given), straight from the bare git (no
+ worktree needed)
+Returns the commit, the contents of file_path (None if it doesn't exist there)
+ and the set of the folders that exist. The commit is None when revision isn't
+ in the bare git
+"""
+def ReadFromCommit(bare_path, repo_commitish, file_path, folders, revision=None):
+    if revision is None:
+        revision = GetCommitishRevision(repo_commitish)
+    objects  = [f"{revision}^{{commit}}", f"{revision}:{file_path}"] + [f"{revision}:{folder}" for folder in folders]
+
+    # One git worker answers for every object, and reads the file if it is there
+    def __Read(worker):
+        answers = [worker.Info(name) for name in objects]
+        file_contents = None
+        if answers[1] is not None and answers[1][1] == "blob":
+            file_contents = worker.Contents(answers[1][0])[2]
+        return answers, file_contents
+    answers, contents = AskGitWorker(bare_path, __Read)
+
+    def __Answer(answer, object_type):
+        if answer is not None and answer[1] == object_type:
+            return answer[0]
+        return None
+
+    commit = __Answer(answers[0], "commit")
+    if commit is None:
+        return None, None, set()
+
+    if contents is not None:
+        contents = contents.decode('utf-8', errors='replace').rstrip()
+
+    existing_folders = set()
+    for folder, answer in zip(folders, answers[2:]):
+        if __Answer(answer, "tree") is not None:
+            existing_folders.add(folder)
+
+    return commit, contents, existing_folders
+
+"""
+Bring the bare git up to date with its remote
+"""
+def FetchBareGit(bare_path):
+    LaunchGitCommandAt(f"git fetch --all", bare_path, f"Fetch all branches")
+
+"""
 Adds a worktree at target_path
+With commit (i.e. from a lockfile), branches start at that commit instead,
+ without asking the remote for anything (the bare git must have the commit)
 Returns path to worktree: target_path + "/" + wortkree_name
 """
-def AddWorkTree(bare_path, repo_url, repo_commitish, target_path):
+def AddWorkTree(bare_path, repo_url, repo_commitish, target_path, commit=None):
     existing_tree  = FindGitRepo(target_path, repo_url, repo_commitish)
     if existing_tree is not None and GetParentPath(existing_tree) == target_path:
         # Already exists, skip
@@ -705,7 +1022,10 @@ def AddWorkTree(bare_path, repo_url, repo_commitish, target_path):
         logging.debug("\tAdding git commit worktree with: " + worktree_command + " from bare at " + bare_path)
     else: # Branch comitish
         if repo_commitish is None:
-            branch_to_follow = GetRepoDefaultBranch(bare_path)
+            # The bare git's HEAD is the remote's default branch since it was cloned
+            branch_to_follow = ReadHeadBranch(bare_path) if commit is not None else None
+            if branch_to_follow is None or branch_to_follow == "HEAD":
+                branch_to_follow = GetRepoDefaultBranch(bare_path)
             local_branch_name = GenerateLocalBranchName(branch_to_follow)
         # If branch is defined, create a new random branch and make it follow the remote (it will be updated)
         elif repo_commitish["type"] == "branch":
@@ -717,9 +1037,12 @@ def AddWorkTree(bare_path, repo_url, repo_commitish, target_path):
         remote = GetRepoRemote(bare_path)
 
         # Setup worktree already on branch (otherwise, an automatic path related branch appears)
-        LaunchGitCommandAt(f"git worktree add -b {local_branch_name} {new_repo_path}", bare_path, "Adding git branch worktree")
-        # Fetch all branches
-        LaunchGitCommandAt(f"git fetch --all", new_repo_path, f"Fetch all branches")
+        if commit is not None:
+            LaunchGitCommandAt(f"git worktree add -b {local_branch_name} {new_repo_path} {commit}", bare_path, "Adding git branch worktree at locked commit")
+        else:
+            LaunchGitCommandAt(f"git worktree add -b {local_branch_name} {new_repo_path}", bare_path, "Adding git branch worktree")
+            # Fetch all branches
+            LaunchGitCommandAt(f"git fetch --all", new_repo_path, f"Fetch all branches")
         # Setup appropriate upstream
         LaunchGitCommandAt(f"git branch --set-upstream-to={remote}/{branch_to_follow}", new_repo_path, f"Following branch {branch_to_follow}")
 
@@ -0,0 +1,364 @@
+import os
+import re
+
+"""
+Read git metadata (gitfiles, HEAD, config, refs/ and packed-refs) straight
+ from disk, without launching git
+Every Read* function returns None when it can't answer from the files alone
+ (unusual layouts, unborn branches, includes, reftable, ...) in which case the
+ caller is expected to fall back to the git CLI
+"""
+
+_SHA_RE = re.compile(r"^([0-9a-f]{40}|[0-9a-f]{64})$")
+
+# Refs that live in each worktree's own git dir instead of the common dir
+_PER_WORKTREE_REFS = ("HEAD", "refs/bisect/", "refs/worktree/", "refs/rewritten/")
+
+# Symbolic references are not followed deeper than this (same as git)
+_MAX_SYMREF_DEPTH = 5
+
+def __ReadText(path):
+    try:
+        with open(path, "r") as file:
+            return file.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+
+def __ReaderDisabled():
+    # Environment overrides change where git looks for its data
+    return "GIT_DIR" in os.environ or "GIT_COMMON_DIR" in os.environ or "GIT_CONFIG" in os.environ
+
+"""
+Whether path is a git directory itself (a bare git, or the .git folder of a worktree)
+"""
+def IsGitDir(path):
+    return os.path.isfile(os.path.join(path, "HEAD")) and \
+           os.path.isdir(os.path.join(path, "objects")) and \
+           os.path.isdir(os.path.join(path, "refs"))
+
+"""
+Whether path is a bare git (as opposed to the .git folder of a worktree)
+"""
+def IsBareGitDir(path):
+    if not IsGitDir(path):
+        return False
+    config = ReadGitConfig(path)
+    if config is None:
+        return os.path.basename(os.path.normpath(path)) != ".git"
+    return config.get("core.bare", "false").lower() in ("true", "yes", "on", "1")
+
+"""
+Resolve the ".git" entry of a worktree top level
+Returns the git dir, or None if there is no (valid) .git entry
+"""
+def __ReadDotGit(top_level):
+    dot_git = os.path.join(top_level, ".git")
+    if os.path.isdir(dot_git):
+        return dot_git if IsGitDir(dot_git) else None
+
+    if not os.path.isfile(dot_git):
+        return None
+
+    content = __ReadText(dot_git)
+    if content is None or not content.startswith("gitdir:"):
+        return None
+
+    git_dir = content[len("gitdir:"):].strip()
+    if not os.path.isabs(git_dir):
+        git_dir = os.path.join(top_level, git_dir)
+    git_dir = os.path.normpath(git_dir)
+    if not os.path.isfile(os.path.join(git_dir, "HEAD")):
+        # Pruned or moved worktree
+        return None
+    return git_dir
+
+"""
+Obtain the common dir (where config, refs/ and packed-refs live) of git_dir
+"""
+def __ReadCommonDir(git_dir):
+    common_dir = __ReadText(os.path.join(git_dir, "commondir"))
+    if common_dir is None:
+        return git_dir
+
+    common_dir = common_dir.strip()
+    if not os.path.isabs(common_dir):
+        common_dir = os.path.join(git_dir, common_dir)
+    return os.path.normpath(common_dir)
+
+"""
+Find the repository path belongs to, the same way git does
+Returns (top level, git dir, common dir). top level is None for bare gits (and
+ when path is inside a git dir). Returns None when no repository is found
+"""
+def ReadGitDirs(path):
+    if __ReaderDisabled() or not os.path.isdir(path):
+        return None
+
+    current = os.path.abspath(path)
+    while True:
+        if os.path.exists(os.path.join(current, ".git")):
+            git_dir = __ReadDotGit(current)
+            if git_dir is None:
+                return None
+            return current, git_dir, __ReadCommonDir(git_dir)
+
+        if IsGitDir(current):
+            return None, current, __ReadCommonDir(current)
+
+        parent = os.path.dirname(current)
+        if parent == current:
+            return None
+        current = parent
+
+"""
+Parse a git config file into a flat {"section[.subsection].key": value} dict
+Sections and keys are lowercased, subsections are kept as is (same as git)
+Returns None if the file uses something this parser does not support
+"""
+def __ParseGitConfig(content):
+    config = {}
+    section = None
+    for line in content.split("\n"):
+        line = line.strip()
+        if len(line) == 0 or line[0] in "#;":
+            continue
+
+        if line[0] == "[":
+            match = re.match(r'^\[\s*([A-Za-z0-9.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]\s*(?:[#;].*)?$', line)
+            if match is None:
+                return None
+            name, subsection = match.groups()
+            if subsection is None and "." in name:
+                # Deprecated [section.subsection] syntax
+                name, subsection = name.split(".", 1)
+                subsection = subsection.lower()
+            section = name.lower()
+            if subsection is not None:
+                section = section + "." + re.sub(r'\\(.)', r'\1', subsection)
+            # Includes can pull values from anywhere
+            if section in ("include",) or section.startswith("includeif."):
+                return None
+            continue
+
+        if section is None or line.endswith("\\"):
+            return None
+
+        if "=" not in line:
+            key, value = line, "true"
+        else:
+            key, value = line.split("=", 1)
+            value = __ParseGitConfigValue(value.strip())
+            if value is None:
+                return None
+
+        key = key.strip()
+        if not re.match(r'^[A-Za-z][A-Za-z0-9-]*$', key):
+            return None
+        config[section + "." + key.lower()] = value
+
+    return config
+
+def __ParseGitConfigValue(value):
+    parsed = ""
+    in_quotes = False
+    pending_space = ""
+    i = 0
+    while i < len(value):
+        char = value[i]
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == "\\":
+            i += 1
+            if i == len(value):
+                return None
+            escaped = {"n": "\n", "t": "\t", "b": "\b", '"': '"', "\\": "\\"}.get(value[i])
+            if escaped is None:
+                return None
+            parsed += pending_space + escaped
+            pending_space = ""
+        elif char in "#;" and not in_quotes:
+            break
+        elif char.isspace() and not in_quotes:
+            pending_space += char
+        else:
+            parsed += pending_space + char
+            pending_space = ""
+        i += 1
+
+    if in_quotes:
+        return None
+    return parsed
+
+"""
+Read the config of the repository whose common dir is common_dir
+"""
+def ReadGitConfig(common_dir):
+    content = __ReadText(os.path.join(common_dir, "config"))
+    if content is None:
+        return None
+    config = __ParseGitConfig(content)
+    if config is None:
+        return None
+
+    # Per worktree configs and non-files ref storages are left for git to handle
+    if config.get("extensions.worktreeconfig", "false").lower() in ("true", "yes", "on", "1"):
+        return None
+    if "extensions.refstorage" in config and config["extensions.refstorage"] != "files":
+        return None
+    return config
+
+"""
+Find refname in packed-refs
+"""
+def __ReadPackedRef(common_dir, refname):
+    content = __ReadText(os.path.join(common_dir, "packed-refs"))
+    if content is None:
+        return None
+
+    for line in content.split("\n"):
+        if len(line) == 0 or line[0] in "#^":
+            continue
+        parts = line.split(" ", 1)
+        if len(parts) == 2 and parts[1] == refname:
+            return parts[0]
+    return None
+
+"""
+Resolve refname (i.e. "HEAD" or "refs/heads/main") to a commit
+Returns (symbolic target of refname or None, commit or None)
+"""
+def __ResolveRef(git_dir, common_dir, refname):
+    if os.path.isdir(os.path.join(common_dir, "reftable")):
+        return None, None
+
+    symbolic_target = None
+    for _ in range(_MAX_SYMREF_DEPTH):
+        if refname.startswith(_PER_WORKTREE_REFS):
+            ref_dir = git_dir
+        else:
+            ref_dir = common_dir
+
+        content = __ReadText(os.path.join(ref_dir, refname))
+        if content is None:
+            content = __ReadPackedRef(common_dir, refname)
+            if content is None:
+                # Unborn branch or unknown ref
+                return symbolic_target, None
+
+        content = content.strip()
+        if content.startswith("ref:"):
+            refname = content[len("ref:"):].strip()
+            if symbolic_target is None:
+                symbolic_target = refname
+            continue
+
+        if _SHA_RE.match(content) is None:
+            return symbolic_target, None
+        return symbolic_target, content
+
+    return symbolic_target, None
+
+"""
+Equivalent to `git rev-parse --show-toplevel` (bare gits return path itself)
+"""
+def ReadGitTopLevel(path):
+    dirs = ReadGitDirs(path)
+    if dirs is None:
+        return None
+    top_level, _, _ = dirs
+    if top_level is None:
+        return path
+    return os.path.realpath(top_level)
+
+"""
+Equivalent to `git config --get <key>`, only for the repository path is the
+ top level of. Empty if path is not a repository top level or the key is unset
+"""
+def ReadRepositoryConfig(path, key):
+    dirs = ReadGitDirs(path)
+    if dirs is None:
+        return None
+    top_level, _, common_dir = dirs
+
+    # Inside a git dir there is no top level to compare with (git fails, so path is used)
+    if top_level is not None and os.path.realpath(top_level) != path:
+        return ""
+
+    config = ReadGitConfig(common_dir)
+    if config is None:
+        return None
+
+    # Only sections and keys are case insensitive
+    parts = key.split(".")
+    parts[0] = parts[0].lower()
+    parts[-1] = parts[-1].lower()
+    return config.get(".".join(parts), "")
+
+"""
+Equivalent to `git rev-parse HEAD`
+"""
+def ReadHeadCommit(path):
+    dirs = ReadGitDirs(path)
+    if dirs is None:
+        return None
+    _, git_dir, common_dir = dirs
+    _, commit = __ResolveRef(git_dir, common_dir, "HEAD")
+    return commit
+
+"""
+Equivalent to `git rev-parse --abbrev-ref HEAD` ("HEAD" when detached)
+"""
+def ReadHeadBranch(path):
+    dirs = ReadGitDirs(path)
+    if dirs is None:
+        return None
+    _, git_dir, common_dir = dirs
+    symbolic_target, commit = __ResolveRef(git_dir, common_dir, "HEAD")
+    if commit is None:
+        return None
+    if symbolic_target is None:
+        return "HEAD"
+    if not symbolic_target.startswith("refs/heads/"):
+        # Other namespaces have their own abbreviation rules
+        return None
+    return symbolic_target[len("refs/heads/"):]
+
+"""
+Equivalent to `git remote show` (sorted remote names, one per line)
+"""
+def ReadRemotes(path):
+    dirs = ReadGitDirs(path)
+    if dirs is None:
+        return None
+    _, git_dir, common_dir = dirs
+    for legacy_dir in ("remotes", "branches"):
+        legacy_dir = os.path.join(common_dir, legacy_dir)
+        if os.path.isdir(legacy_dir) and len(os.listdir(legacy_dir)) != 0:
+            # Legacy remote definitions
+            return None
+
+    config = ReadGitConfig(common_dir)
+    if config is None:
+        return None
+
+    remotes = set()
+    for key in config:
+        if key.startswith("remote.") and key.endswith(".url"):
+            remotes.add(key[len("remote."):-len(".url")])
+    return "\n".join(sorted(remotes))
+
+"""
+Identify one clone of the repository whose common dir is common_dir
+Changes when the git dir is created again (i.e. removed and re-cloned), but not
+ on fetches, commits or checkouts (git never rewrites the description file)
+"""
+def ReadCloneStamp(common_dir):
+    try:
+        common_dir_stat = os.stat(common_dir)
+        try:
+            created = os.stat(os.path.join(common_dir, "description"))
+        except FileNotFoundError:
+            created = os.stat(os.path.join(common_dir, "objects"))
+    except OSError:
+        return None
+    return [common_dir_stat.st_ino, created.st_ino, created.st_mtime_ns]
@@ -1,4 +1,5 @@
 import kconfiglib
+from data.common import WriteIfChanged
 from dataclasses import dataclass
 
 @dataclass
@@ -180,11 +181,12 @@ class Node:
 
 def create_kconfigs(file_list : list[ConfigFile]):
     for file in file_list:
-        with open(file.filename, "w") as f:
-            for menu in file.menu_sources:
-                f.write(f'menu "{menu.menu_name}"\n\n')
-                f.write(f'source "{menu.source_file}"\n')
-                f.write(f'\nendmenu\n')
+        contents = ""
+        for menu in file.menu_sources:
+            contents += f'menu "{menu.menu_name}"\n\n'
+            contents += f'source "{menu.source_file}"\n'
+            contents += f'\nendmenu\n'
+        WriteIfChanged(file.filename, contents)
 
 if __name__ == "__main__":
     b = "/home/dir/" 
@@ -1,17 +1,209 @@
-# Faster load strategy different 
+# Faster load strategy different
 
 # First go get on all files the configs.json directly from gitlab API
 # (proably after expand)
 
-# Call on all repo paths the clone as it was 
+# Call on all repo paths the clone as it was
 
 
 import os
 import re
-import json 
+import json
+import base64
+import threading
+import http.client
+from time import sleep
+from hashlib import sha1
+from typing import Dict, List, Tuple
+from urllib.parse import quote, urljoin, urlsplit
 
 from data.print import *
-from processes.process import LaunchProcess
+from data.paths import GetBasePaths, JoinPaths
+from data.json import load_json_file, dump_json_file_atomic
+from processes.filesystem import CreateDirectory
+from processes.process import WORK_QUEUE
+from processes.progress_bar import PrintProgressBar
+
+# Concurrent requests to the same host (GitLab/GitHub rate limit aggressive clients)
+DEFAULT_PER_HOST_LIMIT = 8
+DEFAULT_RETRIES = 3
+# Seconds before the first retry, doubled on each one
+DEFAULT_BACKOFF = 0.5
+DEFAULT_TIMEOUT = 30
+MAX_REDIRECTS = 5
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class HTTP_POOL():
+    """
+    Keep-alive HTTP(S) connections, reused across requests and threads
+    At most per_host_limit requests run against the same host at the same time.
+    Connection errors and transient statuses (RETRY_STATUSES) are retried with
+    exponential backoff (or what the server asks for in Retry-After)
+    """
+    def __init__(self, per_host_limit=DEFAULT_PER_HOST_LIMIT, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, timeout=DEFAULT_TIMEOUT):
+        self.per_host_limit = max(1, per_host_limit)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        self.lock = threading.Lock()
+        # (scheme, host) -> idle connections
+        self.idle = {}
+        # (scheme, host) -> slots for concurrent requests
+        self.slots = {}
+        self.stats = {"requests": 0, "connections": 0, "retries": 0}
+
+    def _GetSlots(self, host_key):
+        with self.lock:
+            if host_key not in self.slots:
+                self.slots[host_key] = threading.BoundedSemaphore(self.per_host_limit)
+            return self.slots[host_key]
+
+    def _GetConnection(self, host_key):
+        with self.lock:
+            idle = self.idle.get(host_key)
+            if idle:
+                return idle.pop()
+            self.stats["connections"] += 1
+
+        scheme, host = host_key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, timeout=self.timeout)
+        return http.client.HTTPConnection(host, timeout=self.timeout)
+
+    def _ReleaseConnection(self, host_key, connection, reusable):
+        if not reusable:
+            connection.close()
+            return
+        with self.lock:
+            self.idle.setdefault(host_key, []).append(connection)
+
+    def _RetryDelay(self, attempt, retry_after=None):
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * (2 ** attempt)
+
+    def _Send(self, method, url, headers):
+        """
+        Single request (with retries), without following redirects
+        Returns (status, response headers, body)
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported URL scheme in {url}")
+        host_key = (parts.scheme, parts.netloc)
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+
+        attempt = 0
+        while True:
+            with self._GetSlots(host_key):
+                connection = self._GetConnection(host_key)
+                try:
+                    connection.request(method, target, headers=headers)
+                    response = connection.getresponse()
+                    body = response.read()
+                except (OSError, http.client.HTTPException) as ex:
+                    connection.close()
+                    # A kept-alive connection may have been closed by the server
+                    if attempt >= self.retries:
+                        raise ConnectionError(f"{method} {url} failed after {attempt + 1} attempts: {ex}")
+                    error = ex
+                    response = None
+                else:
+                    self._ReleaseConnection(host_key, connection, not response.will_close)
+
+            with self.lock:
+                self.stats["requests"] += 1
+
+            if response is not None and (response.status not in RETRY_STATUSES or attempt >= self.retries):
+                return response.status, response.headers, body
+
+            delay = self._RetryDelay(attempt, None if response is None else response.headers.get("Retry-After"))
+            reason = error if response is None else f"status {response.status}"
+            logging.debug(f"Retrying {method} {url} in {delay}s ({reason})")
+            with self.lock:
+                self.stats["retries"] += 1
+            attempt += 1
+            sleep(delay)
+
+    def Request(self, url, headers=None, method="GET"):
+        """
+        Request url, following redirects
+        Returns (status, response headers, body)
+        """
+        headers = {} if headers is None else headers
+        for _ in range(MAX_REDIRECTS + 1):
+            status, response_headers, body = self._Send(method, url, headers)
+            location = response_headers.get("Location")
+            if status not in REDIRECT_STATUSES or location is None:
+                return status, response_headers, body
+            url = urljoin(url, location)
+        raise ConnectionError(f"Too many redirects for {url}")
+
+    def Close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle = {}
+
+# Shared by all requests that don't provide their own pool
+http_pool = HTTP_POOL()
+
+
+class CONFIGS_CACHE():
+    """
+    Remote configs.json already fetched, one file per project and ref, with the
+    validators (ETag / Last-Modified) to only download them again when they changed
+    """
+    def __init__(self, path=None):
+        if path is None:
+            path = JoinPaths(GetBasePaths()["configs"], "project_cache", "remote_configs")
+        self.path = path
+        self.stats = {"hits": 0, "misses": 0, "stale": 0}
+        self.lock = threading.Lock()
+
+    def _GetEntryPath(self, project_path, ref):
+        key = f"{normalize_project_path(project_path)}@{ref}"
+        return JoinPaths(self.path, sha1(key.encode()).hexdigest() + ".json")
+
+    def Get(self, project_path, ref):
+        """
+        Returns the cached entry ({"configs", "etag", "last modified"}) or None
+        """
+        entry = load_json_file(self._GetEntryPath(project_path, ref), {})
+        if "configs" not in entry:
+            return None
+        return entry
+
+    def Put(self, project_path, ref, configs, etag=None, last_modified=None):
+        entry = {
+            "project": normalize_project_path(project_path),
+            "ref": ref,
+            "etag": etag,
+            "last modified": last_modified,
+            "configs": configs,
+        }
+        CreateDirectory(self.path)
+        dump_json_file_atomic(entry, self._GetEntryPath(project_path, ref))
+
+    def Count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+configs_cache = None
+
+def _GetConfigsCache():
+    global configs_cache
+    if configs_cache is None:
+        configs_cache = CONFIGS_CACHE()
+    return configs_cache
 
 
 def normalize_project_path(project_input: str) -> str:
@@ -61,14 +253,13 @@ def extract_dependencies_from_json(data_json):
         api_paths = list(data_json["API"].keys())
     return dependencies_paths + api_paths
 
-import tempfile
-
-from urllib.parse import quote
+def _get_api_url_and_auth(project_path: str, branch: str = "main") -> Tuple[str, Dict[str, str]]:
+    """
+    Determines the API URL and request headers based on the host.
+    GITLAB_API_URL / GITHUB_API_URL point at self-hosted instances (or a local stand-in).
+    """
 
-def _get_api_url_and_auth(project_path: str, branch: str = "main") -> Tuple[str, str]:
-    """Determines the API URL and curl header based on the host."""
-    
-    project_path_normalized = normalize_project_path(project_path) 
+    project_path_normalized = normalize_project_path(project_path)
 
     project_enc = quote(project_path_normalized, safe="")
     file_path_enc = quote("configs/configs.json", safe="")
@@ -78,6 +269,8 @@ def _get_api_url_and_auth(project_path: str, branch: str = "main") -> Tuple[str,
     # Configuration file path within the repository
     config_file_path = "configs/configs.json"
 
+    headers = {"User-Agent": "ProjectBase"}
+
     if "gitlab" in project_path:
         # Construct API raw URL
         gitlab_token = os.environ.get("GITLAB_TOKEN")
@@ -85,67 +278,90 @@ def _get_api_url_and_auth(project_path: str, branch: str = "main") -> Tuple[str,
             raise RuntimeError(
                 "GitLab token not defined. Please set the environment variable GITLAB_TOKEN."
             )
-    
+
+        api_url = os.environ.get("GITLAB_API_URL", "https://gitlab.com/api/v4").rstrip("/")
         url = (
-            f"https://gitlab.com/api/v4/projects/{project_enc}"
+            f"{api_url}/projects/{project_enc}"
             f"/repository/files/{file_path_enc}/raw?ref={branch_enc}"
         )
-        auth_header = f'--header "PRIVATE-TOKEN: $GITLAB_TOKEN"'
-        return url, auth_header
-        
+        headers["PRIVATE-TOKEN"] = gitlab_token
+        return url, headers
+
     elif "github" in project_path:
         # GitHub API uses owner/repo structure and file content API
         # We assume the normalized path is 'owner/repo'
-        url = f"https://api.github.com/repos/{repo_path}/contents/{config_file_path}?ref={branch}"
-        # GitHub uses Authorization header from $GITHUB_TOKEN
-        auth_header = f'--header "Authorization: token $GITHUB_TOKEN"'
-        return url, auth_header
+        api_url = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+        url = f"{api_url}/repos/{project_path_normalized}/contents/{config_file_path}?ref={branch_enc}"
+        # Ask for the raw file instead of the base64 encoded JSON description
+        headers["Accept"] = "application/vnd.github.raw"
+        github_token = os.environ.get("GITHUB_TOKEN")
+        if github_token:
+            headers["Authorization"] = f"token {github_token}"
+        return url, headers
 
     raise ValueError(f"Unsupported Git host in path: {project_path_normalized}")
 
-def get_project_config_from_git_api(project_path, branch="main"):
+def _parse_config_response(project_path, body):
+    data = json.loads(body)
+    # GitHub JSON description of the file (when the raw content isn't served)
+    if "github" in project_path and type(data) == type({}) and "content" in data and data.get("encoding") == "base64":
+        data = json.loads(base64.b64decode(data["content"]).decode("utf-8"))
+    return data
+
+def get_project_config_from_git_api(project_path, branch="main", pool=None, cache=None, offline=False):
     """
     Fetch configs/configs.json for `project_path` via Git API (GitLab/GitHub).
+    What was fetched before is only downloaded again if it changed upstream (a
+    conditional request answered with 304 uses the cached configs).
+    Offline, only the cache is used.
+    Returns {} when the file can't be fetched or parsed
     """
-    tmp = tempfile.NamedTemporaryFile(prefix="cfg_", suffix=".json", delete=False)
-    output_file = tmp.name
-    tmp.close()
+    if pool is None:
+        pool = http_pool
+    if cache is None:
+        cache = _GetConfigsCache()
 
-    try:
-        url, auth_header = _get_api_url_and_auth(project_path, branch)
+    cached = cache.Get(project_path, branch)
 
-        # Build and run curl
-        command = f'curl -sS -L {auth_header} "{url}" --output "{output_file}"'
-        LaunchProcess(command)
+    if offline:
+        if cached is None:
+            PrintError(f"No cached configs for {project_path!r} ({branch}) to use offline")
+            cache.Count("misses")
+            return {}
+        cache.Count("hits")
+        return cached["configs"]
 
-        # Load JSON (GitHub API returns file content base64 encoded, GitLab returns raw)
-        data = {}
-        try:
-            with open(output_file, "r", encoding="utf-8") as f:
-                raw_content = f.read()
-            
-            if "github" in url.lower() and '"content"' in raw_content:
-                # GitHub JSON response needs decoding
-                github_api_data = json.loads(raw_content)
-                base64_content = github_api_data.get("content", "")
-                decoded_content = base64.b64decode(base64_content).decode("utf-8")
-                data = json.loads(decoded_content)
-            else:
-                # GitLab (or raw content direct from GitHub's redirect)
-                data = json.loads(raw_content)
+    url, headers = _get_api_url_and_auth(project_path, branch)
 
-        except Exception as e:
-            # helpful debug output
-            PrintError(f"Failed to process API response for {project_path!r}: {e} {url}\n{command}")
-            data = {}
+    if cached is not None:
+        if cached["etag"] is not None:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last modified"] is not None:
+            headers["If-Modified-Since"] = cached["last modified"]
+
+    try:
+        status, response_headers, body = pool.Request(url, headers)
+        if status == 304 and cached is not None:
+            cache.Count("hits")
+            return cached["configs"]
+        if status != 200:
+            raise ConnectionError(f"HTTP {status}")
 
-        return data
+        data = _parse_config_response(project_path, body)
+
+    except Exception as e:
+        if cached is not None:
+            PrintWarning(f"Could not fetch configs for {project_path!r} ({e}), using cached configs")
+            cache.Count("stale")
+            return cached["configs"]
+        # helpful debug output
+        PrintError(f"Failed to process API response for {project_path!r}: {e} {url}")
+        return {}
+
+    cache.Count("misses")
+    cache.Put(project_path, branch, data, response_headers.get("ETag"), response_headers.get("Last-Modified"))
+    return data
 
-    finally:
-        # always try to remove the temporary file
-        if os.path.exists(output_file):
-                os.remove(output_file)
-   
 
 def get_all_project_dependencies_single_threaded(project_path, checked_dependencies=None, to_check_dependencies=None):
     if checked_dependencies is None:
@@ -183,88 +399,71 @@ def get_all_project_dependencies_single_threaded(project_path, checked_dependenc
     return checked_dependencies, queue
 
 
-import concurrent.futures
-import threading
-from typing import List, Tuple, Set
-import queue
-
-from data.settings import Settings
-
-
-def get_all_project_dependencies(project_path, checked_dependencies=None, to_check_dependencies=None, max_workers=15):
+def get_all_project_dependencies(project_path, checked_dependencies=None, to_check_dependencies=None,
+                                 max_workers=DEFAULT_PER_HOST_LIMIT, branch="main", pool=None, cache=None, offline=False):
     """
     Discovers and gathers configurations for the entire dependency graph.
-    Uses parallel API calls when multi-threading is enabled, or falls back
-    to the single-threaded implementation when Settings["single thread"] is set.
+    Each project is fetched as soon as it is discovered (no waiting for the rest
+    of its level), in a WORK_QUEUE (sequential with Settings["single thread"]).
+    At most max_workers requests run against the same host at the same time.
+    Offline, the graph is resolved only from the configs cached by previous loads.
 
     Returns:
         List[Tuple[str, dict]]: List of (project_path, config_data) for all discovered projects.
     """
-    if Settings.get("single thread", False):
-        result_deps, _ = get_all_project_dependencies_single_threaded(
-            project_path, checked_dependencies, to_check_dependencies
-        )
-        return result_deps
-
     if checked_dependencies is None:
         checked_dependencies = []
     if to_check_dependencies is None:
         to_check_dependencies = []
+    if pool is None:
+        pool = HTTP_POOL(per_host_limit=max_workers)
+    if cache is None:
+        cache = _GetConfigsCache()
 
-    queue = [project_path] + list(to_check_dependencies)
-    visited = set(queue)
+    # The same project may be referenced by different URL forms (ssh/https)
+    visited = set(normalize_project_path(proj) for proj in checked_dependencies)
+    visited_lock = threading.Lock()
 
     # Store results: {project_path: config_data}
     repo_configs = {}
 
-    while queue:
-        current_batch = queue
-        queue = []
-
-        # Ensure thread safety for shared data if necessary,
-        # but for this logic, each thread only returns its results.
-
-        def process_project(proj):
-            # The result will be (project_path, config_data, new_dependency_configs)
-            if proj in repo_configs or proj in checked_dependencies: # Use repo_configs as main check
-                return None, None, []
-
-            data = get_project_config_from_git_api(proj)
-
-                # Extract all dependency config dicts from the found data
-            new_dependency_configs = extract_dependencies_from_json(data)
+    def __Discover(projects):
+        new_projects = []
+        with visited_lock:
+            for proj in projects:
+                key = normalize_project_path(proj)
+                if key not in visited:
+                    visited.add(key)
+                    new_projects.append(proj)
+        return new_projects
+
+    def __FetchProject(proj):
+        try:
+            data = get_project_config_from_git_api(proj, branch, pool, cache, offline)
+        except Exception as e:
+            # Print and skip this project on failure
+            PrintError(f"Error fetching config for '{proj}': {e}")
+            data = {}
 
-                # Append to checked list (note: this list is no longer strictly necessary
-                # if we use repo_configs and visited)
+        with visited_lock:
+            repo_configs[proj] = data
             checked_dependencies.append(proj)
 
-            return proj, data, new_dependency_configs
+        for dependency in __Discover(extract_dependencies_from_json(data)):
+            fetch_queue.Submit(dependency)
 
+    def __PrintFetchProgress():
+        PrintProgressBar(fetch_queue.finished, fetch_queue.submitted, prefix='Fetching configs:',
+                         suffix=f'Fetched {fetch_queue.finished}/{fetch_queue.submitted} configs')
 
-        # Process batch in parallel
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # We map the function to the current batch of project paths
-            results = list(executor.map(process_project, current_batch))
+    fetch_queue = WORK_QUEUE(__FetchProject, print_callback=__PrintFetchProgress)
+    fetch_queue.Run([(proj,) for proj in __Discover([project_path] + list(to_check_dependencies))])
 
-            # Collect results and new dependencies
-            for proj, config_data, new_dependency_configs in results:
-                if proj and config_data is not None:
-                    # 1. Store the found configuration data
-                    repo_configs[proj] = config_data
-
-                # 2. Collect paths of *new* dependencies to queue for the next batch
-                for dep_config in new_dependency_configs:
-                    # We assume 'url' is the path we need to normalize and check against 'visited'
-                    dep_path = dep_config.get("url")
-                    if dep_path and dep_path not in visited:
-                        visited.add(dep_path)
-                        queue.append(dep_path) # Queue the path for the next API call
+    logging.info(f"Fetched {len(repo_configs)} configs: {pool.stats}, cache {cache.stats}")
+    PrintInfo(f"Checked dependencies {len(repo_configs)}")
 
     # Convert the results dictionary back into the required list format
     final_results = [
         (path, config) for path, config in repo_configs.items()
     ]
-
-    print("Checked dependencies")
-    print(len(final_results))
-    return final_results # Returns List of (path, config_data)
\ No newline at end of file
+    return final_results # Returns List of (path, config_data)
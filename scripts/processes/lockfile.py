@@ -0,0 +1,82 @@
+import os
+import logging
+
+from data.settings import Settings
+from data.json import load_json_file, dump_json_file_atomic
+from data.paths import JoinPaths
+from data.print import *
+from processes.git_operations import GitGetHeadCommit
+
+"""
+The lockfile records what each repository of the last load resolved to:
+{
+    "root url": "<url>",
+    "repositories": {
+        "<repo ID>": {
+            "url": "<url>",
+            "commitish": <commitish imposed on the repository>,
+            "commit": "<commit checked out>"
+        }
+    }
+}
+A locked load (--locked) checks new repositories out at the recorded commits
+ instead of resolving their branches again
+"""
+
+def GetLockfilePath():
+    if "lockfile" in Settings and Settings["lockfile"] is not None:
+        return os.path.abspath(Settings["lockfile"])
+    return JoinPaths(Settings["paths"]["project configs"], "project.lock")
+
+def IsLockedLoad():
+    return "locked" in Settings and Settings["locked"] is True
+
+"""
+Commits of the lockfile indexed by URL, or None if there is no usable lockfile
+"""
+def LoadLockedCommits():
+    lockfile_path = GetLockfilePath()
+    lock = load_json_file(lockfile_path, {})
+    if lock.get("root url") != Settings["url"] or type(lock.get("repositories")) != type({}):
+        PrintWarning(f"No lockfile for {Settings["url"]} at {lockfile_path}, branches are resolved as usual")
+        return None
+
+    locked_commits = {}
+    for repo_id, entry in lock["repositories"].items():
+        locked_commits[entry["url"]] = {"repo ID": repo_id, "commitish": entry["commitish"], "commit": entry["commit"]}
+    return locked_commits
+
+"""
+The commit a repository is locked to, if it is locked with the same commitish
+"""
+def GetLockedCommit(locked_commits, imposed_configs):
+    if locked_commits is None:
+        return None
+    entry = locked_commits.get(imposed_configs["url"])
+    if entry is None:
+        PrintWarning(f"{imposed_configs["url"]} is not in the lockfile, resolving it as usual")
+        return None
+    if entry["commitish"] != imposed_configs["commitish"]:
+        PrintWarning(f"{imposed_configs["url"]} is locked for {entry["commitish"]} instead of {imposed_configs["commitish"]}, resolving it as usual")
+        return None
+    return entry["commit"]
+
+"""
+Record the commit each repository has checked out, unless that is what the
+ lockfile already records
+"""
+def SaveLockfile(repositories):
+    lock = {"root url": Settings["url"], "repositories": {}}
+    for repo_id, repository in repositories.items():
+        lock["repositories"][repo_id] = {
+            "url": repository["url"],
+            "commitish": repository["commitish"],
+            "commit": GitGetHeadCommit(repository["repo source"]),
+        }
+
+    lockfile_path = GetLockfilePath()
+    if load_json_file(lockfile_path, {}) == lock:
+        return
+
+    dump_json_file_atomic(lock, lockfile_path)
+    logging.info(f"Saved lockfile at {lockfile_path}")
@@ -1,15 +1,15 @@
 import os
 import sys
 import pty
+import shlex
 import traceback
 import threading
-from collections import namedtuple
+from collections import namedtuple, deque
 from time import time
 import subprocess
 
-from time import sleep
 from threading import Thread, Lock
-from data.settings import Settings, ErrorCheckLogs
+from data.settings import Settings, ErrorCheckLogs, GetMaxThreads
 from data.colors import ColorFormat, Colors
 from processes.progress_bar import PrintProgressBar
 from data.common import *
@@ -19,6 +19,7 @@ from processes.filesystem import WriteFile
 #                           PROCESS OPERATIONS
 
 POLL_INTERVAL     = 0.05   # seconds between alive checks
+PROGRESS_INTERVAL = 0.1    # minimum seconds between progress redraws while waiting
 KILL_SETTLE_TIME  = 0.5    # seconds to wait after killing processes
 DEFAULT_WAIT_SECS = 30     # default "wait a bit" duration (option 0)
 
@@ -44,6 +45,12 @@ thread_return = {}
 def _register_process(proc):
     with _process_lock:
         active_processes[threading.get_ident()] = proc
+        if threading.get_ident() in killed_threads:
+            # Everything was stopped before this process started
+            try:
+                os.killpg(proc.pid, 9)
+            except OSError:
+                pass
 
 def _unregister_process():
     with _process_lock:
@@ -186,15 +193,22 @@ def _handle_timeout(timeout_count, auto_policy, policy_initial_count,
     else:
         return "wait", choice, auto_policy, policy_initial_count
 
-def _wait_for_threads(threads, args, max_delay, print_function=None, print_arguments=None):
-    """Wait for multiple threads with timeout handling. Used by multi-thread path."""
+def _wait_for_threads(batch, args, max_delay, print_function=None, print_arguments=None):
+    """
+    Wait for a TASK_BATCH with timeout handling. Used by multi-thread path.
+    Wakes up when tasks finish, when the next task can time out or to redraw progress
+     (at most every PROGRESS_INTERVAL), instead of polling.
+    A task's time only counts once it starts running (it may be queued for a free worker).
+    """
     if print_arguments is None:
         print_arguments = {}
 
-    threads_alive = len(threads)
-    progress = 0
-    prev_alive = threads_alive
+    tasks = batch.tasks
+    finished = 0
+    printed = 0
+    last_print = 0
     initial_timestamp = time()
+    next_timeout_check = None if max_delay is None else initial_timestamp + max_delay
     timeout_count = 0
     auto_policy = None
     policy_initial_count = 0
@@ -203,44 +217,72 @@ def _wait_for_threads(threads, args, max_delay, print_function=None, print_argum
         if print_function is not None:
             print_function(**print_arguments)
         else:
-            done = len(threads) - threads_alive
-            PrintProgressBar(done, len(threads), prefix='Running:',
-                             suffix=f'Threads finished {done}/{len(threads)}')
-
-    while threads_alive != progress:
-        threads_alive = len(threads)
-        for thread in threads:
-            if not thread.is_alive():
-                threads_alive -= 1
-        if prev_alive != threads_alive:
-            print_progress()
-            prev_alive = threads_alive
-
-        if max_delay is not None and time() - initial_timestamp > max_delay:
-            timeout_count += 1
-            alive_descriptions = [str(args[i]) for i in range(len(threads)) if threads[i].is_alive()]
-
-            action, new_delay, auto_policy, policy_initial_count = _handle_timeout(
-                timeout_count, auto_policy, policy_initial_count, alive_descriptions)
-
-            if action == "stop_all":
-                _kill_all_active_processes()
-                sleep(KILL_SETTLE_TIME)
-                break
-            elif action == "indefinite":
-                max_delay = None
-            else:  # "wait"
-                max_delay = new_delay
-                initial_timestamp = time()
+            PrintProgressBar(finished, len(tasks), prefix='Running:',
+                             suffix=f'Threads finished {finished}/{len(tasks)}')
 
+    while finished != len(tasks):
+        now = time()
+        if printed != finished and now - last_print >= PROGRESS_INTERVAL:
+            print_progress()
+            printed = finished
+            last_print = now
         FlushthreadLog()
-        sleep(POLL_INTERVAL)
 
+        if next_timeout_check is not None and now >= next_timeout_check:
+            overdue = False
+            next_timeout_check = now + max_delay
+            for task in tasks:
+                if task.IsRunning():
+                    deadline = max(task.started, initial_timestamp) + max_delay
+                    overdue = overdue or now > deadline
+                    next_timeout_check = min(next_timeout_check, deadline)
+
+            if overdue:
+                timeout_count += 1
+                alive_descriptions = [str(args[i]) for i in range(len(tasks)) if tasks[i].IsRunning()]
+
+                action, new_delay, auto_policy, policy_initial_count = _handle_timeout(
+                    timeout_count, auto_policy, policy_initial_count, alive_descriptions)
+
+                if action == "stop_all":
+                    # Work still queued runs, but its processes are killed as soon as they start
+                    for task in tasks:
+                        task.killed = True
+                    _kill_all_active_processes()
+                    _wait_for_stopped_tasks(batch)
+                    break
+                elif action == "indefinite":
+                    max_delay = None
+                    next_timeout_check = None
+                else:  # "wait"
+                    max_delay = new_delay
+                    initial_timestamp = time()
+                    next_timeout_check = initial_timestamp + max_delay
+                continue
+
+        # Sleep until something finishes, the next task can time out or progress is due
+        wake_at = next_timeout_check
+        if printed != finished:
+            progress_at = last_print + PROGRESS_INTERVAL
+            wake_at = progress_at if wake_at is None else min(wake_at, progress_at)
+        finished = batch.WaitForChange(finished, None if wake_at is None else max(0, wake_at - time()))
+
+    finished = batch.finished
     print_progress()
 
+def _wait_for_stopped_tasks(batch):
+    """Give stopped tasks time to finish, for as long as they keep finishing."""
+    finished = batch.finished
+    while finished != len(batch.tasks):
+        now_finished = batch.WaitForChange(finished, KILL_SETTLE_TIME)
+        FlushthreadLog()
+        if now_finished == finished:
+            break
+        finished = now_finished
+
 def _wait_for_single_worker(worker, run_arg, max_delay, auto_policy, policy_initial_count):
     """
-    Wait for a single worker thread with timeout handling. Used by single-thread path.
+    Wait for a single worker (POOL_TASK) with timeout handling. Used by single-thread path.
     Returns: (stop_all, auto_policy, policy_initial_count)
     """
     initial_timestamp = time()
@@ -248,30 +290,35 @@ def _wait_for_single_worker(worker, run_arg, max_delay, auto_policy, policy_init
     timeout_count = 0
     stop_all = False
 
-    while worker.is_alive():
-        if delay is not None and time() - initial_timestamp > delay:
-            timeout_count += 1
-            alive_descriptions = [str(run_arg)]
-
-            action, new_delay, auto_policy, policy_initial_count = _handle_timeout(
-                timeout_count, auto_policy, policy_initial_count,
-                alive_descriptions, single_thread=True)
-
-            if action == "stop_all":
-                _kill_all_active_processes()
-                stop_all = True
-                sleep(KILL_SETTLE_TIME)
-                break
-            elif action == "stop_current":
-                _kill_all_active_processes()
-                sleep(KILL_SETTLE_TIME)
-                break
-            elif action == "indefinite":
-                delay = None
-            else:  # "wait"
-                delay = new_delay
-                initial_timestamp = time()
-        sleep(POLL_INTERVAL)
+    while True:
+        if delay is None:
+            timeout = None
+        else:
+            timeout = max(0, initial_timestamp + delay - time())
+        if worker.done.wait(timeout):
+            break
+
+        timeout_count += 1
+        alive_descriptions = [str(run_arg)]
+
+        action, new_delay, auto_policy, policy_initial_count = _handle_timeout(
+            timeout_count, auto_policy, policy_initial_count,
+            alive_descriptions, single_thread=True)
+
+        if action == "stop_all":
+            _kill_all_active_processes()
+            stop_all = True
+            worker.done.wait(KILL_SETTLE_TIME)
+            break
+        elif action == "stop_current":
+            _kill_all_active_processes()
+            worker.done.wait(KILL_SETTLE_TIME)
+            break
+        elif action == "indefinite":
+            delay = None
+        else:  # "wait"
+            delay = new_delay
+            initial_timestamp = time()
 
     return stop_all, auto_policy, policy_initial_count
 
@@ -286,9 +333,11 @@ def __PrintRunOnFoldersProgress(paths):
     else:
         PrintProgressBar(current_progress, total_repos, prefix='Running:', suffix=f'Done on {current_progress}/{total_repos} folders')
 
-# Wrapper for threads
-def ThreadWrapper(run_callback, run_arg):
-    global thread_return
+"""
+Run run_callback(*run_arg), handling its exceptions
+Returns whether it ran successfully
+"""
+def _RunCallback(run_callback, run_arg):
     try:
         run_callback(*run_arg)
         return_val = True
@@ -305,7 +354,12 @@ def ThreadWrapper(run_callback, run_arg):
         # Ctrl+C will create exceptions on all threads, so those logs must be cleared and not printed
         AddTothreadLog(f"{ex}\n{"="*30}\nStack trace:\n\n{traceback.format_exc()}{"="*30}\n")
         return_val = False
-    thread_return[GetThreadId()] = return_val
+    return return_val
+
+# Wrapper for threads
+def ThreadWrapper(run_callback, run_arg):
+    global thread_return
+    thread_return[GetThreadId()] = _RunCallback(run_callback, run_arg)
 
 """
 Run run_callback in a separate thread for each argument in run_args (which is also passed to that thread)
@@ -318,23 +372,165 @@ def RunInThreads(run_callback, run_args):
         thread.start()
     return threads
 
+"""
+Maximum amount of threads work runs in (see GetMaxThreads)
+"""
+def GetMaxWorkers():
+    return GetMaxThreads()
+
+"""
+Threads that are kept alive and reused between operations, instead of starting
+ a thread per operation. At most GetMaxWorkers() of them run at the same time
+"""
+class WORKER_POOL():
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.tasks     = deque()
+        self.threads   = 0
+        self.idle      = 0
+        self.local     = threading.local()
+
+    """
+    Whether the calling thread is one of the pool's
+    Work started from a pool thread must not wait on the pool (it could be full)
+    """
+    def InWorker(self):
+        return getattr(self.local, "in_pool", False)
+
+    """
+    Queue function(*args) to run in one of the pool's threads
+    """
+    def Submit(self, function, *args):
+        with self.condition:
+            self.tasks.append((function, args))
+            if len(self.tasks) > self.idle and self.threads < GetMaxWorkers():
+                self.threads += 1
+                Thread(target=self.__Worker, daemon=True).start()
+            self.condition.notify()
+
+    def __Worker(self):
+        self.local.in_pool = True
+        while True:
+            with self.condition:
+                self.idle += 1
+                while len(self.tasks) == 0:
+                    self.condition.wait()
+                self.idle -= 1
+
+                if self.threads > GetMaxWorkers():
+                    # The limit was lowered, leave the task to the remaining threads
+                    self.threads -= 1
+                    self.condition.notify()
+                    return
+
+                function, args = self.tasks.popleft()
+
+            try:
+                function(*args)
+            except BaseException as ex:
+                # Tasks handle their own errors, never let one take the thread down
+                logging.error(f"Worker pool task failed: {ex}\n{traceback.format_exc()}")
+
+worker_pool = WORKER_POOL()
+
+"""
+One run_callback(*run_arg) of RunInThreadsWithProgress, running in the worker pool
+"""
+class POOL_TASK():
+    def __init__(self, run_callback, run_arg, batch=None):
+        self.run_callback = run_callback
+        self.run_arg      = run_arg
+        self.batch        = batch
+        self.started      = None
+        self.result       = None
+        # Not started yet when everything was stopped: run, but kill its processes
+        self.killed       = False
+        # Dropped without running at all (i.e. Ctrl+C)
+        self.cancelled    = False
+        self.done         = threading.Event()
+
+    def __Finish(self):
+        self.done.set()
+        if self.batch is not None:
+            self.batch.TaskFinished()
+
+    def Run(self):
+        if self.cancelled:
+            self.__Finish()
+            return
+        # Pool threads are reused, a previous kill only applies if this task was stopped too
+        with _process_lock:
+            if self.killed:
+                killed_threads.add(threading.get_ident())
+            else:
+                killed_threads.discard(threading.get_ident())
+        self.started = time()
+        try:
+            self.result = _RunCallback(self.run_callback, self.run_arg)
+        finally:
+            self.__Finish()
+
+    def is_alive(self):
+        return not self.done.is_set()
+
+    def IsRunning(self):
+        return self.started is not None and not self.done.is_set()
+
+"""
+POOL_TASKs that are waited on together: finishing tasks wake up the waiter
+"""
+class TASK_BATCH():
+    def __init__(self, run_callback, run_args):
+        self.condition = threading.Condition()
+        self.finished  = 0
+        self.tasks     = [POOL_TASK(run_callback, run_arg, self) for run_arg in run_args]
+
+    def Submit(self):
+        for task in self.tasks:
+            worker_pool.Submit(task.Run)
+
+    def TaskFinished(self):
+        with self.condition:
+            self.finished += 1
+            self.condition.notify_all()
+
+    """
+    Wait until the amount of finished tasks is no longer finished (or timeout
+     seconds pass, None waits forever). Returns the amount of finished tasks
+    """
+    def WaitForChange(self, finished, timeout=None):
+        with self.condition:
+            if self.finished == finished:
+                self.condition.wait(timeout)
+            return self.finished
+
 """
 Run run_callback with each argument in run_args, in separate threads or
 sequentially if "single thread" mode is on
+Threads come from the worker pool, so at most GetMaxWorkers() run at the same time
 If print_callback is present, it will be called to register the operation progress
 """
 def RunInThreadsWithProgress(run_callback, run_args, max_delay=None, print_callback=None, print_args=None):
     global thread_return
 
-    thread_return.clear()
-    killed_threads.clear()
     if len(run_args) == 0:
         return
 
+    if worker_pool.InWorker():
+        # Already running in the pool, run inline (the caller already handles timeouts)
+        for run_arg in run_args:
+            if not _RunCallback(run_callback, run_arg):
+                raise SlimError("One of the threads errored out with False")
+        return
+
+    thread_return.clear()
+    killed_threads.clear()
+
     PrintProgressBar(0, len(run_args), prefix='Starting...', suffix=f'0/{len(run_args)}')
     ClearThreadLog()
     ToggleThreading(True)
 
+    tasks = []
     try:
         if Settings["single thread"]:
             stop_all = False
@@ -347,8 +543,8 @@ def RunInThreadsWithProgress(run_callback, run_args, max_delay=None, print_callb
                     continue
 
                 killed_threads.clear()
-                worker = Thread(target=ThreadWrapper, args=[run_callback, run_arg], daemon=True)
-                worker.start()
+                worker = POOL_TASK(run_callback, run_arg)
+                worker_pool.Submit(worker.Run)
 
                 stop_all, auto_policy, policy_initial_count = _wait_for_single_worker(
                     worker, run_arg, max_delay, auto_policy, policy_initial_count)
@@ -360,16 +556,24 @@ def RunInThreadsWithProgress(run_callback, run_args, max_delay=None, print_callb
                     done = run_arg_ind + 1
                     PrintProgressBar(done, len(run_args), prefix='Running:',
                                      suffix=f'Work finished {done}/{len(run_args)}')
-                thread_return[run_arg_ind] = thread_return.get(worker.ident, True)
+                thread_return[run_arg_ind] = worker.result if worker.result is not None else True
         else:
-            threads = RunInThreads(run_callback, run_args)
-            _wait_for_threads(threads, run_args, max_delay, print_callback, print_args)
+            batch = TASK_BATCH(run_callback, run_args)
+            tasks = batch.tasks
+            batch.Submit()
+            _wait_for_threads(batch, run_args, max_delay, print_callback, print_args)
+
+            for task_ind, task in enumerate(tasks):
+                if task.result is not None:
+                    thread_return[task_ind] = task.result
 
     except Exception as ex:
         AddTothreadLog(str(ex))
         raise
     except KeyboardInterrupt:
         PrintNotice("Keyboard Interrupt, stopping")
+        for task in tasks:
+            task.cancelled = True
     finally:
         _kill_all_active_processes()
         FlushthreadLog()
@@ -379,6 +583,151 @@ def RunInThreadsWithProgress(run_callback, run_args, max_delay=None, print_callb
         if val is False:
             raise SlimError(f"One of the threads errored out with {val}")
 
+"""
+Run run_callback for each argument submitted, in up to max_workers of the worker
+ pool's threads (or sequentially in the calling thread in "single thread" mode or
+ if inline, i.e. for work that needs the terminal)
+Unlike RunInThreadsWithProgress, work can be submitted while other work is still
+ running (i.e. by run_callback itself) and starts as soon as a worker is free,
+ instead of waiting for the whole batch to finish
+If a run fails, work that hasn't started yet is dropped and Run raises
+"""
+class WORK_QUEUE():
+    def __init__(self, run_callback, max_workers=None, print_callback=None, inline=False):
+        if max_workers is None:
+            max_workers = GetMaxWorkers()
+
+        self.run_callback   = run_callback
+        self.max_workers    = max(1, max_workers)
+        self.print_callback = print_callback
+        # Nested in a pool thread, the pool may have no threads to spare
+        self.inline         = inline or Settings["single thread"] or worker_pool.InWorker()
+
+        self.condition = threading.Condition()
+        self.queue     = deque()
+        self.workers   = 0
+        self.running   = 0
+        self.submitted = 0
+        self.finished  = 0
+        self.failed    = False
+
+    """
+    Queue run_callback(*run_arg). Ignored after a run failed
+    """
+    def Submit(self, *run_arg):
+        with self.condition:
+            if self.failed:
+                return
+
+            self.queue.append(run_arg)
+            self.submitted += 1
+
+            if self.inline:
+                # Run drains the queue itself
+                return
+
+            if len(self.queue) > self.workers - self.running and self.workers < self.max_workers:
+                self.workers += 1
+                worker_pool.Submit(self.__Worker)
+
+    def __Execute(self, run_arg):
+        try:
+            self.run_callback(*run_arg)
+            success = True
+        except ProcessError as ex:
+            AddTothreadLog(str(ex))
+            success = False
+        except Exception as ex:
+            AddTothreadLog(f"{ex}\n{"="*30}\nStack trace:\n\n{traceback.format_exc()}{"="*30}\n")
+            success = False
+
+        with self.condition:
+            self.running  -= 1
+            self.finished += 1
+            if not success:
+                self.__Stop()
+            self.condition.notify_all()
+
+    # Must be called with condition held
+    def __Stop(self):
+        self.failed = True
+        self.submitted -= len(self.queue)
+        self.queue.clear()
+
+    # Runs in a pool thread until the queue is empty, then hands the thread back
+    def __Worker(self):
+        while True:
+            with self.condition:
+                if len(self.queue) == 0:
+                    self.workers -= 1
+                    self.condition.notify_all()
+                    return
+
+                run_arg = self.queue.popleft()
+                self.running += 1
+
+            # Pool threads are reused, a kill from an earlier run doesn't apply to this one
+            with _process_lock:
+                killed_threads.discard(threading.get_ident())
+            self.__Execute(run_arg)
+
+    def __PrintProgress(self):
+        if self.print_callback is not None:
+            self.print_callback()
+        else:
+            PrintProgressBar(self.finished, self.submitted, prefix='Running:',
+                             suffix=f'Work finished {self.finished}/{self.submitted}')
+
+    """
+    Submit each argument in run_args and wait until all work (including work
+     submitted in the meantime) is done
+    """
+    def Run(self, run_args):
+        if not worker_pool.InWorker():
+            with _process_lock:
+                killed_threads.clear()
+            ClearThreadLog()
+            ToggleThreading(True)
+        try:
+            for run_arg in run_args:
+                self.Submit(*run_arg)
+
+            last_finished = -1
+            while True:
+                with self.condition:
+                    if self.inline and len(self.queue) != 0:
+                        run_arg = self.queue.popleft()
+                        self.running += 1
+                    else:
+                        run_arg = None
+                        if len(self.queue) == 0 and self.running == 0 and self.workers == 0:
+                            break
+                        self.condition.wait(POLL_INTERVAL)
+
+                if run_arg is not None:
+                    self.__Execute(run_arg)
+
+                if last_finished != self.finished:
+                    last_finished = self.finished
+                    self.__PrintProgress()
+                if not worker_pool.InWorker():
+                    FlushthreadLog()
+
+        except KeyboardInterrupt:
+            PrintNotice("Keyboard Interrupt, stopping")
+            with self.condition:
+                self.__Stop()
+            _kill_all_active_processes()
+            raise
+        finally:
+            if not worker_pool.InWorker():
+                FlushthreadLog()
+                ToggleThreading(False)
+
+        self.__PrintProgress()
+        if self.failed:
+            raise SlimError("One of the queued operations errored out")
+
 def __RunOnFoldersThreadWrapper(callback, path, arguments = None):
     global operation_lock
     global operation_status
@@ -480,7 +829,7 @@ def SetupLocalEnvVars():
 def GetEnvVarExports():
     return "; ".join(f"export {var}='{val}'" for var, val in GetEnvVars().items())
 
-def _LaunchCommand(command, path=None, interactive=False):
+def _LaunchCommand(command, path=None, interactive=False, input_data=None):
     if path is None:
         path = os.getcwd()
     else:
@@ -532,34 +881,65 @@ def _LaunchCommand(command, path=None, interactive=False):
         else:
             returned["stdout"] = ""
     else:
-        proc = subprocess.Popen(['bash', '-c', command],
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE,
-                                start_new_session=True)
-        _register_process(proc)
-        try:
-            stdout_bytes, stderr_bytes = proc.communicate()
-        finally:
-            _unregister_process()
-
         returned["command"] = command
-        returned["stdout"]  = stdout_bytes.decode('utf-8', errors='replace').rstrip()
-        returned["stderr"]  = stderr_bytes.decode('utf-8', errors='replace').rstrip()
-        returned["code"]    = int(proc.returncode)
-
-        returned["out"] = f"{returned["stdout"]}{returned["stderr"]}"
-        returned["out"] = RemoveNonAscii(RemoveControlCharacters(returned["out"]))
+        _CommunicateProcess(['bash', '-c', command], input_data, returned)
     return returned
 
+# Runs argv (without a TTY) and fills the stdout/stderr/out/code of returned
+def _CommunicateProcess(argv, input_data, returned, cwd=None, env=None):
+    proc = subprocess.Popen(argv,
+                            cwd=cwd,
+                            env=env,
+                            stdin=None if input_data is None else subprocess.PIPE,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE,
+                            start_new_session=True)
+    _register_process(proc)
+    try:
+        stdout_bytes, stderr_bytes = proc.communicate(None if input_data is None else input_data.encode())
+    finally:
+        _unregister_process()
+
+    returned["stdout"]  = stdout_bytes.decode('utf-8', errors='replace').rstrip()
+    returned["stderr"]  = stderr_bytes.decode('utf-8', errors='replace').rstrip()
+    returned["code"]    = int(proc.returncode)
+
+    returned["out"] = f"{returned["stdout"]}{returned["stderr"]}"
+    returned["out"] = RemoveNonAscii(RemoveControlCharacters(returned["out"]))
+
+def _RaiseProcessError(command, path, returned):
+    simple_message = "\t\tProcess returned failure (" + ColorFormat(Colors.Yellow, str(returned["code"])) + "):\n"
+    simple_message += ColorFormat(Colors.Yellow, f"at {path}\n")
+    simple_message += ColorFormat(Colors.Cyan,   f"{command}\n")
+    simple_message += ColorFormat(Colors.Blue,   f"stdout: {returned["stdout"]}\n")
+    simple_message += ColorFormat(Colors.Red,    f"stderr: {returned["stderr"]}\n")
+    simple_message += "Current stack:\n"
+
+    trace_message = ""
+    # Leave out this function and the Launch function calling it
+    trace = traceback.format_stack()[:-2]
+    for Line in trace:
+        Pieces = Line.strip().split("\n")
+        if len(Pieces) == 2:
+            file, callback = Pieces
+            function  = file.split(" in ")[-1]
+            # Line NUMBER, .. # Get NUMBER, .. # Remove .. # Remove ,
+            file_Line = file.lower().split(" line ")[-1].split(" ")[0][:-1]
+            trace_message += function + "() Line " + str(file_Line) + "\n" +ColorFormat(Colors.Green, callback) + "\n"
+        else:
+            trace_message += Line
+    raise ProcessError(simple_message, trace_message, returned)
+
 """
 Changes to the given directory, launches the Command in a forked process and
 returns the { "stdout": "..." , "code": "..."  } dictionary
 """
-def LaunchProcess(command, path=None, interactive=False):
+def LaunchProcess(command, path=None, interactive=False, input_data=None):
     """
     Launch new process
 
     interactive: whether to have an interactive TTY session or just run as a process and return output
+    input_data: text sent to the process' stdin (only when not interactive)
 
     Returns:
         _type_: {"stdout":"<stdout>", "code": return code}
@@ -572,29 +952,78 @@ def LaunchProcess(command, path=None, interactive=False):
     # Allow python scripts to use ProjectBase scripts
     SetupLocalEnvVars()
 
-    returned = _LaunchCommand(command, path, interactive)
+    returned = _LaunchCommand(command, path, interactive, input_data)
 
     if returned["code"] != 0:
-        simple_message = "\t\tProcess returned failure (" + ColorFormat(Colors.Yellow, str(returned["code"])) + "):\n"
-        simple_message += ColorFormat(Colors.Yellow, f"at {path}\n")
-        simple_message += ColorFormat(Colors.Cyan,   f"{command}\n")
-        simple_message += ColorFormat(Colors.Blue,   f"stdout: {returned["stdout"]}\n")
-        simple_message += ColorFormat(Colors.Red,    f"stderr: {returned["stderr"]}\n")
-        simple_message += "Current stack:\n"
-
-        trace_message = ""
-        trace = traceback.format_stack()[:-1]
-        for Line in trace:
-            Pieces = Line.strip().split("\n")
-            if len(Pieces) == 2:
-                file, callback = Pieces
-                function  = file.split(" in ")[-1]
-                # Line NUMBER, .. # Get NUMBER, .. # Remove .. # Remove ,
-                file_Line = file.lower().split(" line ")[-1].split(" ")[0][:-1]
-                trace_message += function + "() Line " + str(file_Line) + "\n" +ColorFormat(Colors.Green, callback) + "\n"
-            else:
-                trace_message += Line
-        raise ProcessError(simple_message, trace_message, returned)
+        _RaiseProcessError(command, path, returned)
+
+    return returned
+
+# Anything bash would interpret (pipes, lists, redirections, expansions, globs, ...)
+SHELL_SYNTAX_CHARACTERS = set("|&;<>()$`\\*?[]{}~!#\n")
+
+"""
+The arguments of a command that needs no shell to run, or None if it does
+ (`git branch -D 'a b'` -> ["git", "branch", "-D", "a b"])
+"""
+def SplitDirectCommand(command):
+    if any(character in SHELL_SYNTAX_CHARACTERS for character in command):
+        return None
+    try:
+        argv = shlex.split(command)
+    except ValueError:
+        return None
+    if len(argv) == 0 or "=" in argv[0]:
+        # Empty or starting with a variable assignment
+        return None
+    return argv
+
+# Environment of direct processes, rebuilt only when the variables it adds change
+direct_env = (None, None)
+direct_env_lock = Lock()
+
+def __GetDirectEnv():
+    global direct_env
+    env_vars = GetEnvVars()
+    with direct_env_lock:
+        if direct_env[0] != env_vars:
+            env = dict(os.environ)
+            env.update(env_vars)
+            direct_env = (env_vars, env)
+        return direct_env[1]
+
+"""
+Same as LaunchProcess, but executes argv directly instead of through bash: no
+ shell to start and no exports/cd/set -e to prepend, which is most of the cost
+ of short commands like git's
+Returns the same dictionary and raises ProcessError the same way
+"""
+def LaunchDirectProcess(argv, path=None, input_data=None):
+    if path is None:
+        path = os.getcwd()
+    elif not os.path.isdir(path):
+        raise Exception(f"No such path ({path}) for executing command ({argv}) ")
+
+    command = shlex.join(argv)
+    returned = {
+        "stdout": "",
+        "stderr": "",
+        "out": "",
+        "code": -1,
+        "path": path,
+        "command": command
+    }
+
+    try:
+        _CommunicateProcess(argv, input_data, returned, cwd=path, env=__GetDirectEnv())
+    except FileNotFoundError:
+        # What bash returns for unknown commands
+        returned["stderr"] = f"{argv[0]}: command not found"
+        returned["out"]    = returned["stderr"]
+        returned["code"]   = 127
+
+    if returned["code"] != 0:
+        _RaiseProcessError(command, path, returned)
 
     return returned
 
@@ -1,6 +1,5 @@
 import os
 import logging
-import pickle
 
 from data.settings import Settings, CLONE_TYPE, UserPromptConfirm
 from data.paths    import GetProjectPaths, JoinPaths
@@ -10,9 +9,13 @@ from data.print    import *
 from data.colors   import ColorFormat, Colors
 
 from processes.repository_configs import ConfigsChanged, ResetConfigsState
-from processes.repository         import LoadRepositories, Setup, Build, GetFullLoad
+from processes.repository         import LoadRepositories, Setup, Build, GetFullLoad, ResetRepoIdCache
+from processes.repository         import ReloadRepositories, SetupReloadedRepositories, RestoreRepositories, GetRootData
+from processes.snapshot           import LoadSnapshot, SaveSnapshot, BuildSnapshot, RemoveSnapshot
+from processes.snapshot           import GetRepositoriesState, GetChangedRepositories
+from processes.command_stamps     import ResetCommandStamps
 from processes.process            import LaunchProcess, LaunchVerboseProcess, LaunchSilentProcess, GetEnvVarExports
-from processes.git_operations     import GetRepositoryUrl
+from processes.git_operations     import GetRepositoryUrl, ResetBareGitIndex
 from processes.run_linter         import CleanLinterFiles
 from processes.filesystem         import CreateParentDirs
 
@@ -31,6 +34,7 @@ class PROJECT(dict):
 
     def ResetRepositories(self):
         self.repositories = {}
+        self.snapshot = None
 
     def init(self):
         self.ResetRepositories()
@@ -50,6 +54,25 @@ class PROJECT(dict):
         # Clean temporary at startup
         LaunchSilentProcess(f"rm -rf {Settings["paths"]["temporary"]}/*")
 
+    """
+    Configs of the root repository, as requested in the command line
+    """
+    def GetRootConfigs(self):
+        root_configs = {"url": Settings["url"]}
+
+        if "commit" in Settings and Settings["commit"] is not None:
+            root_configs["commitish"] = {}
+            root_configs["commitish"]["type"] = "commit"
+            root_configs["commitish"]["commit"] = Settings["commit"]
+        elif "branch" in Settings and Settings["branch"] is not None:
+            root_configs["commitish"] = {}
+            root_configs["commitish"]["type"] = "branch"
+            root_configs["commitish"]["branch"] = Settings["branch"]
+        else:
+            root_configs["commitish"] = None
+
+        return root_configs
+
     def load(self):
         PrintInfo("Loading repositories")
 
@@ -64,23 +87,38 @@ class PROJECT(dict):
                 LaunchProcess('mkdir -p "'+Settings["paths"][path_name]+'"')
 
         # Build root repo configs from CLI
-        self.root_repo_base_config = {"url": Settings["url"]}
-
-        if "commit" in Settings and Settings["commit"] is not None:
-            self.root_repo_base_config["commitish"] = {}
-            self.root_repo_base_config["commitish"]["type"] = "commit"
-            self.root_repo_base_config["commitish"]["commit"] = Settings["commit"]
-        elif "branch" in Settings and Settings["branch"] is not None:
-            self.root_repo_base_config["commitish"] = {}
-            self.root_repo_base_config["commitish"]["type"] = "branch"
-            self.root_repo_base_config["commitish"]["branch"] = Settings["branch"]
-        else:
-            self.root_repo_base_config["commitish"] = None
+        self.root_repo_base_config = self.GetRootConfigs()
 
         PrintNotice(f"Loading repositories with the following parameters: {self.root_repo_base_config}")
         self.repositories = LoadRepositories(self.root_repo_base_config, Settings["cache file"])
         PrintInfo("Project loaded")
 
+    """
+    Reload only the repositories in repo_ids (and what changes because of them)
+    Falls back to a full load when that isn't possible
+    """
+    def reload(self, repo_ids):
+        try:
+            affected_repo_ids = ReloadRepositories(repo_ids, Settings["cache file"])
+        except Exception as ex:
+            logging.error(f"Incremental reload failed: {ex}")
+            PrintNotice("Incremental reload failed")
+            affected_repo_ids = None
+
+        if affected_repo_ids is None:
+            PrintNotice("Reloading the whole project")
+            self.load()
+            return
+
+        SetupReloadedRepositories(self.repositories, affected_repo_ids)
+
+    """
+    Load every repository again and set the project up, regardless of changes
+    """
+    def full_reload(self):
+        self.load()
+        Setup(self.repositories)
+
     def setup(self):
         logging.info("Setting up project")
         PrintInfo("Setting up project")
@@ -93,24 +131,27 @@ class PROJECT(dict):
         logging.info("Building project")
         repositories = self.GetRepositories()
 
-        CMakeCommand = f'{GetEnvVarExports()}; '
-        CMakeCommand += 'cmake -DCMAKE_BUILD_TYPE=Debug'
+        ConfigureCommand = f'{GetEnvVarExports()}; '
+        ConfigureCommand += 'cmake -DCMAKE_BUILD_TYPE=Debug'
         # Dont complain about unused -D parameters, they are not mandatory
-        CMakeCommand += ' --no-warn-unused-cli'
+        ConfigureCommand += ' --no-warn-unused-cli'
         # Add compile.json for better IDE support
-        CMakeCommand += ' -DCMAKE_EXPORT_COMPILE_COMMANDS=1'
+        ConfigureCommand += ' -DCMAKE_EXPORT_COMPILE_COMMANDS=1'
         # Include generated configuration
-        # CMakeCommand += f' -I{self.paths["project configs"]}/.config'
-        CMakeCommand += f' -S {Settings["paths"]["build env"]}'
-        CMakeCommand += f' -B {Settings["paths"]["build cache"]}'
-        # CMakeCommand += ' -DBUILD_MODE='+ActiveSettings["Mode"]
-        CMakeCommand += f' -DPROJECT_NAME={Settings["ProjectName"]}'
-        CMakeCommand += f' -DPROJECT_BASE_SCRIPT_PATH={Settings["paths"]["scripts"]}'
-        CMakeCommand += f' && cmake --build {Settings["paths"]["build cache"]}'
+        # ConfigureCommand += f' -I{self.paths["project configs"]}/.config'
+        ConfigureCommand += f' -S {Settings["paths"]["build env"]}'
+        ConfigureCommand += f' -B {Settings["paths"]["build cache"]}'
+        # ConfigureCommand += ' -DBUILD_MODE='+ActiveSettings["Mode"]
+        ConfigureCommand += f' -DPROJECT_NAME={Settings["ProjectName"]}'
+        ConfigureCommand += f' -DPROJECT_BASE_SCRIPT_PATH={Settings["paths"]["scripts"]}'
+
+        # Configure is skipped when its inputs did not change (cmake still
+        #  reconfigures by itself if a CMakeLists changes)
+        BuildCommand = f'cmake --build {Settings["paths"]["build cache"]}'
         # Enable multi process
-        CMakeCommand += ' -- -j $(nproc) -k'
+        BuildCommand += ' -- -j $(nproc) -k'
 
-        Build(repositories, CMakeCommand)
+        Build(repositories, BuildCommand, ConfigureCommand)
 
     def SetCloneType(self, clone_type):
         repos = self.GetRepositories()
@@ -124,46 +165,66 @@ class PROJECT(dict):
 
             LaunchProcess("git remote rm origin; git remote add origin " + url, repository["full worktree path"])
 
+    """
+    Restore the repositories from the project snapshot, if it is still valid
+    """
+    def RestoreSnapshot(self):
+        self.snapshot = LoadSnapshot(self.GetRootConfigs(), Settings["cache file"])
+        if self.snapshot is None:
+            return
+
+        repositories = RestoreRepositories(self.snapshot["root"], Settings["cache file"])
+        if repositories is None or repositories.keys() != self.snapshot["repositories"].keys():
+            PrintNotice("Project snapshot does not match the repositories cache")
+            self.snapshot = None
+            return
+
+        self.repositories = repositories
+        PrintInfo("Loaded project from snapshot")
+
+    """
+    Reload what changed since the snapshot and save it again if anything did
+    """
+    def UpdateSnapshot(self):
+        repositories_state = GetRepositoriesState(self.repositories)
+        if self.snapshot is not None:
+            changed_repo_ids = GetChangedRepositories(self.snapshot, repositories_state)
+            if len(changed_repo_ids) != 0:
+                PrintNotice(f"Changes detected since the project snapshot in {len(changed_repo_ids)} repositories, reloading")
+                self.reload(changed_repo_ids)
+                repositories_state = GetRepositoriesState(self.repositories)
+
+        if GetFullLoad() is True:
+            snapshot = BuildSnapshot(GetRootData(), repositories_state, Settings["cache file"])
+            self.snapshot = SaveSnapshot(snapshot, self.snapshot)
+
     def GetRepositories(self):
-        global full_load
-        # See if saved cache exist 
-        base_path = "configs/project_cache/"
-        load_file = base_path + Settings["ProjectName"] + "_load_project.pkl"
-        if(Settings["active"]["Speed"] == "Fast"):
-            if os.path.exists(load_file):
-                with open(load_file, "rb") as f:
-                    loaded = pickle.load(f)
-                    self.__dict__.update(loaded.__dict__)
-                    self.update(loaded)
-                    logging.info("Loaded project from pickle.")
-                    PrintInfo("Loaded project from pickle.")
-            
+        if len(self.repositories) == 0 and Settings["active"]["Speed"] == "Fast":
+            self.RestoreSnapshot()
+
         if len(self.repositories) == 0:
             self.load()
             PrintNotice(f"No repositories loaded")
-            return self.repositories
 
         # print(f"X2 {id(full_load)} {full_load}")
-        if GetFullLoad() is False:
+        elif GetFullLoad() is False:
             self.load()
             PrintNotice(f"Last load failed")
-            return self.repositories
 
-        if Settings["active"]["Speed"] == "Safe":
-            # Single change in configs must trigger full reloading of configs
-            # Also internally this code is slower than it shoud there are proably ways to
-            # speed it up. TODO 
+        elif Settings["active"]["Speed"] == "Safe":
+            # Only the repositories whose configs changed are reloaded
+            changed_repo_ids = []
             for repo_id in self.repositories:
                 config_change = ConfigsChanged(self.repositories[repo_id]["configs path"])
                 if config_change is not None:
                     PrintNotice(f"Config change detected ({self.repositories[repo_id]["configs path"]}: {config_change}), reloading")
-                    self.load()
-                    break
+                    changed_repo_ids.append(repo_id)
+
+            if len(changed_repo_ids) != 0:
+                self.reload(changed_repo_ids)
 
-        if(Settings["active"]["Speed"] == "Fast"):       
-            with open(load_file, "wb") as f:
-                pickle.dump(self, f)
-                PrintNotice("Saved project to disk")
+        if Settings["active"]["Speed"] == "Fast":
+            self.UpdateSnapshot()
 
         return self.repositories
 
@@ -256,6 +317,9 @@ def DeleteProject():
 def _CleanPBCache():
     global Project
     LaunchVerboseProcess(f"rm -rf {Settings["cache file"]}")
+    ResetConfigsState()
+    RemoveSnapshot()
+    ResetCommandStamps()
     LaunchVerboseProcess(f"rm -rf {Settings["paths"]["temporary"]}/*")
     Project.DeleteRepositories()
     Settings.reset_settings()
@@ -276,6 +340,8 @@ def PurgePB():
 
     LaunchVerboseProcess(f"rm -rf {Settings["paths"]["project base"]}/projects/*")
     LaunchVerboseProcess(f"rm -rf {Settings["paths"]["bare gits"]}/*")
+    ResetBareGitIndex()
+    ResetRepoIdCache()
 
     Settings.start()
     Project.init()
\ No newline at end of file
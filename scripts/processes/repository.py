@@ -1,33 +1,59 @@
+import sys
+import copy
+import json
 import logging
+from hashlib import sha1
 from enum import Enum
+from time import time
 
 from pprint import pformat
 from data.git import GetRepoNameFromURL
 from processes.git_operations import *
-from processes.process import RunInThreadsWithProgress
-from data.common import SetupTemplate
-from data.settings import Settings
-from data.json import dump_json_file, load_json_file
-from processes.repository_configs import LoadConfigs, MergeConfigs, ParseConfigs, UpdateState
+from processes.git_reader import ReadGitDirs, ReadCloneStamp
+from processes.process import RunInThreadsWithProgress, WORK_QUEUE
+from data.common import SetupTemplate, WriteIfChanged
+from data.settings import Settings, IsSplitConfigHeaders
+from data.json import dump_json_file, dump_json_file_atomic, load_json_file
+from processes.build_metadata import GetBuildMetadata
+from processes.command_stamps import GetCommandBlockStamp, GetCommandBlockProceeded, RecordCommandBlockStamp, SaveCommandStamps
+from processes.lockfile import IsLockedLoad, LoadLockedCommits, GetLockedCommit, SaveLockfile
+from processes.repository_configs import LoadConfigs, MergeConfigs, ParseConfigs, UpdateState, SaveConfigsState, GetDefaultRepoFolders
 from data.common import GetValueOrDefault
-from processes.filesystem import CreateDirectory, CreateParentDirectory, FindFiles
+from processes.filesystem import CreateDirectory, CreateParentDirectory, RemoveDirectory
 from processes.progress_bar import PrintProgressBar
 from threading import Lock
-from data.paths import JoinPaths
+from data.paths import JoinPaths, GetNewTemporaryPath
 from data.print import *
 import kconfiglib
 
 # Repository operation lock
 repositories_lock = Lock()
 
-# Dependencies to load on the next loop
+# Dependencies queued to be loaded (or being loaded), by URL
 next_dependencies = {}
 # Total URLs loaded (used to prevent infinite dependency cycles)
 loaded_urls = []
-# The repos currently being loaded
-repos_being_loaded = []
+# The URLs currently being loaded
+urls_being_loaded = set()
 # Helper map between URLs and IDs
 url_to_id = {}
+# Queue repositories are loaded through (dependencies are queued as they are found)
+load_queue = None
+# URL -> (URL of the repository that requested the load, load duration)
+load_times = {}
+# URLs whose imposed configs are known to be current (imposed on by the command
+#  line or by a repository during this load, instead of coming from the cache)
+declared_urls = set()
+# Repositories resolved from their bare git, whose worktree is only added once
+#  the whole graph is resolved. repo ID -> what to check out and where
+pending_worktrees = {}
+# In a locked load, the lockfile's commits by URL (None otherwise)
+locked_commits = None
+
+# Keys _LoadRepository derives from the imposed configs (not part of what was imposed)
+DERIVED_CONFIG_KEYS = ["name", "bare path", "repo ID", "repo source"]
+# Keys other repositories' build files depend on
+SHARED_CONFIG_KEYS = ["name", "repo source", "public headers", "flags", "dependencies"]
 
 repositories = None
 # Root configs. Used to kickstart further loads without searching
@@ -50,17 +76,98 @@ def SaveReposToCache(_repositories, path):
     global repositories
     repositories = _repositories
     dump_json_file(_repositories, path)
+    SaveConfigsState()
 
 def LoadReposFromCache(path):
     global repositories
     repositories = load_json_file(path, {})
 
+# Repository IDs by bare git/worktree path, along with the clone stamp they were read from
+repo_id_cache = None
+# Paths whose IDs were found since the cache was last saved
+repo_id_cache_changes = set()
+repo_id_cache_lock = Lock()
+
+def __GetRepoIdCachePath():
+    # Standalone processes (i.e. tests) have no project to persist the cache in
+    if "paths" not in Settings:
+        return None
+    return JoinPaths(Settings["paths"]["configs"], "project_cache", "repo_ids")
+
+# Must be called with repo_id_cache_lock held
+def __GetRepoIdCache():
+    global repo_id_cache
+    if repo_id_cache is None:
+        cache_path = __GetRepoIdCachePath()
+        repo_id_cache = {} if cache_path is None else load_json_file(cache_path, {})
+    return repo_id_cache
+
+"""
+Forget all known repository IDs
+"""
+def ResetRepoIdCache():
+    global repo_id_cache
+    with repo_id_cache_lock:
+        repo_id_cache = {}
+        repo_id_cache_changes.clear()
+    cache_path = __GetRepoIdCachePath()
+    if cache_path is not None and os.path.isfile(cache_path):
+        os.remove(cache_path)
+
+"""
+Save the repository IDs found since the last save (once per load/status, not once per ID)
+The cache is shared by every project, so what other PB processes saved meanwhile is kept
+"""
+def SaveRepoIdCache():
+    cache_path = __GetRepoIdCachePath()
+    with repo_id_cache_lock:
+        if cache_path is None or len(repo_id_cache_changes) == 0:
+            return
+        cache = __GetRepoIdCache()
+        saved_cache = load_json_file(cache_path, {})
+        for key in repo_id_cache_changes:
+            saved_cache[key] = cache[key]
+        CreateParentDirectory(cache_path)
+        dump_json_file_atomic(saved_cache, cache_path)
+        repo_id_cache_changes.clear()
+    logging.debug("Saved repository IDs")
+
+"""
+The repository ID is its first commit
+Finding it walks the whole history, so it is only done once per bare git and
+ worktree, and kept until the bare git is cloned again
+"""
 def GetRepoIdFromPath(path):
-    return GetFirstCommit(path)
+    dirs = ReadGitDirs(path)
+    stamp = None if dirs is None else ReadCloneStamp(dirs[2])
+    if stamp is None:
+        return GetFirstCommit(path)
+
+    top_level, _, _ = dirs
+    key = os.path.realpath(path if top_level is None else top_level)
+    with repo_id_cache_lock:
+        entry = __GetRepoIdCache().get(key)
+    if entry is not None and entry["stamp"] == stamp:
+        return entry["id"]
+
+    first_commit = GetFirstCommitResult(path)
+    repo_id = first_commit.returned["out"]
+    if not first_commit.success:
+        # i.e. no commits yet. Git's error is not an ID worth keeping
+        return repo_id
+
+    with repo_id_cache_lock:
+        __GetRepoIdCache()[key] = {"id": repo_id, "stamp": stamp}
+        repo_id_cache_changes.add(key)
+    return repo_id
 
 def GetRepoIdFromURL(repo_url):
-    path = GetRepoBareTreePath(Settings["paths"]["bare gits"], repo_url)
-    return GetFirstCommit(FindGitRepo(path, repo_url, depth=1))
+    bare_git = FindBareGit(repo_url)
+    if bare_git is None:
+        raise Exception(f"There is no bare git for {repo_url}")
+    repo_id = GetRepoIdFromPath(bare_git)
+    SaveRepoIdCache()
+    return repo_id
     # url = url_SSH_to_HTTPS(repo_url)
     # return url
 
@@ -105,21 +212,38 @@ def __LoadRepositoryFolder(imposed_configs):
     if current_location is None:
         current_location = FindGitRepo(Settings["paths"]["project code"], imposed_configs["url"], imposed_configs["commitish"])
 
-    # Repo nowhere to be found, add it
-    if current_location is None:
+    # Repo nowhere to be found, read its configs from the bare git. The worktree
+    #  is added by __MaterializeWorktrees once the whole graph is resolved
+    pending = current_location is None
+    if pending:
         PrintWarning(f"Repository {imposed_configs} not found")
-        # Setup helper worktree
-        helper_path = AddWorkTree(imposed_configs["bare path"], imposed_configs["url"], imposed_configs["commitish"], Settings["paths"]["temporary"])
-        repository  = MergeConfigs(LoadConfigs(helper_path), imposed_configs)
+        bare_path = imposed_configs["bare path"]
+        locked_commit = GetLockedCommit(locked_commits, imposed_configs)
+        commit, stored_configs, existing_folders = ReadFromCommit(bare_path, imposed_configs["commitish"], "configs/configs.json", GetDefaultRepoFolders(), locked_commit)
+        if commit is None and locked_commit is not None:
+            PrintNotice(f"Fetching {imposed_configs["name"]}, it doesn't have the locked commit {locked_commit}")
+            FetchBareGit(bare_path)
+            commit, stored_configs, existing_folders = ReadFromCommit(bare_path, imposed_configs["commitish"], "configs/configs.json", GetDefaultRepoFolders(), locked_commit)
+        if commit is None:
+            raise Exception(f"Could not find {locked_commit or GetCommitishRevision(imposed_configs["commitish"])} of {imposed_configs["url"]} in {bare_path}")
+        if stored_configs is not None:
+            stored_configs = json.loads(stored_configs)
+        repository = MergeConfigs(LoadConfigs(imposed_configs["bare path"], stored_configs, existing_folders), imposed_configs)
 
         expected_local_path = JoinPaths(Settings["paths"]["project code"], repository["local path"])
-
-        # Move worktree to appropriate place
-        CreateDirectory(expected_local_path)
-        MoveWorkTree(repository["bare path"], helper_path, expected_local_path)
-        # current_location = expected_local_path
         current_location = JoinPaths(expected_local_path, repository["name"])
 
+        with repositories_lock:
+            pending_worktrees[repo_id] = {
+                "bare path":  repository["bare path"],
+                "url":        imposed_configs["url"],
+                "commitish":  imposed_configs["commitish"],
+                "commit":     commit,
+                "locked":     locked_commit is not None,
+                "local path": expected_local_path,
+                "repo source": current_location,
+            }
+
         state_changed_detected = True
 
     else: # Repository present at current_location
@@ -143,22 +267,80 @@ def __LoadRepositoryFolder(imposed_configs):
     # 4. Path is consistent with the path requested in configs
     repository["full worktree path"] = expected_local_path
     repository["repo source"]  = current_location
+    # Configs may have been loaded elsewhere (i.e. from a helper worktree)
+    repository["current repo path"] = current_location
+    repository["configs path"] = JoinPaths(current_location, "configs")
     repository["commitish"] = imposed_configs["commitish"]
     repository["url"] = imposed_configs["url"]
-    repository["repo name"]  = GetRepositoryName(repository["repo source"])
+    # Worktrees share their bare git's remote
+    repository["repo name"]  = GetRepositoryName(repository["bare path"] if pending else repository["repo source"])
     repository["build path"] = repository["repo source"].replace(Settings["paths"]["project code"], Settings["paths"]["build env"])
     repository["libraries"]   = JoinPaths(Settings["paths"]["libraries"],   repository["repo name"])
     repository["executables"] = JoinPaths(Settings["paths"]["executables"], repository["repo name"])
     repository["tests"]       = JoinPaths(Settings["paths"]["tests"],       repository["repo name"])
 
-    UpdateState(repository["configs path"])
+    if not pending:
+        UpdateState(repository["configs path"])
 
     return repository
 
-def __RepoHasNoCode(repository):
-    logging.debug(repository["repo source"])
-    files = FindFiles(repository["repo source"], "CMakeLists.txt")
-    return len(files) == 0
+def __SetupLockedCommits():
+    global locked_commits
+    locked_commits = LoadLockedCommits() if IsLockedLoad() else None
+
+"""
+Record what the repositories resolved to, except in locked loads (which use
+ the lockfile instead)
+"""
+def __UpdateLockfile():
+    if not IsLockedLoad():
+        SaveLockfile(repositories)
+
+"""
+Add the worktree of a repository that was resolved from its bare git
+"""
+def __MaterializeWorktree(worktree):
+    temporary_path = GetNewTemporaryPath()
+    CreateDirectory(temporary_path)
+    locked_commit = worktree["commit"] if worktree["locked"] else None
+    helper_path = AddWorkTree(worktree["bare path"], worktree["url"], worktree["commitish"], temporary_path, locked_commit)
+
+    commit = GitGetHeadCommit(helper_path)
+    if commit != worktree["commit"]:
+        raise Exception(f"Worktree of {worktree["url"]} checked out {commit} instead of the resolved {worktree["commit"]}")
+
+    # Move worktree to appropriate place
+    CreateDirectory(worktree["local path"])
+    MoveWorkTree(worktree["bare path"], helper_path, worktree["local path"])
+    RemoveDirectory(temporary_path)
+
+    UpdateState(JoinPaths(worktree["repo source"], "configs"))
+
+def __PrintMaterializeProgress(worktrees):
+    PrintProgressBar(len(worktrees[0]) - len(worktrees[1]), len(worktrees[0]), prefix = 'Adding Worktrees:', suffix = "Added worktrees")
+
+"""
+Add the worktrees of the repositories resolved (from their bare gits) during
+ the last load, now that the whole graph is known to be free of conflicts
+Worktrees are added in parallel, except that one inside another repository is
+ only added after that repository
+"""
+def __MaterializeWorktrees():
+    worktrees = [pending_worktrees[repo_id] for repo_id in pending_worktrees if repo_id in repositories]
+    pending_worktrees.clear()
+    if len(worktrees) == 0:
+        return
+
+    def __Contains(outer, inner):
+        return inner["repo source"].startswith(outer["repo source"] + "/")
+
+    remaining = worktrees
+    while len(remaining) != 0:
+        ready = [worktree for worktree in remaining if not any(__Contains(other, worktree) for other in remaining)]
+        remaining = [worktree for worktree in remaining if worktree not in ready]
+        RunInThreadsWithProgress(__MaterializeWorktree, [(worktree,) for worktree in ready])
+
+    PrintInfo(f"Added {len(worktrees)} worktrees")
 
 # Check if the repository has at least one of the flags presented
 def __RepoHasSomeFlagSet(repository, flags):
@@ -185,14 +367,38 @@ Expected commands format:
     }
 }
 """
-def __RunRepoCommands(command_set_name, commands):
+"""
+Run each of the repository's command_set_name command blocks in order. The
+ output of the commands is captured
+If stamped, blocks whose stamp did not change since they last ran are skipped
+ (see command_stamps)
+If verbose, blocks run on a terminal (they can prompt) and print as they go,
+ otherwise their output is captured and returned
+Returns the output and the wall time of each block that ran, as
+ (output, [(block name, seconds)])
+"""
+def __RunRepoCommands(repository, command_set_name, stamped=False, verbose=True):
+    commands = repository[command_set_name]
+    output = ""
+    block_times = []
     if len(commands) > 0:
-        PrintDebug("Running " + command_set_name + " commands")
+        PrintDebug(f"Running {command_set_name} ({repository['name']}) commands")
         for block_name in commands:
             PrintDebug("\t Command block:" + block_name)
             command_block     = commands[block_name]
             proceed_condition = command_block["condition to proceed"]
             command_list      = command_block["command list"]
+
+            if stamped:
+                stamp = GetCommandBlockStamp(repository, command_block)
+                proceeded = GetCommandBlockProceeded(repository["repo ID"], command_set_name, block_name, stamp)
+                if proceeded is False:
+                    PrintDebug("\t Nothing changed since the condition to proceed was False, skipping the remaining command blocks")
+                    break
+                if proceeded is True:
+                    PrintDebug("\t Nothing changed since the last run, skipping " + str(len(command_list)) + " commands")
+                    continue
+
             try:
                 LaunchProcess(proceed_condition)
                 result = True
@@ -201,20 +407,104 @@ def __RunRepoCommands(command_set_name, commands):
                     result = False
             if result is False:
                 PrintDebug("\t Condition to proceed: '" + proceed_condition + "' is False, skipping " + str(len(command_list)) + " commands")
-                return
+                if stamped:
+                    RecordCommandBlockStamp(repository["repo ID"], command_set_name, block_name, stamp, False)
+                break
 
             PrintDebug("\t Condition to proceed: '" + proceed_condition + "' is True, running " + str(len(command_list)) + " commands")
             # TODO: after console merge, run these one at a time and explicitly check return value?
-            LaunchVerboseProcess("set -xe && "+' && '.join(command_list))
+            start_time = time()
+            if verbose:
+                LaunchVerboseProcess("set -xe && "+' && '.join(command_list))
+            else:
+                returned = LaunchProcess("(set -xe && "+' && '.join(command_list)+") 2>&1")
+                output += returned["stdout"]
+            block_times.append((block_name, time() - start_time))
+            if stamped:
+                RecordCommandBlockStamp(repository["repo ID"], command_set_name, block_name, stamp, True)
+    return output, block_times
 
-def __PrintLoadProgress():
-    global new_repos
-    global repos_being_loaded
+"""
+Run the command_set_name ("setup", "before build" or "after build") commands of
+ all repositories, in parallel (up to the maximum amount of workers)
+A repository's commands only start once the commands of its dependencies are
+ done. Repositories in a dependency cycle run one after the other
+Each repository's output is printed in one piece once its commands are done,
+ followed by how long each command block took
+In single thread mode, or when only one component has commands, there is nothing
+ to run in parallel: blocks run one after the other on the terminal instead
+"""
+def __RunRepositoriesCommands(repositories, command_set_name, stamped=False):
+    if not any(len(repository[command_set_name]) != 0 for repository in repositories.values()):
+        return
+
+    direct_dependencies = __GetDirectDependencies(repositories)
+    components = __GetDependencyComponents(direct_dependencies)
+    component_of = {}
+    for component_index, component in enumerate(components):
+        for repo_id in component:
+            component_of[repo_id] = component_index
+
+    # Components each component waits for, and the ones waiting for it
+    waiting_on = [set() for _ in components]
+    dependents = [[] for _ in components]
+    for component_index, component in enumerate(components):
+        for repo_id in component:
+            for dep_repo_id in direct_dependencies[repo_id]:
+                dep_index = component_of[dep_repo_id]
+                if dep_index != component_index and dep_index not in waiting_on[component_index]:
+                    waiting_on[component_index].add(dep_index)
+                    dependents[dep_index].append(component_index)
+
+    runnable_components = [component for component in components if any(len(repositories[repo_id][command_set_name]) != 0 for repo_id in component)]
+    verbose = Settings["single thread"] or len(runnable_components) == 1
+
+    scheduler_lock = Lock()
+    block_times = []
+    start_time = time()
+
+    def __RunComponent(component_index):
+        for repo_id in components[component_index]:
+            repository = repositories[repo_id]
+            output, repo_block_times = __RunRepoCommands(repository, command_set_name, stamped, verbose)
+            if len(repo_block_times) != 0:
+                message = f"{command_set_name} commands of {repository['name']}:\n"
+                if len(output) != 0:
+                    message += output.rstrip("\n") + "\n"
+                message += "".join(f"\t{block_name}: {seconds:.2f}s\n" for block_name, seconds in repo_block_times)
+                AddTothreadLog(message)
+
+            with scheduler_lock:
+                block_times.extend((repository["name"], block_name, seconds) for block_name, seconds in repo_block_times)
+
+        ready = []
+        with scheduler_lock:
+            for dependent in dependents[component_index]:
+                waiting_on[dependent].discard(component_index)
+                if len(waiting_on[dependent]) == 0:
+                    ready.append(dependent)
+        for dependent in ready:
+            queue.Submit(dependent)
+
+    queue = WORK_QUEUE(__RunComponent, print_callback=lambda: None, inline=verbose)
+    try:
+        queue.Run([(component_index,) for component_index in range(len(components)) if len(waiting_on[component_index]) == 0])
+    finally:
+        # Blocks that did run are not run again, even if others failed
+        if stamped:
+            SaveCommandStamps()
+
+    logging.info(f"Ran {len(block_times)} {command_set_name} command blocks in {time() - start_time:.2f}s")
+    for repo_name, block_name, seconds in sorted(block_times, key=lambda block_time: block_time[2], reverse=True):
+        logging.info(f"\t{repo_name}: {block_name} took {seconds:.2f}s")
 
-    total_repos      = len(repos_being_loaded)
-    current_progress = new_repos
+def __PrintLoadProgress():
+    total_repos      = load_queue.submitted
+    current_progress = load_queue.finished
     if current_progress != total_repos:
         PrintProgressBar(current_progress, total_repos, prefix = 'Loading Repositories:', suffix = "Loading " + str(current_progress) + "/" + str(total_repos) + " Repositories")
+    else:
+        PrintProgressBar(current_progress, total_repos, prefix = 'Loading Repositories:', suffix = "Loaded " + str(current_progress) + "/" + str(total_repos) + " Repositories")
 
 """
 Check if new dependency configs conflict with either already setup configs
@@ -262,23 +552,149 @@ def ConflictsPresent(dependency_configs):
     return conflict
 
 """
-Prepare dependency to be fully setup
+Prepare dependency to be fully setup, queueing it right away
 """
-def __AddNewDependency(dependency_configs):
+def __AddNewDependency(dependency_configs, parent_url):
     global repositories_lock
     global next_dependencies
 
+    dep_url = dependency_configs["url"]
     with repositories_lock:
+        if __MustReimpose(dependency_configs):
+            # Loaded with the configs it was imposed before, load it again
+            PrintNotice(f"Reloading {GetRepoNameFromURL(dep_url)}, it is now imposed different configs")
+            loaded_urls.remove(dep_url)
+        declared_urls.add(dep_url)
+
         if ConflictsPresent(dependency_configs) is True:
             return
 
-        next_dependencies[dependency_configs["url"]] = dependency_configs
+        next_dependencies[dep_url] = dependency_configs
+
+    load_queue.Submit(dependency_configs, parent_url)
 
-def _LoadRepository(imposed_configs):
+"""
+Whether a loaded repository must be loaded again because it was loaded with the
+ configs imposed on it before (from the cache), and it is now imposed different ones
+Once a repository is imposed configs during a load, others are left to ConflictsPresent
+Must be called with repositories_lock held
+"""
+def __MustReimpose(dependency_configs):
+    dep_url = dependency_configs["url"]
+    if dep_url not in loaded_urls or dep_url in declared_urls:
+        return False
+    repository = repositories[url_to_id[dep_url]]
+    return repository.get("imposed configs") != __GetImposedConfigs(dependency_configs)
+
+"""
+Load a queued repository, unless it is already loaded (or being loaded)
+"""
+def __LoadQueuedRepository(imposed_configs, parent_url):
+    url = imposed_configs["url"]
+    with repositories_lock:
+        if url in loaded_urls or url in urls_being_loaded:
+            return
+        urls_being_loaded.add(url)
+
+    start = time()
+    try:
+        _LoadRepository(imposed_configs, parent_url is not None)
+    finally:
+        with repositories_lock:
+            urls_being_loaded.discard(url)
+            load_times[url] = (parent_url, time() - start)
+
+"""
+Report how long the load took compared to its critical path (the slowest chain
+ of repositories where each one could only be loaded after the previous one)
+"""
+def __ReportLoadTimes(total_time):
+    critical_paths = {}
+    def __CriticalPath(url):
+        if url not in critical_paths:
+            parent_url, duration = load_times[url]
+            if parent_url is None or parent_url not in load_times:
+                critical_paths[url] = (duration, [url])
+            else:
+                parent_duration, parent_chain = __CriticalPath(parent_url)
+                critical_paths[url] = (parent_duration + duration, parent_chain + [url])
+        return critical_paths[url]
+
+    if len(load_times) == 0:
+        return
+
+    critical_time, critical_chain = max([__CriticalPath(url) for url in load_times], key=lambda path: path[0])
+    serial_time = sum([duration for _, duration in load_times.values()])
+    chain_names = " -> ".join([GetRepoNameFromURL(url) for url in critical_chain])
+
+    PrintInfo(f"Loaded {len(load_times)} repositories in {total_time:.2f}s (critical path {critical_time:.2f}s: {chain_names}, {serial_time:.2f}s of loading in total)")
+
+"""
+The configs repository imposes on each of its dependencies
+"""
+def __GetDependencyConfigs(repository):
+    dependencies = []
+    for dependency in repository["dependencies"]:
+        base_dependency = repository["dependencies"][dependency]
+
+        if "configs" in base_dependency:
+            dependency_configs = base_dependency["configs"].copy()
+        else:
+            dependency_configs = {}
+
+        dependency_configs["url"] = GetValueOrDefault(base_dependency, "url", dependency)
+        if(Settings["isCI"]):
+            if(dependency_configs["url"] in Settings["commitJson"]):
+                # This means that settings should use the path ont he file system that has commits not in the remote in CI build
+                dependency_configs["url"] = Settings["commitJson"][dependency_configs["url"]]
+
+        if "commit" in base_dependency and base_dependency["commit"] is not None:
+            dependency_configs["commitish"] = {}
+            dependency_configs["commitish"]["type"] = "commit"
+            dependency_configs["commitish"]["commit"] = base_dependency["commit"]
+        elif "branch" in base_dependency and base_dependency["branch"] is not None:
+            dependency_configs["commitish"] = {}
+            dependency_configs["commitish"]["type"] = "branch"
+            dependency_configs["commitish"]["branch"] = base_dependency["branch"]
+        else:
+            dependency_configs["commitish"] = None
+
+        dependencies.append(dependency_configs)
+    return dependencies
+
+"""
+What was imposed on a repository, without what loading it derives from that
+"""
+def __GetImposedConfigs(configs):
+    imposed_configs = copy.deepcopy(configs)
+    for key in DERIVED_CONFIG_KEYS + ["imposed configs", "reloaded"]:
+        imposed_configs.pop(key, None)
+    return imposed_configs
+
+"""
+Configs to load an already loaded repository again with: what was imposed on
+ it, plus where it was found (so it isn't searched for)
+"""
+def __GetReloadConfigs(repository):
+    reload_configs = copy.deepcopy(repository["imposed configs"])
+    reload_configs["repo source"]     = repository.get("repo source", "")
+    reload_configs["imposed configs"] = repository["imposed configs"]
+    return reload_configs
+
+"""
+Load the repository imposed_configs describes
+declared is whether imposed_configs come from a dependency declaration, instead
+ of being a previous load's configs that were queued to speed up the load
+"""
+def _LoadRepository(imposed_configs, declared=True):
     global repositories
     global loaded_urls
-    global new_repos
 
+    if declared:
+        declared_configs = __GetImposedConfigs(imposed_configs)
+    else:
+        # Unknown (None) until a repository declares it
+        declared_configs = imposed_configs.get("imposed configs")
     imposed_configs["name"]      = GetRepoNameFromURL(imposed_configs["url"])
     imposed_configs["bare path"] = GetBareGit(imposed_configs["url"])
     imposed_configs["repo ID"]   = GetRepoIdFromPath(imposed_configs["bare path"])
@@ -297,39 +713,25 @@ def _LoadRepository(imposed_configs):
 
     # Register repository appropriately
     with repositories_lock:
-        new_repos += 1
-        loaded_urls.append(configs["url"])
-        repositories[configs["repo ID"]] = configs
-        url_to_id[configs["url"]] = configs["repo ID"]
+        pending_declaration = next_dependencies.pop(configs["url"], None)
+        reimpose = not declared and pending_declaration is not None and \
+                   __GetImposedConfigs(pending_declaration) != declared_configs
+        if not reimpose:
+            loaded_urls.append(configs["url"])
+            configs["imposed configs"] = declared_configs
+            repositories[configs["repo ID"]] = configs
+            url_to_id[configs["url"]] = configs["repo ID"]
+
+    if reimpose:
+        # Imposed different configs while loading with the cached ones
+        PrintNotice(f"Reloading {configs["name"]}, it is now imposed different configs")
+        _LoadRepository(pending_declaration)
+        return
 
     # Get dependencies ready to be loaded
     try:
-        for dependency in configs["dependencies"]:
-            base_dependency = configs["dependencies"][dependency]
-
-            if "configs" in base_dependency:
-                dependency_configs = base_dependency["configs"].copy()
-            else:
-                dependency_configs = {}
-
-            dependency_configs["url"] = GetValueOrDefault(base_dependency, "url", dependency)
-            if(Settings["isCI"]):
-                if(dependency_configs["url"] in Settings["commitJson"]):
-                    # This means that settings should use the path ont he file system that has commits not in the remote in CI build
-                    dependency_configs["url"] = Settings["commitJson"][dependency_configs["url"]]
-
-            if "commit" in base_dependency and base_dependency["commit"] is not None:
-                dependency_configs["commitish"] = {}
-                dependency_configs["commitish"]["type"] = "commit"
-                dependency_configs["commitish"]["commit"] = base_dependency["commit"]
-            elif "branch" in base_dependency and base_dependency["branch"] is not None:
-                dependency_configs["commitish"] = {}
-                dependency_configs["commitish"]["type"] = "branch"
-                dependency_configs["commitish"]["branch"] = base_dependency["branch"]
-            else:
-                dependency_configs["commitish"] = None
-
-            __AddNewDependency(dependency_configs)
+        for dependency_configs in __GetDependencyConfigs(configs):
+            __AddNewDependency(dependency_configs, configs["url"])
     except Exception as ex:
         logging.error(f"Failed to load {pformat(configs)}")
         raise ex
@@ -341,7 +743,8 @@ To avoid infinite loop, store all loaded URLs
 Set root as current "dep
 
 Load from the dependencies into the repositories
-
+Each repository is loaded as soon as it is found, so a slow repository only
+ delays its own dependencies instead of a whole round of loads
 """
 def LoadRepositories(root_configs, cache_path):
     global repositories
@@ -349,15 +752,21 @@ def LoadRepositories(root_configs, cache_path):
     global full_load
     global loaded_urls
     global next_dependencies
-    global new_repos
-    global repos_being_loaded
+    global urls_being_loaded
+    global load_queue
     global state_changed_detected
 
-    repos_being_loaded.clear()
+    load_start = time()
+    __SetupLockedCommits()
     loaded_urls.clear()
+    pending_worktrees.clear()
     next_dependencies.clear()
+    urls_being_loaded.clear()
+    load_times.clear()
+    declared_urls.clear()
     state_changed_detected = False
     full_load = False
+    bare_git_stats = GetBareGitIndexStats()
 
     # Load repositories from cache (if any)
     LoadReposFromCache(cache_path)
@@ -378,50 +787,168 @@ def LoadRepositories(root_configs, cache_path):
         #  are preexisting keys that dont exst anymore
         for key in root_configs.keys():
             repositories[root_data["repo ID"]][key] = root_configs[key]
+    repositories[root_data["repo ID"]]["imposed configs"] = __GetImposedConfigs(root_configs)
+    declared_urls.add(root_configs["url"])
 
-    # Setup all repositories to be reloaded and copy them over to be dependencies
+    # Setup all repositories to be reloaded and queue them as the starting point
     for repo_id in repositories:
         repositories[repo_id]["reloaded"] = False
-    
-    for x, y in repositories.items():
-        next_dependencies[x] = y
-
-    while len(next_dependencies) > 0:
-        new_repos = 0
 
-        # For each unloaded repository, get ready to load it
-        repo_args = []
-
-        repos_being_loaded = [x for x in next_dependencies.values()]
-
-        next_dependencies.clear()
-        for config in repos_being_loaded:
-            # Check if repo was loaded in a previous operation, need to block it here as well
-            if config["url"] not in loaded_urls:
-                repo_args.append((config,))
+    repo_args = []
+    for config in repositories.values():
+        if config.get("imposed configs") is not None:
+            repo_args.append((__GetReloadConfigs(config), None))
+        else:
+            # Cached before imposed configs were tracked
+            repo_args.append((config, None))
+    PrintDebug(repo_args)
 
-        if len(repo_args) == 0:
-            PrintNotice("Nothing more to load")
-            break
+    load_queue = WORK_QUEUE(__LoadQueuedRepository, print_callback=__PrintLoadProgress)
+    load_queue.Run(repo_args)
+    next_dependencies.clear()
 
-        PrintInfo(f"{len(repo_args)} unloaded dependencies found")
-        PrintDebug(repo_args)
+    __ReportLoadTimes(time() - load_start)
 
-        # Load remaining repositories
-        RunInThreadsWithProgress(_LoadRepository, repo_args, None, __PrintLoadProgress)
+    __MaterializeWorktrees()
 
-        PrintProgressBar(len(repos_being_loaded), len(repos_being_loaded), prefix = 'Loading Repositories:', suffix = "Loaded " + str(len(repos_being_loaded)) + "/" + str(len(repos_being_loaded)) + " Repositories")
-        PrintInfo("Finished dependency round")
-        repos_being_loaded.clear()
+    bare_git_lookups   = GetBareGitIndexStats()["lookups"] - bare_git_stats["lookups"]
+    bare_git_fallbacks = GetBareGitIndexStats()["fallbacks"] - bare_git_stats["fallbacks"]
+    logging.info(f"Bare git index: {bare_git_lookups} lookups, {bare_git_fallbacks} fallback scans")
+    if bare_git_fallbacks > 0:
+        PrintNotice(f"Bare git index was stale for {bare_git_fallbacks} of {bare_git_lookups} lookups (bare gits were scanned instead)")
 
     if state_changed_detected is True:
         PrintInfo("Saving "+str(len(repositories))+" repositories in cache")
         SaveReposToCache(repositories, cache_path)
 
+    __UpdateLockfile()
+    SaveRepoIdCache()
     full_load = True
 
     return repositories
 
+def GetRootData():
+    return root_data
+
+"""
+Use the repositories cache as the result of a full load from root_configs
+ (i.e. it was validated against a project snapshot), instead of loading again
+"""
+def RestoreRepositories(root_configs, cache_path):
+    global root_data
+    global full_load
+
+    LoadReposFromCache(cache_path)
+    if root_configs["repo ID"] not in repositories:
+        return None
+
+    root_data = root_configs
+    full_load = True
+    return repositories
+
+"""
+IDs of the repositories reachable from the root through dependencies
+"""
+def __GetReachableRepositories():
+    reachable = set()
+    to_visit = [root_data["repo ID"]]
+    while len(to_visit) != 0:
+        repo_id = to_visit.pop()
+        if repo_id in reachable or repo_id not in repositories:
+            continue
+        reachable.add(repo_id)
+        for dependency_configs in __GetDependencyConfigs(repositories[repo_id]):
+            if dependency_configs["url"] in url_to_id:
+                to_visit.append(url_to_id[dependency_configs["url"]])
+    return reachable
+
+"""
+Reload only the repositories in changed_repo_ids (i.e. their configs changed)
+Dependencies they add are loaded, dependencies they impose different configs on
+ are reloaded and repositories nothing depends on anymore are dropped. Every
+ other repository is kept as it is
+Returns the IDs of the repositories whose build files are affected, or None if
+ only a full load (LoadRepositories) can bring the project up to date
+"""
+def ReloadRepositories(changed_repo_ids, cache_path):
+    global full_load
+    global load_queue
+    global state_changed_detected
+
+    if full_load is False or root_data is None or root_data["repo ID"] not in repositories:
+        return None
+    for repo_id in changed_repo_ids:
+        if repositories[repo_id].get("imposed configs") is None:
+            logging.info(f"Unknown imposed configs for {repo_id}, it can't be reloaded on its own")
+            return None
+
+    load_start = time()
+    __SetupLockedCommits()
+    previous_repositories = repositories.copy()
+
+    with repositories_lock:
+        loaded_urls.clear()
+        pending_worktrees.clear()
+        next_dependencies.clear()
+        urls_being_loaded.clear()
+        load_times.clear()
+        url_to_id.clear()
+        declared_urls.clear()
+        declared_urls.add(root_data["url"])
+        for repo_id, repository in repositories.items():
+            repository["reloaded"] = False
+            url_to_id[repository["url"]] = repo_id
+            if repo_id not in changed_repo_ids:
+                loaded_urls.append(repository["url"])
+                # What kept repositories impose stays the same
+                for dependency_configs in __GetDependencyConfigs(repository):
+                    declared_urls.add(dependency_configs["url"])
+
+    state_changed_detected = False
+    full_load = False
+
+    repo_args = [(__GetReloadConfigs(repositories[repo_id]), None) for repo_id in changed_repo_ids]
+    load_queue = WORK_QUEUE(__LoadQueuedRepository, print_callback=__PrintLoadProgress)
+    load_queue.Run(repo_args)
+    next_dependencies.clear()
+
+    __ReportLoadTimes(time() - load_start)
+
+    # Dependencies that were removed (and everything only they depended on)
+    reachable = __GetReachableRepositories()
+    removed_repo_ids = [repo_id for repo_id in repositories if repo_id not in reachable]
+    for repo_id in removed_repo_ids:
+        PrintNotice(f"{repositories[repo_id]["name"]} is no longer a dependency")
+        url_to_id.pop(repositories[repo_id]["url"], None)
+        del repositories[repo_id]
+
+    __MaterializeWorktrees()
+
+    reloaded_repo_ids = set([url_to_id[url] for url in load_times if url in url_to_id])
+    affected_repo_ids = reloaded_repo_ids | set(removed_repo_ids)
+
+    # Other repositories' build files depend on some configs (i.e. public headers)
+    affects_all = len(removed_repo_ids) != 0
+    for repo_id in reloaded_repo_ids:
+        previous = previous_repositories.get(repo_id)
+        if previous is None:
+            affects_all = True
+            continue
+        for key in SHARED_CONFIG_KEYS:
+            if previous.get(key) != repositories[repo_id].get(key):
+                affects_all = True
+    if affects_all:
+        affected_repo_ids |= set(repositories.keys())
+
+    PrintInfo(f"Reloaded {len(reloaded_repo_ids)} of {len(repositories)} repositories")
+    SaveReposToCache(repositories, cache_path)
+    __UpdateLockfile()
+    SaveRepoIdCache()
+
+    full_load = True
+
+    return affected_repo_ids
+
 def __InitKconfigRepoSettings(repositories):
     root = {}
     logging.error(f"kconfig repositiories {repositories}")
@@ -462,8 +989,7 @@ def __GenerateMainKConfigs(repositories) -> list[str]:
         repo_target_kconfig = repo["kconfig_target"]
 
         os.makedirs(os.path.dirname(repo_target_kconfig), exist_ok=True)
-        with open(repo_target_kconfig, "w") as f:
-            f.write(f'source "{repo_original_kconfig}"\n')
+        WriteIfChanged(repo_target_kconfig, f'source "{repo_original_kconfig}"\n')
 
         target_kconfigs.append(repo_target_kconfig)
     return target_kconfigs
@@ -473,11 +999,10 @@ def ConvertKconfigToHeader():
     # Have to do by hand. If there is a better way, please rewrite this
     kconfig_path = JoinPaths(Settings["paths"]["project configs"], ".config")
     header_path = JoinPaths(Settings["paths"]["autogened headers"], "autogen.h")
-    with open(kconfig_path, "r") as config, open(header_path, "w") as header:
-        header.write("#ifndef AUTOGEN_H\n")
-        header.write("#define AUTOGEN_H\n")
-        header.write("/* Auto-generated config header */\n\n")
-
+    header  = "#ifndef AUTOGEN_H\n"
+    header += "#define AUTOGEN_H\n"
+    header += "/* Auto-generated config header */\n\n"
+    with open(kconfig_path, "r") as config:
         for line in config:
             line = line.strip()
 
@@ -488,26 +1013,138 @@ def ConvertKconfigToHeader():
                 key, val = line.split("=", 1)
 
                 if val == "y":
-                    header.write(f"#define {key} 1\n")
+                    header += f"#define {key} 1\n"
                 elif val == "n":
-                    header.write(f"/* #undef {key} */\n")
+                    header += f"/* #undef {key} */\n"
                 else:
                     # handle strings and integers
                     if val.startswith('"') and val.endswith('"'):
-                        header.write(f"#define {key} {val}\n")
+                        header += f"#define {key} {val}\n"
                     else:
-                        header.write(f"#define {key} {val}\n")
-        header.write("\n#endif\n")
+                        header += f"#define {key} {val}\n"
+    header += "\n#endif\n"
+    # Almost everything includes it, rewriting it as is would rebuild almost everything
+    WriteIfChanged(header_path, header)
+    GenerateConfigStamps()
+
+def __GetConfigStampsPath():
+    return JoinPaths(Settings["paths"]["autogened headers"], "config")
+
+# Value of every symbol of the Kconfig tree (symbols left to their defaults are not in .config)
+def __GetSymbolValues(kconfig):
+    return {sym.name: sym.str_value for sym in kconfig.unique_defined_syms}
+
+# Values as written in .config, in the same form as __GetSymbolValues (strings without quotes)
+def __ReadConfigValues(config_file):
+    values = {}
+    with open(config_file, "r") as config:
+        for line in config:
+            line = line.strip()
+            if line.startswith("CONFIG_") and "=" in line:
+                key, val = line.split("=", 1)
+                if len(val) >= 2 and val.startswith('"') and val.endswith('"'):
+                    val = val[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+                values[key[len("CONFIG_"):]] = val
+            elif line.startswith("# CONFIG_") and line.endswith(" is not set"):
+                values[line[len("# CONFIG_"):-len(" is not set")]] = "n"
+    return values
+
+"""
+Symbol values of .config, through the Kconfig tree when it can be parsed so
+ that they are the same as when autogen.h is generated by kconfiglib
+"""
+def __GetConfigValues():
+    config_dir = Settings["paths"]["project configs"]
+    config_file = JoinPaths(config_dir, ".config")
+    try:
+        kconfig, _ = __ParseKconfig(JoinPaths(config_dir, "Kconfig"))
+        kconfig.load_config(config_file)
+        return __GetSymbolValues(kconfig)
+    except Exception as e:
+        logging.error(f"Failed to read {config_file} via kconfiglib, reading it as is: {e}")
+        return __ReadConfigValues(config_file)
+
+"""
+With split config headers, write a config/<SYMBOL>.h stamp per CONFIG_ symbol
+ (values indexed by symbol name, read from .config when not given). Stamps are
+ only rewritten when their symbol's value changes, so only the objects using a
+ changed symbol are rebuilt (see config_fixdep.py)
+Symbols that are not configured (anymore, or yet, when config_fixdep.py found
+ them in the sources first) keep a stamp saying so
+"""
+def GenerateConfigStamps(values=None):
+    if not IsSplitConfigHeaders():
+        return
+    if values is None:
+        values = __GetConfigValues()
+
+    stamps_path = __GetConfigStampsPath()
+    CreateDirectory(stamps_path)
+    for stamp in os.listdir(stamps_path):
+        symbol = stamp[:-len(".h")]
+        if stamp.endswith(".h") and symbol not in values:
+            WriteIfChanged(JoinPaths(stamps_path, stamp), f"/* CONFIG_{symbol} is not configured */\n")
+    for symbol, val in values.items():
+        WriteIfChanged(JoinPaths(stamps_path, f"{symbol}.h"), f"/* CONFIG_{symbol}={val} */\n")
+
+def __HashKconfigFile(path):
+    try:
+        with open(path, "rb") as file:
+            return sha1(file.read()).hexdigest()
+    except OSError:
+        return None
+
+def __HashKconfigFiles(paths):
+    return {path: __HashKconfigFile(path) for path in paths}
+
+# Parsed Kconfig trees by root Kconfig, along with the hashes of the files they were parsed from
+parsed_kconfigs = {}
+
+"""
+Parse the Kconfig tree of root_kconfig, unless it was already parsed from the
+ same files
+"""
+def __ParseKconfig(root_kconfig):
+    cached = parsed_kconfigs.get(root_kconfig)
+    if cached is not None and __HashKconfigFiles(cached["hashes"].keys()) == cached["hashes"]:
+        return cached["kconfig"], cached["hashes"]
+
+    kconfig = kconfiglib.Kconfig(root_kconfig)
+    hashes = __HashKconfigFiles([os.path.abspath(path) for path in kconfig.kconfig_filenames])
+    parsed_kconfigs[root_kconfig] = {"kconfig": kconfig, "hashes": hashes}
+    return kconfig, hashes
+
+def __GetKconfigStatePath():
+    return Settings["cache file"] + "_kconfig"
 
 def __GenerateDefaultKconfig():
     """Create .config from the root Kconfig using kconfiglib (alldefconfig semantics)."""
     config_dir = Settings["paths"]["project configs"]
     root_kconfig = JoinPaths(config_dir, "Kconfig")
     config_file = JoinPaths(config_dir, ".config")
+    header_path = JoinPaths(Settings["paths"]["autogened headers"], "autogen.h")
+
+    # Nothing to generate if neither the Kconfig files nor .config changed since the header was generated
+    state = load_json_file(__GetKconfigStatePath(), {})
+    if os.path.isfile(config_file) and os.path.isfile(header_path) and \
+       state.get("split headers") == IsSplitConfigHeaders() and \
+       state.get("root") == root_kconfig and type(state.get("kconfig hashes")) == type({}) and \
+       __HashKconfigFiles(state["kconfig hashes"].keys()) == state["kconfig hashes"] and \
+       state.get("config hash") == __HashKconfigFile(config_file):
+        logging.info("Kconfig and .config did not change, keeping autogen.h")
+        return
+
+    try:
+        kconf, kconfig_hashes = __ParseKconfig(root_kconfig)
+    except Exception as e:
+        logging.error(f"Failed to parse {root_kconfig} via kconfiglib: {e}")
+        if os.path.isfile(config_file):
+            logging.error("Falling back to ConvertKconfigToHeader()")
+            ConvertKconfigToHeader()
+        return
 
     if not os.path.isfile(config_file):
         try:
-            kconf = kconfiglib.Kconfig(root_kconfig)
             kconf.load_config(None)
             kconf.write_config(config_file)
             logging.info(f"Generated default .config at {config_file} via kconfiglib")
@@ -517,18 +1154,24 @@ def __GenerateDefaultKconfig():
 
     # Try to generate autogen header using kconfiglib if available
     try:
-        kconf = kconfiglib.Kconfig(root_kconfig)
         kconf.load_config(config_file)   # populate symbol values from .config
-        header_path = JoinPaths(Settings["paths"]["autogened headers"], "autogen.h")
         # kconfiglib provides write_autoconf(header_path) which writes the C header
-        kconf.write_autoconf(header_path)
-        logging.info(f"Wrote autoconf header via kconfiglib to {header_path}")
+        # (and leaves it untouched if its contents would not change)
+        logging.info(kconf.write_autoconf(header_path))
+        GenerateConfigStamps(__GetSymbolValues(kconf))
 
     except Exception as e:
         logging.error(f"kconfiglib autoconf generation failed: {e}")
         logging.error("Falling back to ConvertKconfigToHeader()")
         ConvertKconfigToHeader()
 
+    dump_json_file({
+        "root": root_kconfig,
+        "kconfig hashes": kconfig_hashes,
+        "config hash": __HashKconfigFile(config_file),
+        "split headers": IsSplitConfigHeaders(),
+    }, __GetKconfigStatePath())
+
 import processes.kconfig_generaton as kconf
 def __SetupKConfig(repositories):
     logging.info("Setting up KConfig")
@@ -553,9 +1196,101 @@ def DependencyOf(repo, target):
     # logging.error(f"{target["name"]} is not a dependency of {repo["name"]}")
     return False
 
+"""
+Repositories each repository directly depends on, indexed by repo ID
+"""
+def __GetDirectDependencies(repositories):
+    url_to_repo_id = {url_SSH_to_HTTPS(repository["url"]): repo_id for repo_id, repository in repositories.items()}
+    direct_dependencies = {}
+    for repo_id, repository in repositories.items():
+        dependency_urls = [url_SSH_to_HTTPS(configs["url"]) for configs in __GetDependencyConfigs(repository)]
+        direct_dependencies[repo_id] = [url_to_repo_id[url] for url in dependency_urls if url in url_to_repo_id]
+    return direct_dependencies
+
+"""
+Strongly connected components of the dependency graph (repositories in a
+ dependency cycle share one), in topological order: dependencies first
+"""
+def __GetDependencyComponents(direct_dependencies):
+    # Tarjan's algorithm, without recursion (dependency chains can be long)
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+    for start_repo_id in direct_dependencies:
+        if start_repo_id in index:
+            continue
+        index[start_repo_id] = lowlink[start_repo_id] = len(index)
+        stack.append(start_repo_id)
+        on_stack.add(start_repo_id)
+        to_visit = [(start_repo_id, iter(direct_dependencies[start_repo_id]))]
+        while len(to_visit) != 0:
+            repo_id, dependencies = to_visit[-1]
+            dep_repo_id = next(dependencies, None)
+            if dep_repo_id is not None:
+                if dep_repo_id not in index:
+                    index[dep_repo_id] = lowlink[dep_repo_id] = len(index)
+                    stack.append(dep_repo_id)
+                    on_stack.add(dep_repo_id)
+                    to_visit.append((dep_repo_id, iter(direct_dependencies[dep_repo_id])))
+                elif dep_repo_id in on_stack:
+                    lowlink[repo_id] = min(lowlink[repo_id], index[dep_repo_id])
+                continue
+
+            to_visit.pop()
+            if len(to_visit) != 0:
+                parent_repo_id = to_visit[-1][0]
+                lowlink[parent_repo_id] = min(lowlink[parent_repo_id], lowlink[repo_id])
+            if lowlink[repo_id] == index[repo_id]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == repo_id:
+                        break
+                components.append(component)
+    return components
+
+"""
+Repositories each repository depends on, directly or not (itself included),
+ indexed by repo ID
+Each closure is built once from the closures of its direct dependencies, going
+ through the dependency components in topological order
+"""
+def __GetDependencyClosures(repositories):
+    direct_dependencies = __GetDirectDependencies(repositories)
+    closures = {}
+    for component in __GetDependencyComponents(direct_dependencies):
+        closure = set(component)
+        for repo_id in component:
+            for dep_repo_id in direct_dependencies[repo_id]:
+                if dep_repo_id not in closure:
+                    closure |= closures[dep_repo_id]
+        for repo_id in component:
+            closures[repo_id] = closure
+    return closures
+
+"""
+Compiler launcher that rewrites each object's dependencies from autogen.h to
+ the stamps of the CONFIG_ symbols it uses (empty unless config headers are split)
+"""
+def __GetConfigHeadersLauncher():
+    if not IsSplitConfigHeaders():
+        return ""
+    launcher = " ".join([
+        sys.executable,
+        JoinPaths(Settings["paths"]["scripts"], "config_fixdep.py"),
+        JoinPaths(Settings["paths"]["autogened headers"], "autogen.h"),
+        __GetConfigStampsPath(),
+    ])
+    return f"SET(CMAKE_C_COMPILER_LAUNCHER {launcher})\nSET(CMAKE_CXX_COMPILER_LAUNCHER {launcher})"
+
 def GetProjectVariables():
     return {
         "AUTOGEN_HEADERS_PATH": Settings["paths"]["autogened headers"],
+        "CONFIG_HEADERS_LAUNCHER": __GetConfigHeadersLauncher(),
         "PROJ_NAME": Settings["ProjectName"],
         "PROJ_PATH": Settings["paths"]["project main"],
         "PROJ_BUILD_PATH":   Settings["paths"]["build"],
@@ -578,31 +1313,25 @@ def GetRepositoryVariables(repository):
         "REPO_LIB_PATH":   repository["libraries"]
     }
 
-def __FetchAllPublicHeaders(repositories):
+def __FetchAllPublicHeaders(repositories, build_metadata):
     public_header_folders = {}
     objects_to_link = {}
     for repo_id in repositories:
         try:
             repository = repositories[repo_id]
+            metadata   = build_metadata[repo_id]
             # Fetch all public headers
-            if len(repository["public headers"]) > 0:
-                # build_dir = __RepoPathToBuild(repository)
-                new_public_headers = [JoinPaths(repository["repo source"], x) for x in repository["public headers"]]
-                new_public_headers = [x for x in new_public_headers if os.path.isdir(x) and len(x) != 0]
-                if repo_id not in public_header_folders and len(new_public_headers) != 0:
-                    public_header_folders[repo_id] = []
-
-                if repo_id in public_header_folders:
-                    public_header_folders[repo_id] += list(set(new_public_headers))
+            if len(metadata["public header folders"]) != 0:
+                public_header_folders[repo_id] = metadata["public header folders"]
 
             # Fetch all objects to link
-            will_link = not __RepoHasNoCode(repository)
-            will_link = will_link and not __RepoHasFlagSet(repository, "no auto build")
-            will_link = will_link and not __RepoHasFlagSet(repository, "independent project")
+            will_link = metadata["has code"]
+            will_link = will_link and not __RepoHasFlagSet(metadata, "no auto build")
+            will_link = will_link and not __RepoHasFlagSet(metadata, "independent project")
             # TODO: execs only should be infered by the build environment not having ".c"s to compile
             # however it is planned for an overhaul of the build system (abstract away from cmake only)
             # which would enable this change
-            will_link = will_link and not __RepoHasFlagSet(repository, "execs only")
+            will_link = will_link and not __RepoHasFlagSet(metadata, "execs only")
             if will_link:
                 objects_to_link[repo_id] = repository["name"]+'_lib'
 
@@ -613,18 +1342,28 @@ def __FetchAllPublicHeaders(repositories):
             logging.error(str(ex))
     return objects_to_link, public_header_folders
 
-def __SetupCMake(repositories):
+"""
+Generate the CMakeLists of each repository and of the project
+If repo_ids is set, only the CMakeLists of those repositories are generated,
+ the others are kept as they were
+"""
+def __SetupCMake(repositories, repo_ids=None):
     PrintDebug("Setting up CMake")
     global a
     repos_to_build = []
 
-    objects_to_link, public_header_folders = __FetchAllPublicHeaders(repositories)
+    build_metadata = GetBuildMetadata(repositories)
+    objects_to_link, public_header_folders = __FetchAllPublicHeaders(repositories, build_metadata)
+    closures = __GetDependencyClosures(repositories)
+    # Latest loaded repositories (deepest dependencies) first
+    build_order = list(repositories.keys())
+    build_order.reverse()
 
     # Build CMake for each repository
     for repo_id in repositories.keys():
         repository = repositories[repo_id]
 
-        if __RepoHasFlagSet(repository, "no auto build") or __RepoHasNoCode(repository):
+        if __RepoHasFlagSet(repository, "no auto build") or not build_metadata[repo_id]["has code"]:
             PrintDebug(f"Skipping CMake setup for {repo_id}")
             continue
 
@@ -635,65 +1374,29 @@ def __SetupCMake(repositories):
             IncludeEntry = 'include("' + JoinPaths(repository["build path"], "CMakeLists.txt") + '")'
 
         repo_cmake_lists = JoinPaths(repository["build path"], "CMakeLists.txt")
+        if repo_ids is not None and repo_id not in repo_ids:
+            if os.path.isfile(repo_cmake_lists):
+                repos_to_build.append(IncludeEntry)
+            continue
         CreateParentDirectory(repo_cmake_lists)
 
-        # Only import headers that are direct and/or indirect dependencies
-        # Only link objects that are direct dependencies
-        def GetDependencyData(repositories, starting_repo_id):
-            dependencies = list(repositories.keys())
-            dependencies.reverse()
-            return dependencies
-            # dependencies = [starting_repo_id]
-            # starting_dependency_amount = len(dependencies)
-            # current_dependency_amount = 0
-            # first_iteration = 1
-            # # direct_dependencies = []
-            # # While the amount of dependencies changed
-            # while starting_dependency_amount != current_dependency_amount:
-            #     starting_dependency_amount = len(dependencies)
-            #     # For all of the current dependencies
-            #     for dependency in dependencies:
-            #         # Find a dependency that hasn't yet been added
-            #         for repo_id in repositories:
-            #             # Already exists
-            #             if repo_id in dependencies:
-            #                 continue
-            #             # Does not exist. Is it a dependency?
-            #             if DependencyOf(repositories[dependency], repositories[repo_id]):
-            #                 dependencies.append(repo_id)
-
-            #     if first_iteration == 1:
-            #         # direct_dependencies = dependencies.copy()
-            #         first_iteration = 2
-            #     current_dependency_amount = len(dependencies)
-            #     break
-            # # return direct_dependencies, dependencies
-            # # Return the latest dependencies first
-            # dependencies.reverse()
-            # return dependencies
-
-        # Unfortunately, linking only direct dependencies does not work due to transitive dependency failure
-        # direct_dependencies, dependencies = GetDependencyData(repositories, repo_id)
-        dependencies = GetDependencyData(repositories, repo_id)
+        # Headers and objects of the repository's transitive dependencies (and its own)
+        # Linking only direct dependencies does not work due to transitive dependency failure
+        dependencies = [dep_repo_id for dep_repo_id in build_order if dep_repo_id in closures[repo_id]]
         # Only import from dependencies
         public_headers       = []
         test_headers         = []
         private_headers      = []
         temp_objects_to_link = []
-        # For indirect dependencies, also include headers (due to headers including headers)
+        # Indirect dependencies' headers are also included (due to headers including headers)
         for dep_repo_id in dependencies:
             if dep_repo_id in public_header_folders:
                 public_headers += public_header_folders[dep_repo_id]
 
-        # For direct dependencies, only perform linking
-        # for dep_repo_id in direct_dependencies:
         for dep_repo_id in dependencies:
             if repo_id == dep_repo_id:
                 continue
             if dep_repo_id in objects_to_link:
-                dep = repositories[dep_repo_id]
-                if __RepoHasFlagSet(dep, "no auto build") or __RepoHasNoCode(dep):
-                    continue
                 temp_objects_to_link.append(objects_to_link[dep_repo_id])
 
         if len(repository["public headers"]) > 0:
@@ -705,19 +1408,6 @@ def __SetupCMake(repositories):
         if len(repository["test headers"]) > 0:
             test_headers += [JoinPaths(repository["repo source"], x) for x in repository["test headers"]]
 
-        # Check if there is already a CMakeLists and it isn't ours
-        if os.path.isfile(repo_cmake_lists):
-            can_delete = False
-            with open(repo_cmake_lists) as f:
-                content = f.readlines()
-
-            if len(content) > 0 and "# PROJECTBASE" in content[0]:
-                can_delete = True
-
-            if can_delete:
-                os.unlink(repo_cmake_lists)
-
-
         # if not os.path.isfile(repo_cmake_lists):
         # logging.error(f"{repository["name"]} {repository["current repo path"]} repo_cmake_lists {repo_cmake_lists}")
         repo_vars  = {
@@ -748,24 +1438,63 @@ def Setup(repositories):
     # Get CMakeLists ready
     __SetupCMake(repositories)
 
-    # Run setup scripts
-    for repo_id in repositories:
-        repository = repositories[repo_id]
-        PrintDebug(f"Setting up repo {repository['name']}")
-        __RunRepoCommands("setup", repository["setup"])
+    # Run setup scripts (only the ones whose inputs changed)
+    __RunRepositoriesCommands(repositories, "setup", stamped=True)
 
-def Build(repositories, build_command):
-    for repo_id in repositories:
-        repository = repositories[repo_id]
-        __RunRepoCommands(f"before build ({repository['name']})", repository["before build"])
+"""
+Regenerate the build files affected by reloading some repositories (see
+ ReloadRepositories). Nothing is generated if the project was never set up
+"""
+def SetupReloadedRepositories(repositories, repo_ids):
+    if len(repo_ids) == 0 or not os.path.isfile(JoinPaths(Settings["paths"]["build env"], "CMakeLists.txt")):
+        return
+
+    # Removed repositories, or repositories with Kconfigs, change the project's Kconfig
+    for repo_id in repo_ids:
+        if repo_id not in repositories or os.path.isfile(JoinPaths(repositories[repo_id]["current repo path"], "configs", "Kconfig")):
+            __SetupKConfig(repositories)
+            break
+
+    __SetupCMake(repositories, repo_ids)
+
+"""
+What the configure step of a build depends on: the command itself and the
+ generated build files (which are only written when their contents change)
+"""
+def __GetConfigureStamp(configure_command):
+    build_files = {}
+    for root, dirs, files in os.walk(Settings["paths"]["build env"]):
+        for name in files:
+            if name == "CMakeLists.txt" or name.endswith(".cmake"):
+                path = JoinPaths(root, name)
+                stat = os.stat(path)
+                build_files[path] = [stat.st_mtime_ns, stat.st_size]
+    return {"command": configure_command, "build files": build_files}
+
+def __GetConfigureStampPath():
+    return JoinPaths(Settings["paths"]["build cache"], "pb_configure_stamp")
+
+"""
+Build the project, running the configure step first only if the build files
+ or the configure command changed since the last successful build
+"""
+def Build(repositories, build_command, configure_command=None):
+    __RunRepositoriesCommands(repositories, "before build")
+
+    configure_stamp = None
+    if configure_command is not None:
+        configure_stamp = __GetConfigureStamp(configure_command)
+        configured = os.path.isfile(JoinPaths(Settings["paths"]["build cache"], "CMakeCache.txt"))
+        if configured and load_json_file(__GetConfigureStampPath(), {}) == configure_stamp:
+            PrintDebug("Build files did not change, skipping configure")
+        else:
+            build_command = f"{configure_command} && {build_command}"
 
     PrintDebug(f"Building project with {build_command}")
     returned = LaunchVerboseProcess(build_command)
     if(returned["code"] != 0):
         Settings.return_code = 1
+    elif configure_stamp is not None:
+        dump_json_file(configure_stamp, __GetConfigureStampPath())
 
-    for repo_id in repositories:
-        repository = repositories[repo_id]
-        __RunRepoCommands(f"after build ({repository['name']})", repository["after build"])
-
-
+    __RunRepositoriesCommands(repositories, "after build")
@@ -1,8 +1,12 @@
 import os
 import logging
+from hashlib import sha1
+from threading import Lock
+
 from data.settings import Settings
-from data.json import load_json_file
+from data.json import load_json_file, dump_json_file
 from data.common import GetValueOrDefault, IsEmpty
+from processes.filesystem import CreateParentDirectory
 
 """
 Merge overlay and original configs
@@ -21,13 +25,16 @@ def MergeConfigs(original, overlay):
 If the folder described by `name` is not present in configs, create list of the
 defaults provided that exist in the system
 """
-def __FindRepoFolders(current_repo_path, configs, name, default_folders):
+def __FindRepoFolders(current_repo_path, configs, name, default_folders, existing_folders=None):
     # Only search if value isn't already set
     configs[name] = []
     if name not in configs.keys() or IsEmpty(configs[name]):
         # Use default "headers" value, or first matching directory
         for default_folder in default_folders:
-            if os.path.isdir(current_repo_path + "/" + default_folder):
+            if existing_folders is not None:
+                if default_folder.strip("/") in existing_folders:
+                    configs[name].append(default_folder)
+            elif os.path.isdir(current_repo_path + "/" + default_folder):
                 configs[name].append(default_folder)
     elif type(configs[name]) == type(""):
         # If present as string, change to list
@@ -108,90 +115,170 @@ def TEMP_fix_configs(configs):
 
     return gen_config
 
-def __GetConfigsFolderState(folder_path):
-    current_state = {}
+CONFIGS_FILE = "configs.json"
 
-    if not os.path.exists(folder_path):
+def __ScanConfigsFolder(folder_path, relative_path, current_state):
+    with os.scandir(folder_path) as entries:
+        for entry in entries:
+            entry_path = os.path.join(relative_path, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                __ScanConfigsFolder(entry.path, entry_path, current_state)
+            else:
+                stat = entry.stat()
+                current_state[entry_path] = [stat.st_mtime_ns, stat.st_size, stat.st_ino]
+
+def __HashConfigsFile(folder_path):
+    try:
+        with open(os.path.join(folder_path, CONFIGS_FILE), "rb") as file:
+            return sha1(file.read()).hexdigest()
+    except OSError:
         return None
 
-    for root, _, files in os.walk(folder_path):
-        for name in files:
-            file_path = os.path.join(root, name)
-            current_state[file_path] = os.path.getmtime(file_path)
+"""
+Stat (modification time, size and inode) of every file in the configs folder,
+ and the hash of configs.json, which tells apart a rewrite with the same contents
+"""
+def __GetConfigsFolderState(folder_path, hash_configs=True):
+    files = {}
+    try:
+        __ScanConfigsFolder(folder_path, "", files)
+    except OSError:
+        return None
 
-    # Save the folder's own modified time
-    current_state[folder_path] = os.path.getmtime(folder_path)
-    return current_state
+    configs_hash = None
+    if hash_configs and CONFIGS_FILE in files:
+        configs_hash = __HashConfigsFile(folder_path)
+    return {"files": files, "configs hash": configs_hash}
 
-global_configs_state = {}
+# Indexed by configs path, persisted so a new process does not scan every repository again
+global_configs_state = None
+global_configs_state_lock = Lock()
 
-def UpdateState(folder_path, current_state=None):
+def __GetConfigsStatePath():
+    # Standalone processes (i.e. tests) have no project to persist the state in
+    if "cache file" not in Settings:
+        return None
+    return Settings["cache file"] + "_configs_state"
+
+# Must be called with global_configs_state_lock held
+def __GetConfigsState():
     global global_configs_state
+    if global_configs_state is None:
+        state_path = __GetConfigsStatePath()
+        global_configs_state = {} if state_path is None else load_json_file(state_path, {})
+    return global_configs_state
 
+def UpdateState(folder_path, current_state=None):
     if current_state is None:
         current_state = __GetConfigsFolderState(folder_path)
 
-    global_configs_state[folder_path] = current_state
+    with global_configs_state_lock:
+        __GetConfigsState()[folder_path] = current_state
+
+"""
+Persist the configs state of all known repositories
+"""
+def SaveConfigsState():
+    state_path = __GetConfigsStatePath()
+    if state_path is None:
+        return
+    with global_configs_state_lock:
+        CreateParentDirectory(state_path)
+        dump_json_file(__GetConfigsState(), state_path)
 
 """
 Check if configs changed
 """
 def ConfigsChanged(folder_path):
-    global global_configs_state
+    with global_configs_state_lock:
+        previous_state = __GetConfigsState().get(folder_path)
 
     # Configs dont exist
     if not os.path.isdir(folder_path):
         # Did they exist before?
-        if folder_path in global_configs_state.keys() and global_configs_state[folder_path] is not None:
+        if previous_state is not None:
             # Delete and return confirmation of change
-            return f"was removed (used to be at {global_configs_state[folder_path]})"
+            return f"was removed (used to be at {folder_path})"
         return None
 
-    current_state = __GetConfigsFolderState(folder_path)
-
     # Configs exist, are they already loaded?
-    if folder_path not in global_configs_state.keys() or global_configs_state[folder_path] is None:
+    if previous_state is None:
         return "was not loaded"
 
-    # Configs existed, load current and previous state
-    previous_state = global_configs_state[folder_path]
+    # Only hash configs.json if its stat changed
+    current_state = __GetConfigsFolderState(folder_path, hash_configs=False)
+    if current_state is None:
+        return "could not be read"
+
+    current_files  = current_state["files"]
+    previous_files = previous_state["files"]
 
-    current_state_paths  = current_state.keys()
-    previous_state_paths = previous_state.keys()
+    if current_files.keys() != previous_files.keys():
+        return "different paths"
 
-    # Different amounts of timestamps
-    if len(current_state_paths) != len(previous_state_paths):
-        return "different amount of contents"
+    changed_files = [path for path in current_files if current_files[path] != previous_files[path]]
+    if len(changed_files) == 0:
+        return None
 
-    for path in current_state_paths:
-        # Check if all paths exist in both lists
-        if path not in previous_state_paths:
-            return "different paths"
+    if changed_files != [CONFIGS_FILE]:
+        return "different timestamps"
 
-        current_timestamp  = current_state[path]
-        previous_timestamp = previous_state[path]
-        # Validate last modification time
-        if current_timestamp != previous_timestamp:
-            return "different timestamps"
+    # configs.json was rewritten (i.e. by a checkout), but may have the same contents
+    current_state["configs hash"] = __HashConfigsFile(folder_path)
+    if current_state["configs hash"] is None or current_state["configs hash"] != previous_state["configs hash"]:
+        return "different contents"
 
+    UpdateState(folder_path, current_state)
     return None
 
 def ResetConfigsState():
     global global_configs_state
-    del global_configs_state
-    global_configs_state = {}
+    with global_configs_state_lock:
+        global_configs_state = {}
+    state_path = __GetConfigsStatePath()
+    if state_path is not None and os.path.isfile(state_path):
+        os.remove(state_path)
+
+BASIC_HEADERS = ["headers", "inc", "include"]
+
+# Where each kind of headers is searched for when configs don't set it:
+#  (static paths, paths each of BASIC_HEADERS is searched in)
+DEFAULT_HEADER_FOLDERS = {
+    "public headers":  ([], ["code/", ""]),
+    "private headers": (["code/", "code/source"], ["execs/"]),
+    "test headers":    (["tests/", "tests/source"], ["tests/", "execs/tests/"]),
+}
+
+def __GetDefaultHeaderFolders(key):
+    static_paths, dynamic_paths = DEFAULT_HEADER_FOLDERS[key]
+    paths = list(static_paths)
+    for header in BASIC_HEADERS:
+        for path in dynamic_paths:
+            paths.append(path + header)
+    return paths
 
 """
-Load configurations from a repository at `repo_path`
+Every folder LoadConfigs may look for in a repository
 """
-def LoadConfigs(current_repo_path):
-    global global_configs_state
+def GetDefaultRepoFolders():
+    folders = set()
+    for key in DEFAULT_HEADER_FOLDERS:
+        for folder in __GetDefaultHeaderFolders(key):
+            folders.add(folder.strip("/"))
+    return sorted(folders)
 
+"""
+Load configurations from a repository at `repo_path`
+Without a worktree (i.e. read from a bare git), `stored_configs` are the contents
+ of configs.json (None if there is none) and `existing_folders` which of
+ GetDefaultRepoFolders exist
+"""
+def LoadConfigs(current_repo_path, stored_configs=None, existing_folders=None):
     configs_path = current_repo_path + "/configs"
 
-    if os.path.isdir(configs_path):
-        # if current_repo_path not in current_state.keys():
-        global_configs_state[current_repo_path] = __GetConfigsFolderState(current_repo_path)
+    if existing_folders is not None:
+        configs = {} if stored_configs is None else stored_configs
+    elif os.path.isdir(configs_path):
         configs = load_json_file(configs_path + "/configs.json", {})
     else:
         configs = {}
@@ -202,25 +289,15 @@ def LoadConfigs(current_repo_path):
     # TODO: Remove this after all repos have _ replaced with spaces
     configs = TEMP_fix_configs(configs)
 
-    basic_headers = ["headers", "inc", "include"]
-
-    def __CheckHeaders(key, configs, static_paths, dynamic_paths):
+    def __CheckHeaders(key, configs):
         paths = GetValueOrDefault(configs, key, [])
         if len(paths) == 0:
-            for path in static_paths:
-                paths.append(path)
-
-            for header in basic_headers:
-                for path in dynamic_paths:
-                    paths.append(path + header)
-
-            __FindRepoFolders(current_repo_path, configs, key, paths)
+            __FindRepoFolders(current_repo_path, configs, key, __GetDefaultHeaderFolders(key), existing_folders)
         else:
             configs[key] = paths
 
-    __CheckHeaders("public headers",  configs, [], ["code/", ""])
-    __CheckHeaders("private headers", configs, ["code/", "code/source"], ["execs/"])
-    __CheckHeaders("test headers", configs, ["tests/", "tests/source"], ["tests/", "execs/tests/"])
+    for key in DEFAULT_HEADER_FOLDERS:
+        __CheckHeaders(key, configs)
 
     configs["API"] = GetValueOrDefault(configs, "API", {})
     configs["local path"] = GetValueOrDefault(configs, "local path", Settings["paths"]["default local path"])
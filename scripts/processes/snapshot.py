@@ -0,0 +1,121 @@
+import os
+import logging
+from hashlib import sha1
+
+from data.settings import Settings
+from data.json import load_json_file, dump_json_file_atomic
+from data.paths import JoinPaths
+from processes.git_operations import GitGetHeadCommit
+
+"""
+A project snapshot lets Fast mode start from the last load instead of loading
+ every repository again
+It is a small header (this file) describing what the repositories cache (the
+ body) was loaded from:
+ - schema version: snapshots of other versions are ignored
+ - root: root configs of the load (what the command line asked for)
+ - cache stamp: stat of the repositories cache the header was written with
+ - repositories: configs.json hash and worktree HEAD of each repository
+Only the header is read to validate it, the repositories cache is only loaded
+ once the header matches
+"""
+SNAPSHOT_SCHEMA_VERSION = 1
+
+# What identifies the root of a load
+ROOT_KEYS = ["url", "commitish", "bare path", "repo ID"]
+
+def GetSnapshotPath():
+    return Settings["cache file"] + "_snapshot"
+
+def __HashFile(path):
+    try:
+        with open(path, "rb") as file:
+            return sha1(file.read()).hexdigest()
+    except OSError:
+        return None
+
+def __GetCacheStamp(cache_path):
+    try:
+        stat = os.stat(cache_path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+def __GetHead(path):
+    try:
+        return GitGetHeadCommit(path)
+    except Exception as ex:
+        logging.debug(f"Could not read HEAD of {path}: {ex}")
+        return None
+
+def GetRepositoryState(repository):
+    return {
+        "configs hash": __HashFile(JoinPaths(repository["configs path"], "configs.json")),
+        "head": __GetHead(repository["repo source"]),
+    }
+
+def GetRepositoriesState(repositories):
+    return {repo_id: GetRepositoryState(repository) for repo_id, repository in repositories.items()}
+
+def BuildSnapshot(root_data, repositories_state, cache_path):
+    return {
+        "schema version": SNAPSHOT_SCHEMA_VERSION,
+        "root": {key: root_data.get(key) for key in ROOT_KEYS},
+        "cache stamp": __GetCacheStamp(cache_path),
+        "repositories": repositories_state,
+    }
+
+"""
+Load the snapshot header, if it is valid for the given root configs and cache
+Returns None otherwise
+"""
+def LoadSnapshot(root_configs, cache_path):
+    snapshot = load_json_file(GetSnapshotPath(), {})
+    if snapshot.get("schema version") != SNAPSHOT_SCHEMA_VERSION:
+        if len(snapshot) != 0:
+            logging.info(f"Ignoring snapshot with schema version {snapshot.get("schema version")}")
+        return None
+
+    root = snapshot.get("root")
+    if type(root) != type({}) or type(snapshot.get("repositories")) != type({}):
+        return None
+
+    # Loaded for a different url/commit/branch
+    for key in root_configs:
+        if root.get(key) != root_configs[key]:
+            logging.info(f"Ignoring snapshot, it was loaded with a different {key}")
+            return None
+
+    # The repositories cache was written by something else (i.e. a Safe mode load)
+    if snapshot.get("cache stamp") is None or snapshot["cache stamp"] != __GetCacheStamp(cache_path):
+        logging.info("Ignoring snapshot, the repositories cache changed")
+        return None
+
+    return snapshot
+
+"""
+IDs of the repositories whose configs or checked out commit changed since the snapshot
+"""
+def GetChangedRepositories(snapshot, repositories_state):
+    changed_repo_ids = []
+    for repo_id, state in repositories_state.items():
+        if snapshot["repositories"].get(repo_id) != state:
+            changed_repo_ids.append(repo_id)
+    return changed_repo_ids
+
+"""
+Write the snapshot, unless it is the same as the one on disk
+Returns the snapshot that is now on disk
+"""
+def SaveSnapshot(snapshot, previous_snapshot=None):
+    if previous_snapshot is not None and snapshot == previous_snapshot:
+        return previous_snapshot
+
+    dump_json_file_atomic(snapshot, GetSnapshotPath())
+    logging.info("Saved project snapshot")
+    return snapshot
+
+def RemoveSnapshot():
+    snapshot_path = GetSnapshotPath()
+    if os.path.isfile(snapshot_path):
+        os.remove(snapshot_path)
@@ -2,21 +2,21 @@ import os
 
 from data.settings     import Settings, SetBranch
 from data.colors       import ColorFormat, Colors
-from data.common import RemoveEmpty, CLICenterString, RemoveSequentialDuplicates, AssembleTable, YES_NO_PROMPT, UserYesNoChoice
-from data.git import GetRepoNameFromURL, IsValidGitBranch
+from data.common import IsEmpty, RemoveEmpty, CLICenterString, RemoveSequentialDuplicates, AssembleTable, YES_NO_PROMPT, UserYesNoChoice
+from data.git import GetRepoNameFromURL, IsValidGitBranch, RepoStatus
 from processes.project import Project, GetRelevantPath
 from processes.process import OpenBashOnDirectoryAndWait, RunOnFolders, LaunchPager
 from processes.git_operations import *
 from menus.menu import GetNextInput
 from processes.git_operations import *
-from processes.repository import __RepoHasFlagSet, GetRepoIdFromPath, __RepoHasSomeFlagSet
+from processes.repository import __RepoHasFlagSet, GetRepoIdFromPath, SaveRepoIdCache, __RepoHasSomeFlagSet
 from data.print import *
 
 from dataclasses import dataclass
 
 @dataclass
 class ProjectStatusInfo:
-    repo_status: list[str]
+    repo_status: dict[str, RepoStatus]
     dirty: list[str]
     dirty_id: list[str]
     desynced: list[str]
@@ -24,6 +24,18 @@ class ProjectStatusInfo:
     ahead_id: list[str]
     messages: list[str]
 
+"""
+Everything the project status needs to know about one repository, gathered
+ by the worker that got its status
+"""
+@dataclass
+class RepoStatusRecord:
+    path: str
+    url: str
+    repo_id: str
+    name: str
+    status: RepoStatus
+
 """
 Create a list of all unique branches from the provided per repository branches
 Effectively invert the dictionary. Instead of being branches per repo, make them repos per branch
@@ -44,6 +56,9 @@ def OrganizeBranches(repo_branches):
 
         for branch_type in state.keys():
             repo_branches = state[branch_type]
+            # i.e. the status
+            if type(repo_branches) != type([]):
+                continue
             if branch_type not in branches:
                 branches[branch_type] = {}
             branches[branch_type] = AddReposToBranch(repo_branches, repo_name, branches[branch_type])
@@ -143,11 +158,11 @@ def __AbortRebaseOrMerge(outputs, operation):
             PrintInfo(f"Reverted {path}")
 
 def _RebaseOrMergeBranch(branch_name, operation):
-    # Check if all status are ok
-    statuses = RunOnAllManagedRepos(GetRepoStatus)
+    # Check if all status are ok (git itself refuses to overwrite untracked files)
+    statuses = RunOnAllManagedRepos(GetRepoStatusInfo, {"untracked": False})
     bad_stats = []
     for path, status in statuses.items():
-        if CheckIfStatusIsClean(status) is False:
+        if status is None or status.IsClean() is False:
             bad_stats.append(path)
 
     if len(bad_stats) != 0:
@@ -290,16 +305,16 @@ def DirectlyManageSingleRepository():
         repo_id   = GetRepoIdFromPath(path)
         path = RemoveSequentialDuplicates(path, "/")
 
-        status = GetRepoStatus(path)
+        status = GetRepoStatusInfo(path)
         message = "\t"
-        if CheckIfStatusIsClean(status):
+        if status is not None and status.IsClean():
             message += ColorFormat(Colors.Green, "(clean)")
         else:
             message += ColorFormat(Colors.Red, "(dirty)")
 
         message += "\t"
 
-        if CheckIfStatusIsUpToDate(status):
+        if status is not None and status.IsUpToDate():
             message += ColorFormat(Colors.Blue, "(synced)")
         else:
             message += ColorFormat(Colors.Red, "(desynced)")
@@ -321,6 +336,7 @@ def DirectlyManageSingleRepository():
         message += " ." + path.replace(Settings["paths"]["project main"], "")
         new_entry = [message, OpenBashOnDirectoryAndWait, {"working_directory":all_paths[path_ind]}]
         dynamic_entries.append(new_entry)
+    SaveRepoIdCache()
 
     return dynamic_entries
 
@@ -347,7 +363,30 @@ def RunCustomCommandOnAllRepos():
     RunOnAllRepos(_RunCmd)
     print('\n'.join(results))
 
-def __AssembleReposStatusMessage(statuses)-> ProjectStatusInfo:
+"""
+Status record of the repository at path, None if git can't tell its status
+"""
+def GetRepoStatusRecord(path):
+    status = GetRepoStatusInfo(path)
+    if status is None:
+        return None
+
+    url = GetRepositoryUrl(path)
+    if IsEmpty(url):
+        raise Exception(f"Could not retrieve Name from path \"{path}\"")
+
+    return RepoStatusRecord(
+        path=path,
+        url=url,
+        repo_id=GetRepoIdFromPath(path),
+        name=GetRepoNameFromURL(url),
+        status=status,
+    )
+
+"""
+Only uses the records, no git involved
+"""
+def __AssembleReposStatusMessage(records)-> ProjectStatusInfo:
     status_message: str = ""
     dirty: list[str] = []
     dirty_id: list[str] = []
@@ -357,27 +396,26 @@ def __AssembleReposStatusMessage(statuses)-> ProjectStatusInfo:
     ahead_id : list[str] = []
 
     repos = Project.GetRepositories()
-    for path in statuses:
-        status    = statuses[path]
-        repo_url  = GetRepositoryUrl(path)
-        repo_id   = GetRepoIdFromPath(path)
+    for path, record in records.items():
+        status    = record.status
+        repo_id   = record.repo_id
         relevant_path = ColorFormat(Colors.Grey, f"(at {GetRelevantPath(path)})")
-        repo_name : str = f"{GetRepoNameFromPath(path)} {relevant_path}"
+        repo_name : str = f"{record.name} {relevant_path}"
 
         status_message += "---"
         status_message += repo_name + " is "
 
         desynced.append(repo_name)
         desynced_id.append(repo_id)
-        if CheckIfStatusIsDiverged(status):
+        if status.IsDiverged():
             status_message += ColorFormat(Colors.Magenta, "diverged (fix manually)")
-        elif CheckIfStatusIsAhead(status):
+        elif status.IsAhead():
             ahead_id.append(repo_id)
             status_message += ColorFormat(Colors.Blue, "ahead (fix with sync push)")
-        elif CheckIfStatusIsBehind(status):
+        elif status.IsBehind():
             status_message += ColorFormat(Colors.Yellow, "behind (fix with sync pull)")
         else:
-            if CheckIfStatusIsUpToDate(status):
+            if status.IsUpToDate():
                 status_message += ColorFormat(Colors.Green, "synced")
             else:
                 status_message += ColorFormat(Colors.Red, "desynced (unknown reason)")
@@ -392,7 +430,7 @@ def __AssembleReposStatusMessage(statuses)-> ProjectStatusInfo:
             status_message += ColorFormat(Colors.Yellow, "(`no commit` flag set) ")
             ignored = True
 
-        if CheckIfStatusIsClean(status):
+        if status.IsClean():
             status_message += ColorFormat(Colors.Green, "clean")
         else:
             # Symptom of not having standardized way to identify repos
@@ -404,7 +442,7 @@ def __AssembleReposStatusMessage(statuses)-> ProjectStatusInfo:
                 if not ignored:
                     status_message += "\n" + CLICenterString(" " + ColorFormat(Colors.Red, repo_name), ColorFormat(Colors.Red, "="))
                     status_message += "\n\t" + path
-                    status_message += "\n\t" + ColorFormat(Colors.Yellow, status).replace("\n", "\n\t") + "\n\n"
+                    status_message += "\n\t" + ColorFormat(Colors.Yellow, status.Describe()).replace("\n", "\n\t") + "\n\n"
                     status_message += "\n" + CLICenterString("", ColorFormat(Colors.Red, "="))
                     dirty.append(repo_name)
                     dirty_id.append(repo_id)
@@ -413,7 +451,7 @@ def __AssembleReposStatusMessage(statuses)-> ProjectStatusInfo:
         status_message +=  "\n"
 
     return ProjectStatusInfo(
-        repo_status=statuses,
+        repo_status={path: record.status for path, record in records.items()},
         dirty=dirty,
         dirty_id=dirty_id,
         desynced=desynced,
@@ -433,7 +471,8 @@ def CheckoutBranch():
 
 
 def PrintAllBranches():
-    repo_branches = RunOnAllManagedRepos(GetAllRepoBranches)
+    # Ask the remotes themselves, so that non pushed branches are not hidden by stale remote tracking branches
+    repo_branches = RunOnAllManagedRepos(GetAllRepoBranches, {"check_remote": True})
     # There is a high likelihood that the same branches will be present on multiple repos
     # Print by branch and not by repo
     repo_branches = OrganizeBranches(repo_branches)
@@ -472,7 +511,7 @@ def PrintCheckedoutState():
         remote_branch = ColorFormat(Colors.Magenta, remote_branch)
 
         status = ""
-        if not CheckIfStatusIsClean(state["status"]):
+        if state["status"] is not None and not state["status"].IsClean():
             status = ColorFormat(Colors.Red, "DIRTY")
 
         repo_name = ColorFormat(Colors.Yellow, GetRepoNameFromURL(repo))
@@ -481,16 +520,22 @@ def PrintCheckedoutState():
 
     print(AssembleTable(rows, headers=["Status", "Repo", "Local", "Remote"]))
 
+def __GetStatusRecords(paths):
+    records = RemoveEmpty(RunOnFolders(paths, GetRepoStatusRecord))
+    for path, record in list(records.items()):
+        if isinstance(record, ProcessError):
+            PrintWarning(f"Could not get the status of {path}: {record.simple_message}")
+            del records[path]
+    return records
+
 # Returns 
 def getProjectStatusInfo():
     _, known_paths, unknown_paths = GetKnownAndUnknownGitRepos(flags_to_exclude="independent project")
 
-    # Obtain status for known and unknown repos
-    known_repo_status = RunOnFolders(known_paths, GetRepoStatus)
-    known_repo_status = RemoveEmpty(known_repo_status)
-
-    unknown_repo_status = RunOnFolders(unknown_paths, GetRepoStatus)
-    unknown_repo_status = RemoveEmpty(unknown_repo_status)
+    # Obtain the status records of known and unknown repos in parallel
+    known_repo_status = __GetStatusRecords(known_paths)
+    unknown_repo_status = __GetStatusRecords(unknown_paths)
+    SaveRepoIdCache()
 
     # Create and print status messa
     known_project_status = __AssembleReposStatusMessage(known_repo_status)
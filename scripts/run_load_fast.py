@@ -1,5 +1,9 @@
+import sys
+
 from processes.load_fast import get_project_config_from_git_api
 from processes.load_fast import get_all_project_dependencies
 if __name__ == "__main__":
-     #get_all_project_dependencies("https://gitlab.com/p4nth30n/Runtime/Data/treesitter")
-     get_all_project_dependencies("https://gitlab.com/p4nth30n/Applications/TestApp")
+     # --offline resolves the dependencies only from the configs cached by previous runs
+     offline = "--offline" in sys.argv
+     #get_all_project_dependencies("https://gitlab.com/p4nth30n/Runtime/Data/treesitter", offline=offline)
+     get_all_project_dependencies("https://gitlab.com/p4nth30n/Applications/TestApp", offline=offline)
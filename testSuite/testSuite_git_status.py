@@ -0,0 +1,131 @@
+#!/bin/python3
+
+"""
+Test ParsePorcelainStatus against hand written `git status --porcelain=v2 --branch -z`
+ output, and against the output of git itself on a scratch repository
+"""
+
+import os
+import shutil
+import tempfile
+import subprocess
+
+from data.common import Assert
+from data.git import ParsePorcelainStatus
+
+HASH_A = "a" * 40
+HASH_B = "b" * 40
+HASH_C = "c" * 40
+
+def Porcelain(records):
+    return "".join(record + "\0" for record in records)
+
+"""
+Headers of a branch with an upstream, ahead and behind
+"""
+def TestBranchHeaders():
+    status = ParsePorcelainStatus(Porcelain([
+        f"# branch.oid {HASH_A}",
+        "# branch.head feature/x",
+        "# branch.upstream origin/feature/x",
+        "# branch.ab +2 -3",
+    ]))
+    Assert(status.commit == HASH_A, f"Wrong commit {status.commit}")
+    Assert(status.branch == "feature/x", f"Wrong branch {status.branch}")
+    Assert(status.upstream == "origin/feature/x", f"Wrong upstream {status.upstream}")
+    Assert(status.ahead == 2 and status.behind == 3, f"Wrong ahead/behind {status.ahead}/{status.behind}")
+    Assert(status.IsDiverged() and not status.IsUpToDate(), f"{status} should be diverged")
+    Assert(status.IsClean(), f"{status} should be clean")
+
+    status = ParsePorcelainStatus(Porcelain([f"# branch.oid {HASH_A}", "# branch.head main", "# branch.upstream origin/main", "# branch.ab +0 -4"]))
+    Assert(status.IsBehind() and not status.IsAhead(), f"{status} should be behind")
+
+    status = ParsePorcelainStatus(Porcelain([f"# branch.oid {HASH_A}", "# branch.head main", "# branch.upstream origin/main", "# branch.ab +0 -0"]))
+    Assert(status.IsUpToDate(), f"{status} should be up to date")
+
+"""
+Detached HEAD, no commits yet and no upstream
+"""
+def TestSpecialHeaders():
+    status = ParsePorcelainStatus(Porcelain([f"# branch.oid {HASH_A}", "# branch.head (detached)"]))
+    Assert(status.branch is None, f"Detached HEAD has branch {status.branch}")
+    Assert(not status.IsUpToDate(), "Without upstream there is nothing to be up to date with")
+
+    status = ParsePorcelainStatus(Porcelain(["# branch.oid (initial)", "# branch.head main"]))
+    Assert(status.commit is None, f"No commits yet has commit {status.commit}")
+
+    status = ParsePorcelainStatus("")
+    Assert(status.IsClean() and status.branch is None, f"Empty output parsed as {status}")
+
+"""
+Ordinary changes, renames (followed by their original path), conflicts and
+ untracked files, including paths with spaces
+"""
+def TestChangeRecords():
+    status = ParsePorcelainStatus(Porcelain([
+        f"# branch.oid {HASH_A}",
+        "# branch.head main",
+        f"1 M. N... 100644 100644 100644 {HASH_A} {HASH_B} staged.c",
+        f"1 .M N... 100644 100644 100644 {HASH_A} {HASH_A} dir/not staged.c",
+        f"1 MM N... 100644 100644 100644 {HASH_A} {HASH_B} both.c",
+        f"2 R. N... 100644 100644 100644 {HASH_A} {HASH_A} R100 new name.c",
+        "old name.c",
+        f"2 RM N... 100644 100644 100644 {HASH_A} {HASH_A} R87 moved.h",
+        # Original path of moved.h, even though it looks like a record
+        "1 .M looks like a record.h",
+        f"u UU N... 100644 100644 100644 100644 {HASH_A} {HASH_B} {HASH_C} conflict ed.c",
+        "? untracked file.txt",
+        "! ignored.o",
+    ]))
+    Assert(status.staged == ["staged.c", "both.c", "new name.c", "moved.h"], f"Wrong staged {status.staged}")
+    Assert(status.unstaged == ["dir/not staged.c", "both.c", "moved.h"], f"Wrong unstaged {status.unstaged}")
+    Assert(status.conflicted == ["conflict ed.c"], f"Wrong conflicted {status.conflicted}")
+    Assert(status.untracked == ["untracked file.txt"], f"Wrong untracked {status.untracked}")
+    Assert(not status.IsClean(), f"{status} should not be clean")
+
+    status = ParsePorcelainStatus(Porcelain(["? only untracked.txt"]), untracked_checked=False)
+    Assert(not status.untracked_checked, "untracked_checked was not kept")
+
+"""
+What git itself prints for a rename, a modification and an untracked file
+"""
+def TestRealRepository(path):
+    def Git(*args):
+        return subprocess.run(["git", *args], cwd=path, check=True, capture_output=True, text=True).stdout
+
+    Git("init", "-q", "-b", "main")
+    Git("config", "user.email", "test@test")
+    Git("config", "user.name", "test")
+    for name in ["to rename.c", "to modify.c"]:
+        with open(os.path.join(path, name), "w") as file:
+            file.write(f"int {name.split(" ")[1][:-2]}_function(void) {{ return 0; }}\n")
+    Git("add", ".")
+    Git("commit", "-q", "-m", "initial")
+
+    Git("mv", "to rename.c", "renamed.c")
+    with open(os.path.join(path, "to modify.c"), "a") as file:
+        file.write("// modified\n")
+    with open(os.path.join(path, "untracked.c"), "w") as file:
+        file.write("\n")
+
+    status = ParsePorcelainStatus(Git("status", "--porcelain=v2", "--branch", "-z"))
+    Assert(status.branch == "main", f"Wrong branch {status.branch}")
+    Assert(status.commit == Git("rev-parse", "HEAD").strip(), f"Wrong commit {status.commit}")
+    Assert(status.upstream is None, f"Unexpected upstream {status.upstream}")
+    Assert(status.staged == ["renamed.c"], f"Wrong staged {status.staged}")
+    Assert(status.unstaged == ["to modify.c"], f"Wrong unstaged {status.unstaged}")
+    Assert(status.untracked == ["untracked.c"], f"Wrong untracked {status.untracked}")
+    Assert(status.conflicted == [], f"Wrong conflicted {status.conflicted}")
+
+if __name__ == "__main__":
+    TestBranchHeaders()
+    TestSpecialHeaders()
+    TestChangeRecords()
+
+    repo_path = tempfile.mkdtemp(prefix="PB_git_status_")
+    try:
+        TestRealRepository(repo_path)
+    finally:
+        shutil.rmtree(repo_path, ignore_errors=True)
+
+    print("Successfully ran 4 tests")
@@ -0,0 +1,157 @@
+#!/bin/python3
+
+"""
+Test load_fast dependency discovery against a local stand-in for the GitLab API
+that serves configs/configs.json of a few fake projects
+"""
+
+import os
+import json
+import shutil
+import tempfile
+import threading
+from hashlib import sha1
+from urllib.parse import unquote, urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from data.common import Assert
+from data.settings import Settings
+from processes.load_fast import HTTP_POOL, CONFIGS_CACHE, get_all_project_dependencies, normalize_project_path
+
+def Project(name):
+    return f"https://gitlab.com/group/{name}"
+
+# A -> B, C; B -> D; C -> D (through its ssh URL), E (as API); E -> A
+PROJECT_CONFIGS = {
+    "group/A": {"dependencies": {Project("B"): {}, Project("C"): {}}},
+    "group/B": {"dependencies": {Project("D"): {}}},
+    "group/C": {"dependencies": {"git@gitlab.com:group/D.git": {}}, "API": {Project("E"): {}}},
+    "group/D": {},
+    "group/E": {"dependencies": {Project("A"): {}}},
+}
+
+class CONFIGS_SERVER(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Projects that answer 503 once before serving their configs
+    flaky = set(["group/B"])
+    requests = []
+    not_modified = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        # /api/v4/projects/<project>/repository/files/configs%2Fconfigs.json/raw?ref=<branch>
+        parts = urlsplit(self.path).path.split("/")
+        project = unquote(parts[4])
+        file_path = unquote(parts[7])
+
+        with self.lock:
+            self.requests.append(project)
+            fail = project in self.flaky
+            self.flaky.discard(project)
+
+        if self.headers.get("PRIVATE-TOKEN") != "test-token":
+            self._Reply(401, b"{}")
+        elif fail:
+            self._Reply(503, b"{}")
+        elif project not in PROJECT_CONFIGS or file_path != "configs/configs.json":
+            self._Reply(404, b"{}")
+        else:
+            body = json.dumps(PROJECT_CONFIGS[project]).encode()
+            etag = f'"{sha1(body).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag:
+                with self.lock:
+                    CONFIGS_SERVER.not_modified += 1
+                self._Reply(304, b"", etag)
+            else:
+                self._Reply(200, body, etag)
+
+    def _Reply(self, status, body, etag=None):
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Retry-After", "0")
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def Discover(pool, cache, offline=False):
+    CONFIGS_SERVER.requests = []
+    CONFIGS_SERVER.not_modified = 0
+    results = get_all_project_dependencies(Project("A"), pool=pool, cache=cache, offline=offline)
+
+    # D is found through either of its URLs, whichever comes first
+    results = {normalize_project_path(path): configs for path, configs in results}
+    found = sorted(results.keys())
+    expected = sorted(PROJECT_CONFIGS.keys())
+    Assert(found == expected, f"Found {found} instead of {expected}")
+    for project in expected:
+        Assert(results[project] == PROJECT_CONFIGS[project], f"Wrong configs for {project}: {results[project]}")
+
+def TestDiscovery(single_thread, cache_path):
+    Settings["single thread"] = single_thread
+    CONFIGS_SERVER.flaky = set(["group/B"])
+    shutil.rmtree(cache_path, ignore_errors=True)
+    cache = CONFIGS_CACHE(cache_path)
+
+    pool = HTTP_POOL(per_host_limit=2, backoff=0)
+    Discover(pool, cache)
+    pool.Close()
+
+    # Every project is fetched once (plus the retry of the flaky one)
+    requests = sorted(CONFIGS_SERVER.requests)
+    Assert(requests == sorted([f"group/{name}" for name in "ABCDE"] + ["group/B"]), f"Unexpected requests {requests}")
+    Assert(pool.stats["retries"] == 1, f"Expected 1 retry, got {pool.stats}")
+    # Connections are kept alive and reused
+    Assert(pool.stats["connections"] <= 2, f"Too many connections opened: {pool.stats}")
+
+"""
+Configs fetched before are validated with their ETag instead of downloaded again
+"""
+def TestConditionalRequests(cache_path):
+    Settings["single thread"] = False
+    cache = CONFIGS_CACHE(cache_path)
+
+    pool = HTTP_POOL(backoff=0)
+    Discover(pool, cache)
+    pool.Close()
+
+    Assert(CONFIGS_SERVER.not_modified == len(PROJECT_CONFIGS), f"Expected {len(PROJECT_CONFIGS)} not modified replies, got {CONFIGS_SERVER.not_modified}")
+    Assert(cache.stats["hits"] == len(PROJECT_CONFIGS), f"Expected only cache hits, got {cache.stats}")
+
+"""
+Offline, the whole graph is resolved from the cache without any request
+"""
+def TestOffline(cache_path):
+    cache = CONFIGS_CACHE(cache_path)
+
+    Discover(HTTP_POOL(), cache, offline=True)
+    Assert(len(CONFIGS_SERVER.requests) == 0, f"Offline discovery made requests: {CONFIGS_SERVER.requests}")
+
+    empty_cache = CONFIGS_CACHE(cache_path + "_empty")
+    results = get_all_project_dependencies(Project("A"), pool=HTTP_POOL(), cache=empty_cache, offline=True)
+    Assert(results == [(Project("A"), {})], f"Offline discovery without cache found {results}")
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CONFIGS_SERVER)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ["GITLAB_TOKEN"]   = "test-token"
+    os.environ["GITLAB_API_URL"] = f"http://127.0.0.1:{server.server_address[1]}/api/v4"
+    Settings["exit"]        = True
+    Settings["action"]      = []
+    Settings["max threads"] = None
+
+    cache_path = tempfile.mkdtemp(prefix="PB_remote_configs_")
+    try:
+        TestDiscovery(False, cache_path)
+        TestDiscovery(True, cache_path)
+        TestConditionalRequests(cache_path)
+        TestOffline(cache_path)
+    finally:
+        server.shutdown()
+        shutil.rmtree(cache_path, ignore_errors=True)
+
+    print("Successfully ran 4 tests")
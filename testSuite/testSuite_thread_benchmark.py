@@ -0,0 +1,60 @@
+#!/bin/python3
+
+"""
+Micro-benchmark for PB's threading helpers: end-to-end time of running many
+ no-op tasks through RunInThreadsWithProgress and WORK_QUEUE
+Usage: testSuite_thread_benchmark.py [amount of tasks] [repetitions]
+"""
+
+import os
+import sys
+from time import time, process_time
+
+from data.settings import Settings
+from processes.process import RunInThreadsWithProgress, WORK_QUEUE
+
+def NoOp(*args):
+    pass
+
+def Measure(name, run, repetitions):
+    wall_times = []
+    cpu_times  = []
+    for _ in range(repetitions):
+        wall_start = time()
+        cpu_start  = process_time()
+        run()
+        cpu_times.append(process_time() - cpu_start)
+        wall_times.append(time() - wall_start)
+
+    wall_times.sort()
+    cpu_times.sort()
+    return f"{name:<40} best {wall_times[0]*1000:8.1f}ms  median {wall_times[len(wall_times)//2]*1000:8.1f}ms  cpu {cpu_times[len(cpu_times)//2]*1000:8.1f}ms"
+
+def Benchmark(task_count, repetitions):
+    Settings["exit"]        = True
+    Settings["action"]      = []
+    Settings["max threads"] = None
+    args = [(task,) for task in range(task_count)]
+    results = []
+
+    # Progress bars are not what is being measured
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        Settings["single thread"] = False
+        results.append(Measure(f"RunInThreadsWithProgress x{task_count}", lambda: RunInThreadsWithProgress(NoOp, args), repetitions))
+        results.append(Measure(f"WORK_QUEUE x{task_count}", lambda: WORK_QUEUE(NoOp).Run(args), repetitions))
+
+        Settings["single thread"] = True
+        results.append(Measure(f"RunInThreadsWithProgress (single) x{task_count}", lambda: RunInThreadsWithProgress(NoOp, args), repetitions))
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    for result in results:
+        print(result)
+
+if __name__ == "__main__":
+    task_count  = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    Benchmark(task_count, repetitions)